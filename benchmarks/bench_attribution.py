@@ -0,0 +1,83 @@
+# benchmarks/bench_attribution.py
+"""
+测量持仓归因的开销: 只解析 ChangeInNAV 与同时收集 OpenPositions/Trades/MTM 列的解析耗时，
+列存储占用的内存，以及 bincount 向量化汇总与逐行字典累加的耗时对比。
+
+用法: python benchmarks/bench_attribution.py [--positions 5000] [--trades 20000 100000] [--symbols 2000]
+"""
+import argparse
+import io
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'benchmarks'))
+
+
+def _columns_bytes(columns):
+    arrays = [value for value in vars(columns).values() if hasattr(value, 'buffer_info')]
+    return sum(a.buffer_info()[1] * a.itemsize for a in arrays)
+
+
+def _dict_attribution(columns):
+    """逐行用字典累加，作为向量化汇总的对照"""
+    pnl, value = {}, {}
+    for code, total in zip(columns.mtm_symbol, columns.mtm_total):
+        symbol = columns.symbols[code]
+        pnl[symbol] = pnl.get(symbol, 0.0) + total
+    for code, position_value in zip(columns.position_symbol, columns.position_value):
+        symbol = columns.symbols[code]
+        value[symbol] = value.get(symbol, 0.0) + position_value
+    gainers = sorted(pnl.items(), key=lambda item: -item[1])[:3]
+    losers = sorted(pnl.items(), key=lambda item: item[1])[:3]
+    return gainers, losers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--positions', type=int, default=5_000)
+    parser.add_argument('--trades', type=int, nargs='+', default=[20_000, 100_000])
+    parser.add_argument('--symbols', type=int, default=2_000, help="MTMPerformanceSummaryInBase 中的标的数")
+    parser.add_argument('--repeat', type=int, default=20, help="汇总计算的重复次数")
+    args = parser.parse_args()
+
+    from flex_parser import parse_flex_statements
+    from flex_samples import write_statement
+    from position_attribution import StatementColumns
+
+    print(f"{'成交数':>8} {'大小(MB)':>9} {'仅NAV(s)':>9} {'含列(s)':>8} {'列内存(KB)':>10} "
+          f"{'bincount(ms)':>12} {'字典(ms)':>9}")
+    for trades in args.trades:
+        out = io.BytesIO()
+        write_statement(out, positions=args.positions, trades=trades, mtm_performance=args.symbols)
+        content = out.getvalue()
+
+        started = time.perf_counter()
+        parse_flex_statements(content)
+        nav_only = time.perf_counter() - started
+
+        columns = StatementColumns()
+        started = time.perf_counter()
+        parse_flex_statements(content, columns.sections())
+        with_columns = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            attribution = columns.attribution()
+            attribution.top(3)
+            attribution.concentration(3)
+        vectorized = (time.perf_counter() - started) / args.repeat
+
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            _dict_attribution(columns)
+        per_row = (time.perf_counter() - started) / args.repeat
+
+        print(f"{trades:>8} {len(content) / 1024 / 1024:>9.2f} {nav_only:>9.3f} {with_columns:>8.3f} "
+              f"{_columns_bytes(columns) / 1024:>10.1f} {vectorized * 1000:>12.2f} {per_row * 1000:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
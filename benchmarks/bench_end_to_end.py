@@ -0,0 +1,182 @@
+# benchmarks/bench_end_to_end.py
+"""
+在本地替身服务器 (stub_server.py) 上端到端运行 get_account_summary 与 send_daily_report，
+按场景输出延迟、峰值内存与吞吐。
+
+用法: python benchmarks/bench_end_to_end.py [--scenarios baseline large_statement] [--iterations 3]
+
+每个场景的替身服务器运行在本进程中，追踪器运行在独立子进程中，以便单独测量峰值 RSS。
+每次迭代使用全新的状态/缓存/NAV/发件箱目录，因此测到的都是冷启动 (无缓存) 的耗时；
+"缓存命中" 一列是同一追踪器紧接着再调用一次 get_account_summary 的耗时。
+为缩短运行时间，发件箱的重试退避基数被调低到 0.5 秒。
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'benchmarks'))
+
+SCENARIOS = {
+    'baseline': {'accounts': 1, 'chats': 2, 'stub': {}},
+    'slow_ready': {'accounts': 1, 'chats': 2, 'stub': {'ready_delay': 3.0}},
+    'throttled': {'accounts': 1, 'chats': 2, 'stub': {'throttle_attempts': 1}},
+    'large_statement': {'accounts': 1, 'chats': 2,
+                        'stub': {'positions': 20_000, 'trades': 100_000, 'cash_transactions': 20_000}},
+    'multi_account': {'accounts': 4, 'chats': 2, 'stub': {'ready_delay': 1.0, 'positions': 2_000, 'trades': 5_000}},
+    'malformed': {'accounts': 1, 'chats': 2, 'stub': {'malformed': True}},
+    'flaky_push': {'accounts': 1, 'chats': 20,
+                   'stub': {'bark_latency': 0.2, 'bark_failure_rate': 0.2, 'telegram_latency': 0.2,
+                            'telegram_failure_rate': 0.2, 'telegram_rate_limit_rate': 0.05}},
+}
+
+
+def _peak_rss_kb():
+    """进程峰值 RSS (KB)。ru_maxrss 会继承 exec 之前父进程的峰值，因此在 Linux 上优先读取 VmHWM"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _run_child(iterations, delivery_deadline):
+    """在子进程中运行追踪器，结果以一行 JSON 输出到 stdout"""
+    import logging
+    import ibkr_net_value_tracker
+    import metrics
+
+    logging.getLogger().setLevel(logging.CRITICAL)
+    result = {'summary_cold': [], 'summary_warm': [], 'report': [], 'delivery': [],
+              'delivered': 0, 'expected': 0, 'statuses': []}
+
+    for _ in range(iterations):
+        for phase in ('summary', 'report'):
+            workdir = tempfile.mkdtemp(prefix='ibkr_bench_')
+            os.environ.update(
+                TRACKER_STATE_PATH=os.path.join(workdir, 'tracker_state.json'),
+                NOTIFY_OUTBOX_PATH=os.path.join(workdir, 'notification_outbox.jsonl'),
+                NAV_DB_PATH=os.path.join(workdir, 'nav_history.sqlite3'),
+                FLEX_CACHE_DIR=os.path.join(workdir, 'flex_cache'),
+            )
+            try:
+                tracker = ibkr_net_value_tracker.IBKRTracker()
+                tracker.outbox.base_backoff = 0.5
+                started = time.perf_counter()
+                if phase == 'summary':
+                    tracker.get_account_summary()
+                    result['summary_cold'].append(time.perf_counter() - started)
+                    started = time.perf_counter()
+                    tracker.get_account_summary()
+                    result['summary_warm'].append(time.perf_counter() - started)
+                else:
+                    status = tracker.send_daily_report()['status']
+                    enqueued = time.perf_counter()
+                    result['report'].append(enqueued - started)
+                    result['statuses'].append(status)
+                    expected = tracker.outbox.pending_count()
+                    deadline = enqueued + delivery_deadline
+                    while time.perf_counter() < deadline:
+                        wait = tracker.outbox.drain_once()
+                        if wait is None:
+                            break
+                        time.sleep(min(wait, max(0.0, deadline - time.perf_counter())))
+                    result['delivery'].append(time.perf_counter() - enqueued)
+                    result['expected'] += expected
+                    result['delivered'] += expected - tracker.outbox.pending_count()
+                tracker.nav_store.close()
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    snapshot = metrics.REGISTRY.snapshot()['metrics']
+    stages = {sample['labels']['stage']: sample for sample in snapshot.get('pipeline_stage_seconds', {}).get('samples', [])}
+    result['stage_seconds'] = {stage: sample['sum'] for stage, sample in stages.items()}
+    result['peak_rss_kb'] = _peak_rss_kb()
+    print(json.dumps(result))
+
+
+def _median(values):
+    return statistics.median(values) if values else float('nan')
+
+
+def run_scenario(name, iterations, initial_delay, delivery_deadline):
+    from stub_server import StubServer
+
+    scenario = SCENARIOS[name]
+    server = StubServer(**scenario['stub']).start()
+    try:
+        accounts = ','.join(f"bench-token-{i}:{900000 + i}" for i in range(scenario['accounts']))
+        env = dict(
+            os.environ,
+            FLEX_BASE_URL=server.flex_base_url,
+            BARK_URL=server.bark_url(),
+            TELEGRAM_API_BASE=server.base_url,
+            TELEGRAM_BOT_TOKEN='123456:BENCH',
+            TELEGRAM_CHAT_IDS=','.join(str(1000 + i) for i in range(scenario['chats'])),
+            IB_FLEX_ACCOUNTS=accounts,
+            FLEX_POLL_INITIAL_DELAY=str(initial_delay),
+            FLEX_POLL_DEADLINE='120',
+            METRICS_PORT='0',
+            METRICS_DUMP_INTERVAL='0',
+        )
+        output = subprocess.run(
+            [sys.executable, __file__, '--child', str(iterations), str(delivery_deadline)],
+            check=True, capture_output=True, text=True, env=env, cwd=str(ROOT),
+        ).stdout.strip().splitlines()[-1]
+        result = json.loads(output)
+        statement_bytes = sum(len(server.statement_bytes(f"bench-token-{i}")) for i in range(scenario['accounts']))
+        result['statement_mb'] = statement_bytes / 1024 / 1024
+        result['stub_stats'] = dict(server.stats)
+        return result
+    finally:
+        server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', nargs='+', choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--iterations', type=int, default=3)
+    parser.add_argument('--initial-delay', type=float, default=0.5,
+                        help="首次 GetStatement 前的等待秒数 (FLEX_POLL_INITIAL_DELAY)")
+    parser.add_argument('--delivery-deadline', type=float, default=30.0, help="每次迭代等待通知投递完成的最长秒数")
+    parser.add_argument('--child', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _run_child(int(args.child[0]), float(args.child[1]))
+        return
+
+    print(f"{'场景':<16} {'账户':>4} {'报告(MB)':>8} {'摘要冷(s)':>9} {'缓存命中(ms)':>12} {'日报(s)':>8} "
+          f"{'投递(s)':>8} {'投递成功':>9} {'通知/s':>7} {'解析MB/s':>9} {'峰值RSS(MB)':>11} {'Send/Get':>9}")
+    for name in args.scenarios:
+        r = run_scenario(name, args.iterations, args.initial_delay, args.delivery_deadline)
+        accounts = SCENARIOS[name]['accounts']
+        delivery_seconds = sum(r['delivery'])
+        parse_seconds = r['stage_seconds'].get('download', 0) + r['stage_seconds'].get('parse', 0)
+        # 每次迭代下载并解析两轮 (summary 与 report 各一次冷启动)，另有一次缓存命中时的解析
+        parsed_mb = r['statement_mb'] * 3 * args.iterations
+        throughput_mb = parsed_mb / parse_seconds if parse_seconds else float('nan')
+        notify_rate = r['delivered'] / delivery_seconds if delivery_seconds else float('nan')
+        stats = r['stub_stats']
+        print(f"{name:<16} {accounts:>4} {r['statement_mb']:>8.2f} {_median(r['summary_cold']):>9.2f} "
+              f"{_median(r['summary_warm']) * 1000:>12.1f} {_median(r['report']):>8.2f} {_median(r['delivery']):>8.2f} "
+              f"{r['delivered']:>4}/{r['expected']:<4} {notify_rate:>7.1f} {throughput_mb:>9.1f} "
+              f"{r['peak_rss_kb'] / 1024:>11.1f} {stats.get('send_request', 0):>4}/{stats.get('get_statement', 0):<4}")
+        if set(r['statuses']) != {'notification_sent'}:
+            print(f"{'':<16} 日报状态: {', '.join(sorted(set(r['statuses'])))}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+# benchmarks/bench_flex_parse.py
+"""
+对比 ET.fromstring 整树解析与 flex_parser 流式解析的峰值内存 (RSS) 与耗时。
+
+用法: python benchmarks/bench_flex_parse.py [--rows 20000 50000 200000]
+每种解析方式都在独立子进程中运行，以便单独测量峰值 RSS。
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'benchmarks'))
+
+
+def _parse_tree(path):
+    with open(path, 'rb') as f:
+        content = f.read()
+    root = ET.fromstring(content)
+    statement = root.find('.//FlexStatements/FlexStatement')
+    return dict(statement.find('ChangeInNAV').attrib)
+
+
+def _parse_stream(path):
+    from flex_parser import parse_flex_statements
+    with open(path, 'rb') as f:
+        return parse_flex_statements(f)[0]['ChangeInNAV']
+
+
+def _run_child(mode, path):
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    nav = _parse_tree(path) if mode == 'tree' else _parse_stream(path)
+    elapsed = time.perf_counter() - started
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    assert nav is not None
+    print(f"{elapsed:.4f} {baseline} {peak}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 50_000, 200_000],
+                        help="每份报告中 Trades 的行数 (OpenPositions/CashTransactions 按比例生成)")
+    parser.add_argument('--child', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _run_child(*args.child)
+        return
+
+    from flex_samples import write_statement
+
+    print(f"{'行数':>8} {'大小(MB)':>9} {'方式':>7} {'耗时(s)':>8} {'峰值RSS(MB)':>12} {'解析增量(MB)':>12}")
+    for rows in args.rows:
+        with tempfile.NamedTemporaryFile(suffix='.xml', delete=False) as f:
+            write_statement(f, positions=rows // 10, trades=rows, cash_transactions=rows // 5)
+            path = f.name
+        try:
+            size_mb = os.path.getsize(path) / 1024 / 1024
+            for mode in ('tree', 'stream'):
+                output = subprocess.run(
+                    [sys.executable, __file__, '--child', mode, path],
+                    check=True, capture_output=True, text=True,
+                ).stdout.split()
+                elapsed, baseline, peak = float(output[0]), int(output[1]), int(output[2])
+                # Linux 下 ru_maxrss 单位为 KB
+                print(f"{rows:>8} {size_mb:>9.1f} {mode:>7} {elapsed:>8.3f} {peak / 1024:>12.1f} {(peak - baseline) / 1024:>12.1f}")
+        finally:
+            os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
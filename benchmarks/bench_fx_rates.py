@@ -0,0 +1,102 @@
+# benchmarks/bench_fx_rates.py
+"""
+测量多币种换算的开销: 从 NAV 历史库加载汇率表的耗时，以及把整段分账户 NAV 历史换算为报告货币并按日合并时，
+searchsorted 批量查询与逐行查询 (每行单独调用 FxRateTable.rate) 的耗时对比，并核对两者结果一致。
+
+用法: python benchmarks/bench_fx_rates.py [--years 10 30] [--accounts 3] [--currencies 20]
+"""
+import argparse
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+BASE_CURRENCIES = ['USD', 'HKD', 'EUR', 'GBP', 'JPY', 'SGD', 'CAD', 'AUD']
+
+
+def _populate(store, days, accounts, currencies, seed=42):
+    """写入各账户的日序列与每天的汇率 (各基础货币对 USD 报价，另外 currencies 个货币同样对 USD 报价)"""
+    rng = random.Random(seed)
+    quoted = list(dict.fromkeys(BASE_CURRENCIES[:accounts] + [f"C{i:02d}" for i in range(currencies)]))
+    level = {currency: rng.uniform(0.005, 2.0) for currency in quoted if currency != 'USD'}
+    rates = []
+    for day in days:
+        for currency in level:
+            level[currency] *= 1 + rng.gauss(0, 0.004)
+            rates.append((day, currency, 'USD', level[currency]))
+    store.record_fx_rates(rates)
+    for i in range(accounts):
+        account, value, rows = f"U{i}", 1_000_000.0, []
+        for day in days:
+            mtm = value * rng.gauss(0.0004, 0.011)
+            rows.append((day, value, value + mtm, mtm, 0.0))
+            value += mtm
+        store.upsert_many(account, rows)
+        store.set_currency(account, BASE_CURRENCIES[i % len(BASE_CURRENCIES)])
+    return len(rates)
+
+
+def _per_row(table, series, to_currency):
+    """逐行查汇率、用字典按日期累加，作为批量换算的对照"""
+    totals = {}
+    for currency, rows in series:
+        for report_date, *values in rows:
+            rate = table.rate(currency, to_currency, report_date) or 1.0
+            total = totals.setdefault(report_date, [0.0, 0.0, 0.0, 0.0])
+            for i, value in enumerate(values):
+                total[i] += value * rate
+    return [(day, *values) for day, values in sorted(totals.items())]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--years', type=int, nargs='+', default=[10, 30])
+    parser.add_argument('--accounts', type=int, default=3)
+    parser.add_argument('--currencies', type=int, default=20, help="汇率表中除账户基础货币外额外报价的货币数")
+    parser.add_argument('--report-currency', default='EUR')
+    args = parser.parse_args()
+
+    from fx_rates import FxRateTable
+    from nav_store import NavStore
+    from trading_calendar import TradingCalendar
+
+    calendar = TradingCalendar()
+    print(f"{'年数':>4} {'交易日':>6} {'汇率行数':>8} {'加载(ms)':>9} {'批量(ms)':>9} {'逐行(ms)':>9} {'加速':>6} {'一致':>4}")
+    for years in args.years:
+        days = [day.isoformat() for day in calendar.trading_days(date(2025 - years + 1, 1, 1), date(2025, 12, 31))]
+        workdir = tempfile.mkdtemp(prefix='ibkr_fx_bench_')
+        try:
+            store = NavStore(Path(workdir) / 'nav_history.sqlite3')
+            rate_rows = _populate(store, days, args.accounts, args.currencies)
+
+            started = time.perf_counter()
+            table = FxRateTable(store)
+            load = time.perf_counter() - started
+
+            series = [(store.currency(account), store.series(account)) for account in store.accounts()]
+            started = time.perf_counter()
+            batch, _ = table.consolidate(series, args.report_currency)
+            batch_seconds = time.perf_counter() - started
+
+            started = time.perf_counter()
+            expected = _per_row(table, series, args.report_currency)
+            per_row_seconds = time.perf_counter() - started
+            store.close()
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        same = len(batch) == len(expected) and all(
+            a[0] == b[0] and all(abs(x - y) <= 1e-6 * max(1.0, abs(y)) for x, y in zip(a[1:], b[1:]))
+            for a, b in zip(batch, expected))
+        print(f"{years:>4} {len(days):>6} {rate_rows:>8} {load * 1000:>9.1f} {batch_seconds * 1000:>9.1f} "
+              f"{per_row_seconds * 1000:>9.1f} {per_row_seconds / batch_seconds:>5.0f}x {'是' if same else '否':>4}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# benchmarks/bench_intraday.py
+"""
+对比盘中检查 (IBKRTracker.check_intraday) 在报告内容未变 (只计算指纹) 与内容变化 (需要解析 XML) 时的耗时。
+替身服务器每次返回的报告 whenGenerated 都不同，与真实的 IBKR 一样，"内容未变" 依赖去掉该属性后的指纹。
+
+用法: python benchmarks/bench_intraday.py [--positions 20000] [--trades 100000] [--iterations 5]
+
+替身服务器与追踪器运行在同一进程中，Flex 限流被放宽，测到的只是下载、哈希与解析本身的开销。
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'benchmarks'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--positions', type=int, default=20_000)
+    parser.add_argument('--trades', type=int, default=100_000)
+    parser.add_argument('--iterations', type=int, default=5)
+    args = parser.parse_args()
+
+    import logging
+    from stub_server import StubServer
+
+    server = StubServer(positions=args.positions, trades=args.trades).start()
+    workdir = tempfile.mkdtemp(prefix='ibkr_intraday_bench_')
+    os.environ.update(
+        FLEX_BASE_URL=server.flex_base_url,
+        IB_FLEX_TOKEN='bench-token', IB_QUERY_ID='1', IB_FLEX_ACCOUNTS='',
+        BARK_URL='', TELEGRAM_BOT_TOKEN='', TELEGRAM_CHAT_IDS='',
+        FLEX_POLL_INITIAL_DELAY='0',
+        TRACKER_STATE_PATH=os.path.join(workdir, 'tracker_state.json'),
+        NOTIFY_OUTBOX_PATH=os.path.join(workdir, 'notification_outbox.jsonl'),
+        NAV_DB_PATH=os.path.join(workdir, 'nav_history.sqlite3'),
+        FLEX_CACHE_DIR=os.path.join(workdir, 'flex_cache'),
+        INTRADAY_INTERVAL='60',
+        METRICS_PORT='0',
+        METRICS_DUMP_INTERVAL='0',
+    )
+    try:
+        import ibkr_net_value_tracker
+        from flex_client import FlexRateLimiter
+
+        logging.getLogger().setLevel(logging.CRITICAL)
+        tracker = ibkr_net_value_tracker.IBKRTracker(flex_limiter=FlexRateLimiter(per_token_per_minute=1_000_000, global_per_second=1e6))
+        statement_mb = len(server.statement_bytes('bench-token')) / 1024 / 1024
+
+        changed, unchanged = [], []
+        for _ in range(args.iterations):
+            # 清空上次的指纹，模拟报告内容发生变化
+            tracker.state['intraday'] = {}
+            started = time.perf_counter()
+            tracker.check_intraday()
+            changed.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            status = tracker.check_intraday()['status']
+            unchanged.append(time.perf_counter() - started)
+            assert status == 'unchanged', status
+        tracker.nav_store.close()
+    finally:
+        server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    changed_median, unchanged_median = statistics.median(changed), statistics.median(unchanged)
+    print(f"报告大小: {statement_mb:.2f} MB ({args.positions} 行持仓, {args.trades} 笔成交)")
+    print(f"{'内容变化 (下载+指纹+解析)':<28} {changed_median * 1000:>9.1f} ms")
+    print(f"{'内容未变 (下载+指纹)':<28} {unchanged_median * 1000:>9.1f} ms")
+    print(f"{'节省':<28} {(1 - unchanged_median / changed_median):>10.1%}")
+
+
+if __name__ == '__main__':
+    main()
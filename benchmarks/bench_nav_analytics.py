@@ -0,0 +1,73 @@
+# benchmarks/bench_nav_analytics.py
+"""
+测量 NAV 历史库批量写入与整段绩效指标 (TWR、最大回撤、波动率、夏普) 的计算耗时。
+
+用法: python benchmarks/bench_nav_analytics.py [--years 10]
+"""
+import argparse
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from nav_analytics import compute_metrics
+from nav_store import NavStore
+
+
+def synthetic_history(years, seed=7):
+    rng = random.Random(seed)
+    rows = []
+    nav = 1_000_000.0
+    day = date(2000, 1, 3)
+    while len(rows) < years * 252:
+        if day.weekday() < 5:
+            deposits = rng.choice([0.0] * 40 + [10_000.0, -5_000.0])
+            mtm = nav * rng.gauss(0.0004, 0.011)
+            rows.append((day.isoformat(), nav, nav + mtm + deposits, mtm, deposits))
+            nav += mtm + deposits
+        day += timedelta(days=1)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--years', type=int, default=10)
+    args = parser.parse_args()
+
+    rows = synthetic_history(args.years)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = NavStore(Path(tmp) / 'nav.sqlite3')
+
+        started = time.perf_counter()
+        store.upsert_many('TOTAL', rows)
+        ingest = time.perf_counter() - started
+
+        started = time.perf_counter()
+        series = store.series()
+        load = time.perf_counter() - started
+
+        started = time.perf_counter()
+        metrics = compute_metrics(series)
+        compute = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for _ in range(1000):
+            store.period(rows[100][0], rows[-100][0])
+        lookup = (time.perf_counter() - started) / 1000
+        store.close()
+
+    print(f"交易日数: {len(rows)}")
+    print(f"批量写入: {ingest * 1000:.1f} ms")
+    print(f"读取序列: {load * 1000:.1f} ms")
+    print(f"计算指标: {compute * 1000:.1f} ms")
+    print(f"区间盈亏查询: {lookup * 1e6:.1f} us/次")
+    print(f"TWR {metrics['twr']:.2%}, 最大回撤 {metrics['max_drawdown']:.2%}, "
+          f"年化波动 {metrics['volatility']:.2%}, 夏普 {metrics['sharpe']:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+# benchmarks/bench_replay.py
+"""
+生成多年按日拆分的录制报告，用 replay.py 在模拟时钟上回放，测量每秒能回放多少个交易日，
+并检查两次回放捕获的通知完全一致 (回放是确定性的)。
+
+用法: python benchmarks/bench_replay.py [--years 1 5] [--accounts 2] [--mtm-symbols 0 200]
+"""
+import argparse
+import logging
+import shutil
+import sys
+import tempfile
+from datetime import date
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'benchmarks'))
+
+
+def _write_recordings(directory, years, accounts, mtm_symbols):
+    from flex_samples import write_daily_history
+    from trading_calendar import TradingCalendar
+
+    calendar = TradingCalendar()
+    end = date(2025, 12, 31)
+    days = list(calendar.trading_days(date(end.year - years + 1, 1, 1), end))
+    for i in range(accounts):
+        with open(Path(directory) / f"U{9000000 + i}.xml", 'wb') as f:
+            write_daily_history(f, days, account_id=f"U{9000000 + i}", mtm_performance=mtm_symbols, seed=i)
+    return len(days)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--years', type=int, nargs='+', default=[1, 5])
+    parser.add_argument('--accounts', type=int, default=2)
+    parser.add_argument('--mtm-symbols', type=int, nargs='+', default=[0, 200],
+                        help="每份日报中 MTMPerformanceSummaryInBase 的标的数 (0 表示没有归因数据)")
+    args = parser.parse_args()
+
+    import replay
+
+    logging.getLogger().setLevel(logging.CRITICAL)
+    print(f"{'年数':>4} {'标的数':>6} {'交易日':>6} {'报告数':>6} {'通知数':>6} {'回放(s)':>8} {'交易日/秒':>9} {'可重复':>6}")
+    for years in args.years:
+        for mtm_symbols in args.mtm_symbols:
+            directory = tempfile.mkdtemp(prefix='ibkr_recordings_')
+            try:
+                _write_recordings(directory, years, args.accounts, mtm_symbols)
+                first, stats = replay.replay(directory)
+                shutil.rmtree(stats['workdir'], ignore_errors=True)
+                second, again = replay.replay(directory)
+                shutil.rmtree(again['workdir'], ignore_errors=True)
+            finally:
+                shutil.rmtree(directory, ignore_errors=True)
+            repeatable = '是' if not replay.compare_messages(first, second) else '否'
+            print(f"{years:>4} {mtm_symbols:>6} {stats['trading_days']:>6} {stats['statements']:>6} "
+                  f"{stats['notifications']:>6} {stats['seconds']:>8.2f} {stats['trading_days_per_second']:>9.0f} {repeatable:>6}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# benchmarks/bench_state_store.py
+"""
+对比旧的整文件重写 (json.dump indent=4，无 fsync) 与快照 + 预写日志 (JournaledState) 在状态逐渐增大时的保存与加载耗时。
+
+用法: python benchmarks/bench_state_store.py [--entries 100 1000 10000] [--saves 50]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from state_store import JournaledState
+
+
+def build_state(entries):
+    state = {'last_report_details': {'reportDate': '2025-01-02', 'endingValue': 1_000_000.0}}
+    for i in range(entries):
+        state[f"history_{i:06d}"] = {'reportDate': f"day-{i}", 'endingValue': 1_000_000.0 + i, 'mtm': i * 0.5}
+    return state
+
+
+def bench_legacy(path, state, saves):
+    started = time.perf_counter()
+    for i in range(saves):
+        state['last_report_details']['endingValue'] = i
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=4, default=str)
+    save = (time.perf_counter() - started) / saves
+    started = time.perf_counter()
+    with open(path, 'r', encoding='utf-8') as f:
+        json.load(f)
+    return save, time.perf_counter() - started
+
+
+def bench_journal(path, state, saves):
+    store = JournaledState(path, compact_every=10_000)
+    tracked = store.load()
+    tracked.update(state)
+    store.compact(tracked)
+    started = time.perf_counter()
+    for i in range(saves):
+        tracked['last_report_details'] = dict(tracked['last_report_details'], endingValue=i)
+        store.save(tracked)
+    save = (time.perf_counter() - started) / saves
+    journal_size = os.path.getsize(store.journal_path)
+    started = time.perf_counter()
+    JournaledState(path).load()
+    load = time.perf_counter() - started
+
+    started = time.perf_counter()
+    store.compact(tracked)
+    compact = time.perf_counter() - started
+    return save, load, compact, journal_size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entries', type=int, nargs='+', default=[100, 1_000, 10_000])
+    parser.add_argument('--saves', type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'条目数':>8} {'旧版保存(ms)':>12} {'旧版加载(ms)':>12} {'日志保存(ms)':>12} {'日志加载(ms)':>12} {'压缩(ms)':>9} {'日志大小(KB)':>12}")
+    for entries in args.entries:
+        with tempfile.TemporaryDirectory() as tmp:
+            legacy_save, legacy_load = bench_legacy(os.path.join(tmp, 'legacy.json'), build_state(entries), args.saves)
+            journal_path = os.path.join(tmp, 'state.json')
+            journal_save, journal_load, compact, journal_size = bench_journal(journal_path, build_state(entries), args.saves)
+        print(f"{entries:>8} {legacy_save * 1000:>12.2f} {legacy_load * 1000:>12.2f} {journal_save * 1000:>12.2f} "
+              f"{journal_load * 1000:>12.2f} {compact * 1000:>9.2f} {journal_size / 1024:>12.1f}")
+    print(f"注: 日志保存每次都 fsync，旧版保存不 fsync；日志加载包含重放 {args.saves} 条未压缩的日志。")
+
+
+if __name__ == '__main__':
+    main()
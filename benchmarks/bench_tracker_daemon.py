@@ -0,0 +1,112 @@
+# benchmarks/bench_tracker_daemon.py
+"""
+在本地替身服务器上用多租户守护进程 (tracker_daemon.py) 运行 N 个租户，测量每个租户的常驻内存
+以及所有租户完成首轮获取与推送所需的时间。
+
+用法: python benchmarks/bench_tracker_daemon.py [--tenants 200 1000] [--workers 32] [--global-rate 50]
+每种租户数在独立子进程中运行。
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'benchmarks'))
+
+
+def _rss_kb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+def _run_child(tenant_count, workers, global_rate, base_url, deadline):
+    import logging
+    import tracker_daemon
+    from flex_client import FlexRateLimiter
+
+    logging.getLogger().setLevel(logging.CRITICAL)
+    specs = [{
+        'name': f"tenant{i:05d}",
+        'IB_FLEX_TOKEN': f"bench-token-{i}",
+        'IB_QUERY_ID': str(900000 + i),
+        'BARK_URL': f"{base_url}/bark/T{i}",
+        'TELEGRAM_BOT_TOKEN': '123456:BENCH',
+        'TELEGRAM_CHAT_IDS': str(100000 + i),
+        'FLEX_POLL_INITIAL_DELAY': '0.2',
+        'FLEX_BASE_URL': f"{base_url}/AccountManagement/FlexWebService",
+    } for i in range(tenant_count)]
+
+    with tempfile.TemporaryDirectory(prefix='ibkr_daemon_bench_') as data_dir:
+        baseline = _rss_kb()
+        started = time.perf_counter()
+        daemon = tracker_daemon.TrackerDaemon(
+            specs, data_dir, workers=workers,
+            flex_limiter=FlexRateLimiter(per_token_per_minute=10, global_per_second=global_rate))
+        build_seconds = time.perf_counter() - started
+        built = _rss_kb()
+
+        threading.Thread(target=daemon.run_forever, daemon=True).start()
+        started = time.perf_counter()
+        while time.perf_counter() - started < deadline:
+            done = sum(1 for t in daemon.tenants
+                       if t.tracker.state.get('last_report_details') and not t.tracker.outbox.pending_count())
+            if done == len(daemon.tenants):
+                break
+            time.sleep(0.2)
+        cycle_seconds = time.perf_counter() - started
+        print(json.dumps({
+            'build_seconds': build_seconds,
+            'idle_kb_per_tenant': (built - baseline) / tenant_count,
+            'cycle_seconds': cycle_seconds,
+            'done': done,
+            'after_cycle_kb_per_tenant': (_rss_kb() - baseline) / tenant_count,
+            'threads': threading.active_count(),
+        }))
+        os._exit(0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tenants', type=int, nargs='+', default=[200, 1000])
+    parser.add_argument('--workers', type=int, default=32)
+    parser.add_argument('--global-rate', type=float, default=50.0, help="Flex 全局限流 (次/秒)")
+    parser.add_argument('--deadline', type=float, default=600.0)
+    parser.add_argument('--child', nargs=5, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        count, workers, rate, base_url, deadline = args.child
+        _run_child(int(count), int(workers), float(rate), base_url, float(deadline))
+        return
+
+    from stub_server import StubServer
+
+    print(f"{'租户数':>6} {'构建(s)':>8} {'空闲KB/租户':>11} {'首轮(s)':>8} {'完成':>11} {'首轮后KB/租户':>13} {'线程数':>6}")
+    for count in args.tenants:
+        server = StubServer().start()
+        try:
+            env = dict(os.environ, TELEGRAM_API_BASE=server.base_url, METRICS_PORT='0', METRICS_DUMP_INTERVAL='0')
+            output = subprocess.run(
+                [sys.executable, __file__, '--child', str(count), str(args.workers), str(args.global_rate),
+                 server.base_url, str(args.deadline)],
+                check=True, capture_output=True, text=True, env=env, cwd=str(ROOT),
+            ).stdout.strip().splitlines()[-1]
+        finally:
+            server.stop()
+        r = json.loads(output)
+        print(f"{count:>6} {r['build_seconds']:>8.2f} {r['idle_kb_per_tenant']:>11.1f} {r['cycle_seconds']:>8.1f} "
+              f"{r['done']:>5}/{count:<5} {r['after_cycle_kb_per_tenant']:>13.1f} {r['threads']:>6}")
+
+
+if __name__ == '__main__':
+    main()
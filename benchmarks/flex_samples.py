@@ -0,0 +1,134 @@
+# benchmarks/flex_samples.py
+"""生成结构接近真实 IBKR Flex 报告的样例 XML，供基准测试使用"""
+import random
+import re
+from datetime import datetime
+
+SYMBOLS = [f"SYM{i:04d}" for i in range(2000)]
+WHEN_GENERATED = re.compile(rb'whenGenerated="[^"]*"')
+
+
+def _attrs(values):
+    return ' '.join(f'{key}="{value}"' for key, value in values.items())
+
+
+def _when_generated(moment=None):
+    """IBKR 的报告生成时间格式 YYYYMMDD;HHMMSS，默认为当前时间 (与真实报告一样，每次生成都不同)"""
+    return (moment or datetime.now()).strftime('%Y%m%d;%H%M%S')
+
+
+def restamp_when_generated(content, moment=None):
+    """把报告中所有 FlexStatement 的 whenGenerated 改为 moment，模拟 IBKR 对同样的数据重新生成一次报告"""
+    return WHEN_GENERATED.sub(f'whenGenerated="{_when_generated(moment)}"'.encode('utf-8'), content)
+
+
+def _write_conversion_rates(w, report_date, currency, rates):
+    """rates 为 {fromCurrency: rate}，rate 为 1 单位 fromCurrency 折合的基础货币 currency"""
+    w('<ConversionRates>\n')
+    for from_currency, rate in sorted(rates.items()):
+        w(f'<ConversionRate {_attrs({"reportDate": report_date, "fromCurrency": from_currency, "toCurrency": currency, "rate": round(rate, 6)})} />\n')
+    w('</ConversionRates>\n')
+
+
+def write_statement(out, account_id='U1234567', from_date='20250102', to_date=None,
+                    positions=0, trades=0, cash_transactions=0, mtm_performance=0, currency='USD',
+                    conversion_rates=None, seed=42, generated_at=None):
+    """
+    把一份 FlexQueryResponse 写入二进制文件对象 out，可选附带 OpenPositions/Trades/CashTransactions 章节，
+    mtm_performance 个标的的 MTMPerformanceSummaryInBase (各标的 total 之和等于 ChangeInNAV 的 mtm)，
+    以及 ConversionRates 章节 (conversion_rates 为 {fromCurrency: 折合基础货币 currency 的汇率})；
+    generated_at 为 whenGenerated 对应的 datetime，默认为当前时间
+    """
+    rng = random.Random(seed)
+    to_date = to_date or from_date
+    starting = 1_000_000.0
+    mtm = round(rng.uniform(-20_000, 20_000), 2)
+    deposits = 0.0
+
+    def w(text):
+        out.write(text.encode('utf-8'))
+
+    w('<?xml version="1.0" encoding="UTF-8"?>\n')
+    w('<FlexQueryResponse queryName="daily" type="AF">\n<FlexStatements count="1">\n')
+    w(f'<FlexStatement {_attrs({"accountId": account_id, "fromDate": from_date, "toDate": to_date, "period": "LastBusinessDay", "whenGenerated": _when_generated(generated_at)})}>\n')
+    w(f'<AccountInformation {_attrs({"accountId": account_id, "currency": currency, "name": "Sample"})} />\n')
+    w(f'<ChangeInNAV {_attrs({"accountId": account_id, "currency": currency, "fromDate": from_date, "toDate": to_date, "startingValue": starting, "mtm": mtm, "depositsWithdrawals": deposits, "endingValue": round(starting + mtm + deposits, 2)})} />\n')
+
+    if positions:
+        w('<OpenPositions>\n')
+        for i in range(positions):
+            symbol = SYMBOLS[i % len(SYMBOLS)]
+            qty = rng.randint(1, 1000)
+            price = round(rng.uniform(5, 500), 4)
+            w(f'<OpenPosition {_attrs({"accountId": account_id, "currency": "USD", "assetCategory": "STK", "symbol": symbol, "description": f"{symbol} COMMON STOCK", "reportDate": to_date, "position": qty, "markPrice": price, "positionValue": round(qty * price, 2), "costBasisMoney": round(qty * price * 0.9, 2), "fifoPnlUnrealized": round(qty * price * 0.1, 2), "side": "Long", "levelOfDetail": "SUMMARY"})} />\n')
+        w('</OpenPositions>\n')
+
+    if trades:
+        w('<Trades>\n')
+        for i in range(trades):
+            symbol = SYMBOLS[rng.randrange(len(SYMBOLS))]
+            qty = rng.choice([-1, 1]) * rng.randint(1, 500)
+            price = round(rng.uniform(5, 500), 4)
+            w(f'<Trade {_attrs({"accountId": account_id, "currency": "USD", "assetCategory": "STK", "symbol": symbol, "description": f"{symbol} COMMON STOCK", "tradeID": 100000 + i, "tradeDate": to_date, "dateTime": f"{to_date};{rng.randint(93000, 155959)}", "buySell": "BUY" if qty > 0 else "SELL", "quantity": qty, "tradePrice": price, "proceeds": round(-qty * price, 2), "ibCommission": -1.0, "fifoPnlRealized": round(rng.uniform(-500, 500), 2), "mtmPnl": round(rng.uniform(-200, 200), 2), "levelOfDetail": "EXECUTION"})} />\n')
+        w('</Trades>\n')
+
+    if mtm_performance:
+        count = min(mtm_performance, len(SYMBOLS))
+        weights = [rng.uniform(-1, 1) for _ in range(count)]
+        scale = mtm / sum(weights) if sum(weights) else 0.0
+        w('<MTMPerformanceSummaryInBase>\n')
+        for symbol, weight in zip(SYMBOLS, weights):
+            w(f'<MTMPerformanceSummaryUnderlying {_attrs({"accountId": account_id, "assetCategory": "STK", "symbol": symbol, "description": f"{symbol} COMMON STOCK", "reportDate": to_date, "priorOpenMtm": round(weight * scale, 2), "transactionMtm": 0, "commissions": 0, "other": 0, "total": round(weight * scale, 2)})} />\n')
+        w('</MTMPerformanceSummaryInBase>\n')
+
+    if cash_transactions:
+        w('<CashTransactions>\n')
+        for i in range(cash_transactions):
+            w(f'<CashTransaction {_attrs({"accountId": account_id, "currency": "USD", "type": "Dividends", "symbol": SYMBOLS[i % len(SYMBOLS)], "dateTime": to_date, "amount": round(rng.uniform(1, 300), 2), "description": "CASH DIVIDEND", "transactionID": 500000 + i})} />\n')
+        w('</CashTransactions>\n')
+
+    if conversion_rates:
+        _write_conversion_rates(w, to_date, currency, conversion_rates)
+
+    w('</FlexStatement>\n</FlexStatements>\n</FlexQueryResponse>\n')
+
+
+def write_daily_history(out, days, account_id='U1234567', starting=1_000_000.0, mtm_performance=0, currency='USD',
+                        conversion_rates=None, seed=42, generated_at=None):
+    """
+    把按日拆分的多日报告 (每个交易日一个 FlexStatement，前一天的 endingValue 即后一天的 startingValue) 写入 out，
+    days 为 date 列表；约每20个交易日有一笔出入金。用于回填与回放测试。
+    conversion_rates 为 {fromCurrency: 首日汇率}，给出时每天附带 ConversionRates 章节，汇率按日随机游走。
+    整份报告一次生成，所有 FlexStatement 的 whenGenerated 相同 (generated_at，默认为当前时间)。
+    """
+    rng = random.Random(seed)
+    rates = dict(conversion_rates or {})
+    when_generated = _when_generated(generated_at)
+
+    def w(text):
+        out.write(text.encode('utf-8'))
+
+    w('<?xml version="1.0" encoding="UTF-8"?>\n')
+    w(f'<FlexQueryResponse queryName="daily" type="AF">\n<FlexStatements count="{len(days)}">\n')
+    value = starting
+    for day in days:
+        date_str = day.strftime('%Y%m%d')
+        mtm = round(value * rng.gauss(0.0004, 0.011), 2)
+        deposits = round(rng.choice([-1, 1, 1]) * rng.uniform(1_000, 20_000), 2) if rng.random() < 0.05 else 0.0
+        ending = round(value + mtm + deposits, 2)
+        w(f'<FlexStatement {_attrs({"accountId": account_id, "fromDate": date_str, "toDate": date_str, "period": "LastBusinessDay", "whenGenerated": when_generated})}>\n')
+        w(f'<ChangeInNAV {_attrs({"accountId": account_id, "currency": currency, "fromDate": date_str, "toDate": date_str, "startingValue": value, "mtm": mtm, "depositsWithdrawals": deposits, "endingValue": ending})} />\n')
+        if mtm_performance:
+            count = min(mtm_performance, len(SYMBOLS))
+            weights = [rng.uniform(-1, 1) for _ in range(count)]
+            scale = mtm / sum(weights) if sum(weights) else 0.0
+            w('<MTMPerformanceSummaryInBase>\n')
+            for symbol, weight in zip(SYMBOLS, weights):
+                w(f'<MTMPerformanceSummaryUnderlying {_attrs({"accountId": account_id, "assetCategory": "STK", "symbol": symbol, "reportDate": date_str, "total": round(weight * scale, 2)})} />\n')
+            w('</MTMPerformanceSummaryInBase>\n')
+        if rates:
+            rates = {from_currency: rate * (1 + rng.gauss(0, 0.004)) for from_currency, rate in rates.items()}
+            _write_conversion_rates(w, date_str, currency, rates)
+        w('</FlexStatement>\n')
+        value = ending
+    w('</FlexStatements>\n</FlexQueryResponse>\n')
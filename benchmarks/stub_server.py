@@ -0,0 +1,278 @@
+# benchmarks/stub_server.py
+"""
+本地的 IBKR Flex Web Service / Bark / Telegram 替身，用于在没有真实凭证的情况下运行和测量整个流程。
+
+    python benchmarks/stub_server.py --port 8800 --ready-delay 3 --positions 20000
+
+然后在 .env 中指向它:
+    FLEX_BASE_URL=http://127.0.0.1:8800/AccountManagement/FlexWebService
+    BARK_URL=http://127.0.0.1:8800/bark/KEY
+    TELEGRAM_API_BASE=http://127.0.0.1:8800
+
+SendRequest 返回递增的 ReferenceCode；GetStatement 在 ready_delay 秒内返回 1019 (报告生成中)，
+前 throttle_attempts 次请求返回 1018 (请求过于频繁)，之后返回按 token 生成的报告 (malformed=True 时返回截断的 XML)；
+与真实服务一样，每次返回的报告 whenGenerated 都不同，其余内容不变。
+Bark / Telegram 请求按配置的延迟与失败率响应，Telegram 还可以按概率返回 429。
+"""
+import argparse
+import io
+import itertools
+import json
+import random
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'benchmarks'))
+
+from flex_samples import restamp_when_generated, write_statement
+from trading_calendar import TradingCalendar
+
+DEFAULTS = {
+    'ready_delay': 0.0,             # SendRequest 之后多少秒报告才就绪 (之前返回 1019)
+    'throttle_attempts': 0,         # 每个 ReferenceCode 的前 N 次 GetStatement 返回 1018
+    'malformed': False,             # 就绪后返回截断的 XML
+    'statement_date': None,         # 报告日期 YYYYMMDD，默认为当前最新的完整交易日
+    'positions': 0,
+    'trades': 0,
+    'cash_transactions': 0,
+    'mtm_performance': 0,           # MTMPerformanceSummaryInBase 中的标的数
+    'flex_latency': 0.0,            # 每个 Flex 请求的额外延迟 (秒)
+    'bark_latency': 0.0,
+    'bark_failure_rate': 0.0,
+    'telegram_latency': 0.0,
+    'telegram_failure_rate': 0.0,
+    'telegram_rate_limit_rate': 0.0,
+    'seed': 42,
+}
+
+
+def latest_complete_trading_day(calendar=None):
+    """与 IBKRTracker 的判断一致: 交易日收盘前1分钟之后为当天，否则为上一个交易日"""
+    calendar = calendar or TradingCalendar()
+    now_et = datetime.now(calendar.tz)
+    close_dt = calendar.close_datetime(now_et.date())
+    if close_dt is not None and (close_dt - now_et).total_seconds() <= 60:
+        return now_et.strftime('%Y%m%d')
+    return calendar.previous_trading_day(now_et.date()).strftime('%Y%m%d')
+
+
+def account_id_for_token(token):
+    return f"U{zlib.crc32(token.encode('utf-8')) % 10_000_000:07d}"
+
+
+def _flex_response(status, **fields):
+    body = ''.join(f"<{key}>{value}</{key}>" for key, value in fields.items())
+    return f'<FlexStatementResponse timestamp="{datetime.now():%d %B, %Y %I:%M %p} EDT"><Status>{status}</Status>{body}</FlexStatementResponse>'.encode('utf-8')
+
+
+class StubServer:
+    """在后台线程中运行的替身服务器，stats 中记录各端点收到的请求次数，pushes 中记录收到的推送"""
+
+    def __init__(self, host='127.0.0.1', port=0, **config):
+        unknown = set(config) - set(DEFAULTS)
+        if unknown:
+            raise ValueError(f"未知配置项: {', '.join(sorted(unknown))}")
+        self.config = dict(DEFAULTS, **config)
+        self.config['statement_date'] = self.config['statement_date'] or latest_complete_trading_day()
+        self.rng = random.Random(self.config['seed'])
+        self.stats = {}
+        self.pushes = []
+        self._references = {}       # ReferenceCode -> {'token', 'created', 'attempts'}
+        self._statements = {}       # token -> 报告字节内容
+        self._reference_ids = itertools.count(1_000_000_001)
+        self._last_generated = None
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def flex_base_url(self):
+        return f"{self.base_url}/AccountManagement/FlexWebService"
+
+    def bark_url(self, key='BENCH'):
+        return f"{self.base_url}/bark/{key}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='stub-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] = self.stats.get(name, 0) + 1
+
+    def _chance(self, rate):
+        with self._lock:
+            return self.rng.random() < rate
+
+    def statement_bytes(self, token):
+        with self._lock:
+            content = self._statements.get(token)
+        if content is None:
+            out = io.BytesIO()
+            write_statement(out, account_id=account_id_for_token(token), from_date=self.config['statement_date'],
+                            positions=self.config['positions'], trades=self.config['trades'],
+                            cash_transactions=self.config['cash_transactions'],
+                            mtm_performance=self.config['mtm_performance'],
+                            seed=zlib.crc32(token.encode('utf-8')))
+            content = out.getvalue()
+            with self._lock:
+                self._statements[token] = content
+        return content
+
+    def _next_generated_at(self):
+        """报告生成时间: 当前时间，但至少比上一份晚1秒 (whenGenerated 精确到秒)，保证连续两次生成的报告不同"""
+        with self._lock:
+            now = datetime.now().replace(microsecond=0)
+            if self._last_generated is not None and now <= self._last_generated:
+                now = self._last_generated + timedelta(seconds=1)
+            self._last_generated = now
+            return now
+
+    def send_request(self, params):
+        self._count('send_request')
+        token = params.get('t', '')
+        if not token or not params.get('q'):
+            return _flex_response('Fail', ErrorCode='1012', ErrorMessage='Token has expired.')
+        reference_code = str(next(self._reference_ids))
+        with self._lock:
+            self._references[reference_code] = {'token': token, 'created': time.monotonic(), 'attempts': 0}
+        return _flex_response('Success', ReferenceCode=reference_code,
+                              Url=f"{self.flex_base_url}/GetStatement")
+
+    def get_statement(self, params):
+        self._count('get_statement')
+        with self._lock:
+            reference = self._references.get(params.get('q', ''))
+            if reference is not None:
+                reference['attempts'] += 1
+        if reference is None:
+            return _flex_response('Fail', ErrorCode='1015', ErrorMessage='Reference code is invalid.')
+        if reference['attempts'] <= self.config['throttle_attempts']:
+            self._count('error_1018')
+            return _flex_response('Warn', ErrorCode='1018', ErrorMessage='Too many requests have been made from this token.')
+        if time.monotonic() - reference['created'] < self.config['ready_delay']:
+            self._count('error_1019')
+            return _flex_response('Warn', ErrorCode='1019', ErrorMessage='Statement generation in progress. Please try again shortly.')
+        content = restamp_when_generated(self.statement_bytes(reference['token']), self._next_generated_at())
+        if self.config['malformed']:
+            return content[:len(content) // 2]
+        return content
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _reply(self, status, body, content_type):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _json(self, status, obj):
+                self._reply(status, json.dumps(obj).encode('utf-8'), 'application/json')
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {key: values[0] for key, values in parse_qs(url.query).items()}
+                if url.path.endswith('/SendRequest'):
+                    time.sleep(server.config['flex_latency'])
+                    self._reply(200, server.send_request(params), 'text/xml')
+                elif url.path.endswith('/GetStatement'):
+                    time.sleep(server.config['flex_latency'])
+                    self._reply(200, server.get_statement(params), 'text/xml')
+                elif url.path.startswith('/bark/'):
+                    self._bark(params)
+                else:
+                    self._reply(404, b'not found', 'text/plain')
+
+            def _bark(self, params):
+                time.sleep(server.config['bark_latency'])
+                if server._chance(server.config['bark_failure_rate']):
+                    server._count('bark_failed')
+                    self._json(500, {'code': 500, 'message': 'stub failure'})
+                    return
+                server._count('bark_ok')
+                with server._lock:
+                    server.pushes.append(('bark', 'default', params.get('title', '')))
+                self._json(200, {'code': 200, 'message': 'success'})
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                length = int(self.headers.get('Content-Length') or 0)
+                form = {key: values[0] for key, values in parse_qs(self.rfile.read(length).decode('utf-8')).items()}
+                if not (url.path.startswith('/bot') and url.path.endswith('/sendMessage')):
+                    self._reply(404, b'not found', 'text/plain')
+                    return
+                time.sleep(server.config['telegram_latency'])
+                if server._chance(server.config['telegram_rate_limit_rate']):
+                    server._count('telegram_429')
+                    self._json(429, {'ok': False, 'error_code': 429, 'description': 'Too Many Requests: retry after 1',
+                                     'parameters': {'retry_after': 1}})
+                    return
+                if server._chance(server.config['telegram_failure_rate']):
+                    server._count('telegram_failed')
+                    self._json(500, {'ok': False, 'error_code': 500, 'description': 'stub failure'})
+                    return
+                server._count('telegram_ok')
+                chat_id = form.get('chat_id', '')
+                with server._lock:
+                    server.pushes.append(('telegram', chat_id, form.get('text', '').split('\n', 1)[0]))
+                self._json(200, {'ok': True, 'result': {'message_id': len(server.pushes), 'chat': {'id': chat_id}}})
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 Flex Web Service / Bark / Telegram 替身")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8800)
+    for key, default in DEFAULTS.items():
+        option = '--' + key.replace('_', '-')
+        if isinstance(default, bool):
+            parser.add_argument(option, action='store_true')
+        elif key == 'statement_date':
+            parser.add_argument(option)
+        else:
+            parser.add_argument(option, type=type(default), default=default)
+    args = vars(parser.parse_args())
+    host, port = args.pop('host'), args.pop('port')
+    server = StubServer(host, port, **args).start()
+    print(f"Flex:     FLEX_BASE_URL={server.flex_base_url}")
+    print(f"Bark:     BARK_URL={server.bark_url()}")
+    print(f"Telegram: TELEGRAM_API_BASE={server.base_url}")
+    print(f"报告日期: {server.config['statement_date']}，按 Ctrl+C 退出")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print(json.dumps(server.stats, ensure_ascii=False))
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
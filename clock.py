@@ -0,0 +1,37 @@
+# clock.py
+import time
+from datetime import datetime
+
+
+class SystemClock:
+    """真实的墙上时钟"""
+
+    def now(self, tz=None):
+        return datetime.now(tz)
+
+    def time(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+class SimulatedClock:
+    """模拟时钟: sleep 只把时间往前拨，不真正等待，用于回放与测试"""
+
+    def __init__(self, start):
+        """start 为带时区的 datetime 或 epoch 秒"""
+        self._now = start.timestamp() if isinstance(start, datetime) else float(start)
+
+    def now(self, tz=None):
+        return datetime.fromtimestamp(self._now, tz)
+
+    def time(self):
+        return self._now
+
+    def sleep(self, seconds):
+        self._now += max(0.0, seconds)
+
+    def set(self, when):
+        """把时间拨到 when (带时区的 datetime)，不允许倒退"""
+        self._now = max(self._now, when.timestamp())
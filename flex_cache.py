@@ -0,0 +1,153 @@
+# flex_cache.py
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from state_store import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+# 刚写入、尚未登记的文件 (其他账户正在解析) 在这段时间内不会被当作孤立文件删除 (秒)
+ORPHAN_GRACE_SECONDS = 600
+# 扫描整个目录清理孤立文件的最短间隔 (秒)
+ORPHAN_SWEEP_INTERVAL = 3600
+
+
+def token_fingerprint(token):
+    """缓存索引中不保存 token 原文，只保存其摘要"""
+    return hashlib.sha256((token or '').encode('utf-8')).hexdigest()[:12]
+
+
+class FlexStatementCache:
+    """
+    GetStatement 原始报告的本地缓存：内容按 SHA-256 寻址并以 gzip 压缩保存，
+    索引按 (token 摘要, Query ID) 记录每份报告的 fromDate/toDate/账户，支持按大小和时间淘汰。
+    """
+
+    def __init__(self, cache_dir, max_bytes=200 * 1024 * 1024, max_age_days=30, clock=time.time):
+        self.cache_dir = Path(cache_dir)
+        self.blob_dir = self.cache_dir / 'blobs'
+        self.index_path = self.cache_dir / 'index.json'
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_days * 86400
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._last_sweep = None
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        self.entries = self._load_index()
+
+    @staticmethod
+    def make_key(token, query_id):
+        return f"{token_fingerprint(token)}:{query_id}"
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+        except (json.JSONDecodeError, IOError) as e:
+            logger.error(f"加载报告缓存索引失败: {e}，将重建空索引。")
+            return []
+
+    def _save_index(self):
+        atomic_write_json(self.index_path, self.entries)
+
+    def blob_path(self, sha256):
+        return self.blob_dir / f"{sha256}.xml.gz"
+
+    def store(self, reader, chunk_size=64 * 1024):
+        """把报告内容边读边压缩写入缓存，返回其 SHA-256；相同内容只保存一份"""
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.blob_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6) as gz:
+                while True:
+                    chunk = reader.read(chunk_size)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    gz.write(chunk)
+            sha256 = digest.hexdigest()
+            final_path = self.blob_path(sha256)
+            if final_path.exists():
+                os.unlink(tmp_path)
+            else:
+                os.replace(tmp_path, final_path)
+            return sha256
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def open(self, sha256):
+        """以流的方式读取缓存中的报告 (解压后的原始 XML)"""
+        return gzip.open(self.blob_path(sha256), 'rb')
+
+    def record(self, key, sha256, from_date, to_date, account_id=''):
+        """登记一份已存入缓存的报告，并按需淘汰旧数据"""
+        with self._lock:
+            self.entries = [e for e in self.entries if not (e['key'] == key and e['sha256'] == sha256)]
+            self.entries.append({
+                'key': key,
+                'sha256': sha256,
+                'fromDate': from_date,
+                'toDate': to_date,
+                'accountId': account_id,
+                'fetched_at': self.clock(),
+                'size': self.blob_path(sha256).stat().st_size,
+            })
+            self._evict()
+            self._save_index()
+
+    def lookup(self, key, min_to_date):
+        """返回该 key 下 toDate 不早于 min_to_date (YYYYMMDD) 的最新一份报告的索引项，没有则返回 None"""
+        with self._lock:
+            candidates = [
+                e for e in self.entries
+                if e['key'] == key and (e['toDate'] or '') >= min_to_date and self.blob_path(e['sha256']).exists()
+            ]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda e: (e['toDate'], e['fetched_at']))
+
+    def _evict(self):
+        """
+        先淘汰过期条目，再按抓取时间从旧到新淘汰直到总大小低于上限，然后删除被淘汰条目中不再被引用的文件；
+        从未登记过的孤立文件 (例如进程在登记前退出) 每隔 ORPHAN_SWEEP_INTERVAL 才扫描整个目录清理一次。
+        """
+        previous = {e['sha256'] for e in self.entries}
+        cutoff = self.clock() - self.max_age_seconds
+        entries = sorted((e for e in self.entries if e['fetched_at'] >= cutoff), key=lambda e: e['fetched_at'])
+        sizes = {}
+        for e in entries:
+            sizes[e['sha256']] = e['size']
+        total = sum(sizes.values())
+        while entries and total > self.max_bytes:
+            oldest = entries.pop(0)
+            if all(e['sha256'] != oldest['sha256'] for e in entries):
+                total -= sizes.pop(oldest['sha256'])
+        self.entries = entries
+
+        referenced = {e['sha256'] for e in self.entries}
+        now = time.monotonic()
+        if self._last_sweep is None or now - self._last_sweep >= ORPHAN_SWEEP_INTERVAL:
+            self._last_sweep = now
+            candidates = self.blob_dir.iterdir()
+        else:
+            candidates = (self.blob_path(sha256) for sha256 in previous - referenced)
+        # 刚写入、尚未登记的文件 (其他账户正在解析同样内容的报告) 不能删，只清理一段时间前的文件
+        orphan_cutoff = time.time() - ORPHAN_GRACE_SECONDS
+        for path in candidates:
+            sha256 = path.name.split('.', 1)[0]
+            try:
+                if sha256 not in referenced and path.stat().st_mtime < orphan_cutoff:
+                    path.unlink()
+            except FileNotFoundError:
+                pass
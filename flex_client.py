@@ -0,0 +1,246 @@
+# flex_client.py
+import itertools
+import logging
+import random
+import statistics
+import threading
+import time
+import xml.etree.ElementTree as ET
+
+import requests
+
+import metrics
+from flex_parser import StreamReader
+from rate_limit import KeyedRateLimiter, RateLimiter
+
+logger = logging.getLogger(__name__)
+
+FLEX_HTTP_SECONDS = metrics.histogram(
+    'flex_http_request_seconds', 'Flex Web Service 单次 HTTP 请求耗时 (流式读取时为收到响应开头的耗时)', ['endpoint'])
+FLEX_ERRORS = metrics.counter(
+    'flex_errors_total', 'Flex Web Service 返回的错误码 (或请求异常类型) 次数', ['endpoint', 'code'])
+FLEX_POLL_RETRIES = metrics.counter('flex_poll_retries_total', '报告未就绪而复用 ReferenceCode 重试 GetStatement 的次数', ['code'])
+FLEX_READY_SECONDS = metrics.histogram('flex_statement_ready_seconds', '从开始轮询 GetStatement 到报告就绪的耗时')
+FLEX_POLL_OUTCOMES = metrics.counter('flex_poll_outcomes_total', 'GetStatement 轮询的最终结果', ['outcome'])
+FLEX_RATE_LIMIT_WAIT_SECONDS = metrics.histogram('flex_rate_limit_wait_seconds', '请求 Flex Web Service 前因本地限流等待的时间')
+
+
+class FlexRateLimiter:
+    """
+    Flex Web Service 请求的本地限流 (SendRequest 与 GetStatement 共用):
+    同一 token 每秒最多1次、任意60秒内不超过 per_token_per_minute 次；所有 token 合计每秒不超过 global_per_second 次。
+    """
+
+    def __init__(self, per_token_per_minute=10, global_per_second=10.0):
+        # 突发 n/2 + 速率 n/120 次/秒，保证任意60秒窗口内不超过 n 次
+        self.per_token = KeyedRateLimiter([(1.0, 1), (per_token_per_minute / 120.0, max(1, per_token_per_minute // 2))])
+        self.global_limit = RateLimiter(global_per_second, burst=max(1.0, global_per_second))
+
+    def acquire(self, token):
+        waited = self.per_token.acquire(token) + self.global_limit.acquire()
+        FLEX_RATE_LIMIT_WAIT_SECONDS.observe(waited)
+        return waited
+
+# 报告未就绪类错误码 -> (首次退避秒数, 退避上限秒数)
+# 1018: 请求过于频繁; 1019: 报告生成中; 1020: 暂时无法校验请求
+NOT_READY_BACKOFF = {
+    '1018': (10.0, 60.0),
+    '1019': (2.0, 15.0),
+    '1020': (5.0, 30.0),
+}
+
+
+class ReadinessStats:
+    """记录从 SendRequest 成功到 GetStatement 就绪所用的时间，用于估算首次轮询的等待时长"""
+
+    def __init__(self, samples=None, max_samples=50):
+        self.max_samples = max_samples
+        self.samples = list(samples or [])[-max_samples:]
+        self._lock = threading.Lock()
+
+    def record(self, seconds_to_ready, attempts):
+        with self._lock:
+            self.samples.append({'seconds': round(seconds_to_ready, 3), 'attempts': attempts})
+            del self.samples[:-self.max_samples]
+
+    def suggested_initial_delay(self, default=5.0, floor=1.0, ceiling=30.0):
+        """取历史就绪时间中位数的八成作为首次等待，样本不足时使用默认值"""
+        if len(self.samples) < 3:
+            return default
+        median = statistics.median(s['seconds'] for s in self.samples)
+        return max(floor, min(ceiling, median * 0.8))
+
+    def summary(self):
+        if not self.samples:
+            return "暂无样本"
+        seconds = sorted(s['seconds'] for s in self.samples)
+        attempts = [s['attempts'] for s in self.samples]
+        p90 = seconds[min(len(seconds) - 1, int(len(seconds) * 0.9))]
+        return (f"样本 {len(seconds)} 个, 中位数 {statistics.median(seconds):.1f}s, "
+                f"P90 {p90:.1f}s, 最大 {seconds[-1]:.1f}s, 平均尝试 {statistics.mean(attempts):.1f} 次")
+
+
+def _backoff_delay(error_code, retry_index):
+    """带抖动、有上限的指数退避 (equal jitter)"""
+    base, cap = NOT_READY_BACKOFF.get(error_code, (5.0, 30.0))
+    delay = min(cap, base * (2 ** retry_index))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def _extract_error(content):
+    """如果 GetStatement 返回的是错误响应，则返回 (ErrorCode, ErrorMessage)，否则返回 None"""
+    head = content[:2048].lstrip()
+    if not head.startswith(b'<FlexStatementResponse') and b'<ErrorCode>' not in head:
+        return None
+    try:
+        root = ET.fromstring(content)
+    except ET.ParseError:
+        return None
+    error_code = root.findtext('ErrorCode')
+    if not error_code:
+        return None
+    return error_code, root.findtext('ErrorMessage', "报告获取返回错误码，但无ErrorMessage")
+
+
+def send_flex_request(url, token, query_id, timeout=30, from_date=None, to_date=None, limiter=None):
+    """
+    调用 SendRequest，成功时返回 ReferenceCode，失败返回 None。
+    from_date/to_date (YYYYMMDD) 可覆盖 Flex Query 中设置的报告区间 (IBKR 限制单次不超过365天)。
+    limiter 为 FlexRateLimiter 时，发出请求前先按 token 与全局限流等待。
+    """
+    params_send = {'t': token, 'q': query_id, 'v': '3'}
+    if from_date and to_date:
+        params_send.update(fd=from_date, td=to_date)
+    if limiter is not None:
+        limiter.acquire(token)
+    try:
+        with FLEX_HTTP_SECONDS.time(endpoint='send_request'):
+            response_send = requests.get(url, params=params_send, timeout=timeout)
+        response_send.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        FLEX_ERRORS.inc(endpoint='send_request', code=type(e).__name__)
+        raise
+
+    root_send = ET.fromstring(response_send.text)
+    status_send = root_send.findtext('Status')
+    if status_send != 'Success':
+        FLEX_ERRORS.inc(endpoint='send_request', code=root_send.findtext('ErrorCode') or 'unknown')
+        error_message = root_send.findtext('ErrorMessage', "发送请求返回状态非Success，但无ErrorMessage")
+        logger.error(f"发送请求失败: {status_send} - {error_message}")
+        return None
+
+    reference_code = root_send.findtext('ReferenceCode')
+    if not reference_code:
+        logger.error("发送请求成功，但响应中未找到有效的 ReferenceCode。")
+        return None
+    return reference_code
+
+
+class FlexPoll:
+    """
+    复用同一个 ReferenceCode 轮询 GetStatement 的状态。attempt() 每次只发出一个请求、从不休眠，
+    报告未就绪时由调用方在 remaining_delay() 秒后再次调用 (多租户守护进程借此把等待交给调度器，不占用工作线程)。
+    """
+
+    def __init__(self, url, token, reference_code, deadline_seconds=600, initial_delay=5.0,
+                 stats=None, timeout=30, clock=time.monotonic, stream=False, limiter=None):
+        self.url = url
+        self.token = token
+        self.reference_code = reference_code
+        self.deadline_seconds = deadline_seconds
+        self.stats = stats
+        self.timeout = timeout
+        self.clock = clock
+        self.stream = stream
+        self.limiter = limiter
+        self.started = clock()
+        self.deadline = self.started + deadline_seconds
+        self.due = self.started + max(0.0, min(initial_delay, deadline_seconds))
+        self.attempts = 0
+        self.retry_index = 0
+        # 轮询结束后为报告内容 (stream=True 时为 StreamReader)，失败或超时为 None
+        self.result = None
+
+    def remaining_delay(self):
+        """距下一次应发出 GetStatement 的秒数"""
+        return max(0.0, self.due - self.clock())
+
+    def is_stale(self):
+        """到期后又过了一个截止时长仍无人继续轮询 (该轮获取已被放弃)，这个 ReferenceCode 不应再使用"""
+        return self.clock() - self.due > self.deadline_seconds
+
+    def attempt(self):
+        """发出一次 GetStatement。返回 True 表示轮询已结束 (结果见 result)，返回 False 表示报告未就绪、稍后再试"""
+        if self.limiter is not None:
+            self.limiter.acquire(self.token)
+
+        self.attempts += 1
+        params_get = {'t': self.token, 'q': self.reference_code, 'v': '3'}
+        try:
+            with FLEX_HTTP_SECONDS.time(endpoint='get_statement'):
+                response_get = requests.get(self.url, params=params_get, timeout=self.timeout, stream=self.stream)
+                response_get.raise_for_status()
+                if self.stream:
+                    # 错误响应很小，只需检查开头约 2KB 内容即可判断
+                    chunks = response_get.iter_content(chunk_size=64 * 1024)
+                    content = b''
+                    for chunk in chunks:
+                        content += chunk
+                        if len(content) >= 2048:
+                            break
+                else:
+                    content = response_get.content
+        except requests.exceptions.RequestException as e:
+            FLEX_ERRORS.inc(endpoint='get_statement', code=type(e).__name__)
+            FLEX_POLL_OUTCOMES.inc(outcome='exception')
+            raise
+
+        error = _extract_error(content)
+        if error is None:
+            elapsed = self.clock() - self.started
+            if self.stats is not None:
+                self.stats.record(elapsed, self.attempts)
+            FLEX_READY_SECONDS.observe(elapsed)
+            FLEX_POLL_OUTCOMES.inc(outcome='ready')
+            logger.info(f"报告已就绪: 用时 {elapsed:.1f}s, 共尝试 {self.attempts} 次。")
+            if self.stream:
+                self.result = StreamReader(itertools.chain([content], chunks), on_close=response_get.close)
+            else:
+                self.result = content
+            return True
+        response_get.close()
+
+        error_code, error_message = error
+        FLEX_ERRORS.inc(endpoint='get_statement', code=error_code)
+        if error_code not in NOT_READY_BACKOFF:
+            logger.error(f"获取报告时遇到问题: ErrorCode {error_code} - {error_message}")
+            FLEX_POLL_OUTCOMES.inc(outcome='error')
+            return True
+
+        now = self.clock()
+        remaining = self.deadline - now
+        if remaining <= 0:
+            logger.warning(f"ReferenceCode {self.reference_code} 在 {self.deadline_seconds:.0f}s 内仍未就绪，放弃本轮轮询。")
+            FLEX_POLL_OUTCOMES.inc(outcome='deadline')
+            return True
+        delay = _backoff_delay(error_code, self.retry_index)
+        self.retry_index += 1
+        self.due = now + min(delay, remaining)
+        FLEX_POLL_RETRIES.inc(code=error_code)
+        logger.info(f"报告尚未准备好 (错误码 {error_code})，{delay:.1f}s 后使用同一 ReferenceCode 重试。")
+        return False
+
+
+def poll_flex_statement(url, token, reference_code, deadline_seconds=600, initial_delay=5.0,
+                        stats=None, timeout=30, sleep=time.sleep, clock=time.monotonic, stream=False, limiter=None):
+    """
+    复用同一个 ReferenceCode 轮询 GetStatement，在调用线程中等待直到报告就绪或超过本轮截止时间。
+    返回报告的原始字节内容；stream=True 时返回按块读取响应体的 StreamReader (用完需关闭)。
+    遇到非"未就绪"类错误或超时则返回 None。
+    """
+    poll = FlexPoll(url, token, reference_code, deadline_seconds=deadline_seconds, initial_delay=initial_delay,
+                    stats=stats, timeout=timeout, clock=clock, stream=stream, limiter=limiter)
+    while True:
+        sleep(poll.remaining_delay())
+        if poll.attempt():
+            return poll.result
@@ -0,0 +1,137 @@
+# flex_parser.py
+import hashlib
+import io
+import re
+import tempfile
+import xml.etree.ElementTree as ET
+
+# 每次生成报告都会变化、与账户数据无关的属性 (FlexStatement 的 whenGenerated="YYYYMMDD;HHMMSS")
+VOLATILE_ATTRIBUTES = re.compile(rb'\swhenGenerated="[^"]*"')
+
+
+class StreamReader(io.RawIOBase):
+    """把按块产生的字节迭代器包装为文件对象，供 iterparse 逐块读取；保留开头部分字节用于出错时记录日志"""
+
+    def __init__(self, chunks, head_size=500, on_close=None):
+        self._chunks = iter(chunks)
+        self._buffer = b''
+        self._on_close = on_close
+        self.head = b''
+        self._head_size = head_size
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buffer:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            if len(self.head) < self._head_size:
+                self.head += chunk[:self._head_size - len(self.head)]
+            self._buffer = chunk
+        size = min(len(b), len(self._buffer))
+        b[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+    def close(self):
+        if not self.closed and self._on_close is not None:
+            self._on_close()
+        super().close()
+
+
+class StatementFingerprint:
+    """流式计算报告内容去掉 whenGenerated 之后的 SHA-256: 账户数据相同的两次生成得到相同的指纹"""
+
+    # 块末尾保留这么多字节与下一块拼接后再匹配，跨块的属性不会被漏掉
+    CARRY = 128
+
+    def __init__(self):
+        self._digest = hashlib.sha256()
+        self._pending = b''
+
+    def update(self, chunk):
+        data = self._pending + chunk
+        cut = max(0, len(data) - self.CARRY)
+        if b'whenGenerated' not in data:
+            # 绝大多数块 (持仓/成交等章节) 不含该属性，跳过正则
+            self._digest.update(data[:cut])
+            self._pending = data[cut:]
+            return
+        for match in VOLATILE_ATTRIBUTES.finditer(data):
+            if match.start() < cut < match.end():
+                cut = match.start()
+                break
+        self._digest.update(VOLATILE_ATTRIBUTES.sub(b'', data[:cut]))
+        self._pending = data[cut:]
+
+    def hexdigest(self):
+        digest = self._digest.copy()
+        digest.update(VOLATILE_ATTRIBUTES.sub(b'', self._pending))
+        return digest.hexdigest()
+
+
+class SpooledStatement:
+    """
+    读完一份报告的响应流: 原始内容暂存在临时文件中 (不超过 max_memory 时只在内存里，关闭即删除)，
+    同时计算 StatementFingerprint，用于不写入报告缓存的盘中查询。
+    """
+
+    def __init__(self, reader, max_memory=8 * 1024 * 1024, chunk_size=64 * 1024):
+        self.file = tempfile.SpooledTemporaryFile(max_size=max_memory)
+        fingerprint = StatementFingerprint()
+        while True:
+            chunk = reader.read(chunk_size)
+            if not chunk:
+                break
+            fingerprint.update(chunk)
+            self.file.write(chunk)
+        self.file.seek(0)
+        self.fingerprint = fingerprint.hexdigest()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_flex_statements(source, sections=None):
+    """
+    以 iterparse 流式解析 Flex XML，只保留需要的部分，解析过的节点随即释放，内存占用与报告大小无关。
+
+    source: 文件对象或字节串
+    sections: {章节标签: 回调函数}，例如 {'OpenPositions': on_position}，章节内每一行的属性字典会依次传给回调；
+              'FlexStatements' 的回调在每个 FlexStatement 开始时收到其属性，可据此区分一个文件中的多个 FlexStatement
+    返回 FlexStatement 列表，每项为 {'attrs': FlexStatement 属性, 'ChangeInNAV': ChangeInNAV 属性或 None}
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    sections = sections or {}
+
+    statements = []
+    current = None
+    stack = []
+
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            # start 事件时属性已经完整，直接在这里取值
+            tag = elem.tag
+            parent_tag = stack[-1].tag if stack else None
+            if tag == 'FlexStatement':
+                current = {'attrs': dict(elem.attrib), 'ChangeInNAV': None}
+                statements.append(current)
+                if parent_tag in sections:
+                    sections[parent_tag](dict(elem.attrib))
+            elif tag == 'ChangeInNAV' and parent_tag == 'FlexStatement':
+                current['ChangeInNAV'] = dict(elem.attrib)
+            elif parent_tag in sections:
+                sections[parent_tag](dict(elem.attrib))
+            stack.append(elem)
+            continue
+
+        stack.pop()
+        # 从父节点上摘除已处理完的节点，避免整棵树在内存中累积
+        elem.clear()
+        if stack:
+            stack[-1].remove(elem)
+
+    return statements
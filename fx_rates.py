@@ -0,0 +1,153 @@
+# fx_rates.py
+import logging
+import threading
+
+import numpy as np
+
+# 常见货币的金额前缀，其余货币以 "代码 " 作为前缀
+CURRENCY_SYMBOLS = {
+    'USD': '$', 'HKD': 'HK$', 'CNH': '¥', 'CNY': '¥', 'JPY': '¥', 'EUR': '€', 'GBP': '£',
+    'SGD': 'S$', 'CAD': 'C$', 'AUD': 'A$', 'NZD': 'NZ$',
+}
+
+
+def format_money(amount, currency):
+    """按货币格式化金额，例如 $1,234.56、HK$-12.30、CHF 100.00 (负号位置与旧版 "$-12.30" 一致)"""
+    prefix = CURRENCY_SYMBOLS.get(currency, f"{currency} ")
+    return f"{prefix}{amount:,.2f}"
+
+
+def _iso_date(value):
+    """Flex 的 YYYYMMDD 或 YYYY-MM-DD (以及带 ;HHMMSS 的时间戳) 转为 YYYY-MM-DD"""
+    value = str(value).split(';')[0].replace('-', '')
+    return f"{value[:4]}-{value[4:6]}-{value[6:8]}"
+
+
+def conversion_rate(row):
+    """
+    Flex ConversionRates 章节的一行 (ConversionRate 属性字典) 转为 (YYYY-MM-DD, fromCurrency, toCurrency, rate)；
+    字段缺失或汇率无效 (IBKR 对取不到的汇率给出 -1) 时返回 None
+    """
+    from_currency, to_currency, report_date = row.get('fromCurrency'), row.get('toCurrency'), row.get('reportDate')
+    try:
+        rate = float(row.get('rate') or 0)
+    except ValueError:
+        return None
+    if not (from_currency and to_currency and report_date) or rate <= 0:
+        return None
+    return (_iso_date(report_date), from_currency.upper(), to_currency.upper(), rate)
+
+
+class FxRateTable:
+    """
+    按日期索引的汇率表: 每个货币对在内存中保存按日期排序的 datetime64 数组与汇率数组，查询某天的汇率时
+    用 searchsorted 取当天或之前最近一天的汇率 (周末、假日沿用前一个交易日)，整段历史一次批量查完。
+    汇率同时写入 store (NavStore 的 fx_rates 表)，进程重启后直接加载，不需要重新解析旧报告。
+    没有直接报价的货币对先取反向报价，再经由共同的第三种货币 (例如各账户的基础货币) 换算。
+    """
+
+    def __init__(self, store=None):
+        self.store = store
+        self._lock = threading.Lock()
+        self._pairs = {}    # (fromCurrency, toCurrency) -> (日期 datetime64[D] 数组, 汇率数组)
+        if store is not None:
+            self._merge(store.fx_rates())
+
+    def __len__(self):
+        return sum(len(dates) for dates, _ in self._pairs.values())
+
+    def currencies(self):
+        return sorted({currency for pair in self._pairs for currency in pair})
+
+    def _merge(self, rows):
+        grouped = {}
+        for report_date, from_currency, to_currency, rate in rows:
+            grouped.setdefault((from_currency, to_currency), []).append((report_date, rate))
+        pairs = dict(self._pairs)
+        for pair, items in grouped.items():
+            dates = np.array([item[0] for item in items], dtype='datetime64[D]')
+            rates = np.array([item[1] for item in items], dtype=float)
+            if pair in pairs:
+                dates = np.concatenate([pairs[pair][0], dates])
+                rates = np.concatenate([pairs[pair][1], rates])
+            # 同一天有多个汇率时以后加入的为准: 反转后 unique 取到的是最后一次出现的位置
+            _, index = np.unique(dates[::-1], return_index=True)
+            index = len(dates) - 1 - index
+            pairs[pair] = (dates[index], rates[index])
+        # 整体替换，查询线程看到的总是完整的数组
+        self._pairs = pairs
+
+    def add(self, rows):
+        """加入一批 (YYYY-MM-DD, fromCurrency, toCurrency, rate)，同时写入 store；返回加入的条数"""
+        rows = list(rows)
+        if not rows:
+            return 0
+        with self._lock:
+            self._merge(rows)
+            if self.store is not None:
+                self.store.record_fx_rates(rows)
+        return len(rows)
+
+    def _direct(self, from_currency, to_currency, dates):
+        """直接报价或反向报价的批量查询，没有该货币对时返回 None，早于最早报价的日期为 NaN"""
+        for pair, invert in (((from_currency, to_currency), False), ((to_currency, from_currency), True)):
+            if pair not in self._pairs:
+                continue
+            pair_dates, pair_rates = self._pairs[pair]
+            index = np.searchsorted(pair_dates, dates, side='right') - 1
+            rates = np.where(index >= 0, pair_rates[np.maximum(index, 0)], np.nan)
+            return 1.0 / rates if invert else rates
+        return None
+
+    def rates(self, from_currency, to_currency, dates):
+        """dates (YYYY-MM-DD 字符串或 datetime64 序列) 上 1 单位 from_currency 折合多少 to_currency，查不到的位置为 NaN"""
+        dates = np.asarray(dates, dtype='datetime64[D]')
+        if from_currency == to_currency:
+            return np.ones(len(dates))
+        rates = self._direct(from_currency, to_currency, dates)
+        if rates is not None and not np.isnan(rates).any():
+            return rates
+        if rates is None:
+            rates = np.full(len(dates), np.nan)
+        for pivot in self.currencies():
+            if pivot in (from_currency, to_currency):
+                continue
+            first, second = self._direct(from_currency, pivot, dates), self._direct(pivot, to_currency, dates)
+            if first is None or second is None:
+                continue
+            rates = np.where(np.isnan(rates), first * second, rates)
+            if not np.isnan(rates).any():
+                break
+        return rates
+
+    def rate(self, from_currency, to_currency, day):
+        """单个日期 (YYYY-MM-DD 或 YYYYMMDD) 的汇率，查不到时返回 None"""
+        rate = self.rates(from_currency, to_currency, [_iso_date(day)])[0]
+        return None if np.isnan(rate) else float(rate)
+
+    def consolidate(self, series, to_currency):
+        """
+        把多个账户的 NAV 日序列按各行日期批量换算为 to_currency 后按日期求和。
+        series 为 [(账户货币, rows)]，rows 与 NavStore.series 相同: [(report_date, starting, ending, mtm, deposits)]。
+        任一账户查不到汇率的日期不能按 1:1 混入合计，整天不输出。
+        返回 (按日期排序的合并记录, 因缺少汇率而未输出的日期列表)。
+        """
+        all_dates, all_values, missing = [], [], set()
+        for currency, rows in series:
+            if not rows:
+                continue
+            dates = np.array([row[0] for row in rows], dtype='datetime64[D]')
+            rates = self.rates(currency, to_currency, dates)
+            unknown = np.isnan(rates)
+            if unknown.any():
+                missing.update(str(day) for day in dates[unknown])
+                logging.warning(f"{currency}→{to_currency} 有 {int(unknown.sum())} 天查不到汇率 (最早 {dates[unknown][0]})。")
+            all_dates.append(dates)
+            all_values.append(np.array([row[1:5] for row in rows], dtype=float) * rates[:, None])
+        if not all_dates:
+            return [], sorted(missing)
+        days, inverse = np.unique(np.concatenate(all_dates), return_inverse=True)
+        values = np.concatenate(all_values)
+        totals = np.column_stack([np.bincount(inverse, weights=values[:, i], minlength=len(days)) for i in range(4)])
+        records = [(str(day), *map(float, total)) for day, total in zip(days, totals)]
+        return [record for record in records if record[0] not in missing], sorted(missing)
@@ -1,7 +1,7 @@
 # 文件: ibkr_net_value_tracker.py (最终完整版)
 
+import argparse
 import requests
-import time
 from datetime import datetime, timedelta, date
 import os
 from dotenv import load_dotenv
@@ -12,11 +12,24 @@ from pathlib import Path
 import xml.etree.ElementTree as ET
 import pytz
 import json
-from telegram_notifier import send_telegram_notification
+from concurrent.futures import ThreadPoolExecutor
+from flex_client import FlexPoll, FlexRateLimiter, ReadinessStats, send_flex_request, poll_flex_statement
+from flex_parser import SpooledStatement, parse_flex_statements
+from flex_cache import FlexStatementCache
+from nav_store import CONSOLIDATED_ACCOUNT, LEGACY_CURRENCY, NavStore
+from fx_rates import FxRateTable, conversion_rate, format_money
+from state_store import JournaledState, StateCorruptedError, TrackedDict
+from trading_calendar import TradingCalendar
+from nav_analytics import compute_metrics
+from clock import SystemClock
+from position_attribution import Attribution, StatementColumns
+import metrics
+from metrics import MetricsDumper, MetricsServer
 
-# 添加当前目录到 Python 路径，确保 push 模块能被找到
+# 添加当前目录到 Python 路径，确保推送模块能被找到
 sys.path.append(str(Path(__file__).resolve().parent))
-from push import send_bark_notification
+from notification_dispatcher import NotificationDispatcher
+from notification_outbox import NotificationOutbox
 
 # 加载 .env 文件中的环境变量
 load_dotenv()
@@ -46,161 +59,695 @@ logger.addHandler(timed_file_handler)
 logger.addHandler(stream_handler)
 # --- 日志配置结束 ---
 
+PIPELINE_STAGE_SECONDS = metrics.histogram('pipeline_stage_seconds', '获取→解析→推送流程各阶段耗时', ['stage'])
+TRACKER_CYCLES = metrics.counter('tracker_cycles_total', 'send_daily_report 的执行结果', ['status'])
+CACHE_LOOKUPS = metrics.counter('flex_cache_lookups_total', '本地报告缓存的查询结果', ['result'])
+INTRADAY_CHECKS = metrics.counter('intraday_checks_total', '盘中检查的结果', ['result'])
+
+# 旧版 tracker_state.json 中保存周/月基准的字段，NAV 历史库建立后不再使用
+LEGACY_BASELINE_KEYS = ('weekly_start_nav', 'weekly_deposits', 'monthly_start_nav', 'monthly_deposits')
+
 class IBKRTracker:
-    def __init__(self):
-        self.flex_token = os.getenv('IB_FLEX_TOKEN')
-        self.query_id = os.getenv('IB_QUERY_ID')
-        self.send_request_url = "https://ndcdyn.interactivebrokers.com/AccountManagement/FlexWebService/SendRequest"
-        self.get_statement_url = "https://ndcdyn.interactivebrokers.com/AccountManagement/FlexWebService/GetStatement"
+    def __init__(self, config=None, calendar=None, dispatcher=None, nav_store=None, flex_limiter=None, clock=None,
+                 fx_rates=None, executor=None, defer_polls=False):
+        """
+        config 为配置项字典 (键名与 .env 中的变量相同)，未提供的项回退到环境变量；
+        calendar / dispatcher / nav_store / flex_limiter / fx_rates / executor 可由多租户守护进程传入共享实例；
+        clock 默认为真实时钟，回放时传入 SimulatedClock。
+        defer_polls=True 时报告未就绪不在调用线程中等待，而是返回 'awaiting_statement' 状态与 retry_after 秒数，
+        由调用方 (守护进程的调度器) 到时再调用一次继续轮询。
+        """
+        self.config = dict(config or {})
+        self.clock = clock or SystemClock()
+        flex_accounts = self._load_flex_accounts()
+        self.flex_accounts = [(token, query_id) for token, query_id, _ in flex_accounts]
+        # 可通过 FLEX_BASE_URL 指向其他地址 (例如 benchmarks/stub_server.py 提供的本地替身)
+        flex_base_url = self._setting('FLEX_BASE_URL', 'https://ndcdyn.interactivebrokers.com/AccountManagement/FlexWebService').rstrip('/')
+        self.send_request_url = f"{flex_base_url}/SendRequest"
+        self.get_statement_url = f"{flex_base_url}/GetStatement"
         
         self.et_timezone = pytz.timezone('US/Eastern')
+        self.calendar = calendar or TradingCalendar()
         
         self.last_notified_raw_fromdate = None
         self.initial_run_for_notification = True
         self.hunt_active_for_current_cycle = False
 
-        self.state_file_path = Path(__file__).resolve().parent / 'tracker_state.json'
-        self.state = {}
+        self.state_file_path = Path(self._setting('TRACKER_STATE_PATH', str(Path(__file__).resolve().parent / 'tracker_state.json')))
+        self.state = TrackedDict()
+        self.state_store = JournaledState(self.state_file_path)
         self.load_state()
 
+        # 同一 ReferenceCode 的 GetStatement 轮询截止时间 (秒)
+        self.poll_deadline_seconds = float(self._setting('FLEX_POLL_DEADLINE', '600'))
+        # 就绪耗时样本不足时，首次 GetStatement 前的等待时间 (秒)
+        self.poll_initial_delay = float(self._setting('FLEX_POLL_INITIAL_DELAY', '5'))
+        self.flex_limiter = flex_limiter or FlexRateLimiter(
+            per_token_per_minute=int(self._setting('FLEX_TOKEN_REQUESTS_PER_MINUTE', '10')),
+            global_per_second=float(self._setting('FLEX_GLOBAL_REQUESTS_PER_SECOND', '10')),
+        )
+        self.readiness_stats = ReadinessStats(self.state.get('flex_readiness_samples'))
+        # 并发请求各账户时使用的线程池；单独运行时按账户数创建，守护进程传入共享的工作线程池
+        self.executor = executor or ThreadPoolExecutor(max_workers=min(max(1, len(self.flex_accounts)), 32),
+                                                       thread_name_prefix='flex')
+        self.defer_polls = defer_polls
+        # defer_polls 时尚未完成的轮询: {'daily'/'intraday': {'polls': {账户: FlexPoll}, 'hashes': {账户: SHA-256}}}
+        self._poll_rounds = {}
+        # 已解析报告 {SHA-256: (details, attribution)}，每个账户只保留最新解析的一份 (守护进程中每个租户都有一份)
+        self._parsed_details = {}
+        # 日报/周报中附带盈亏贡献最大的前 N 个标的与持仓集中度，0 表示关闭 (不再解析持仓/成交章节)
+        self.attribution_top_n = int(self._setting('ATTRIBUTION_TOP_N', '3'))
+
+        # 盘中监控: INTRADAY_INTERVAL 为交易时段内的轮询间隔 (秒)，0 表示关闭；
+        # 盘中使用的 Flex Query 见 _intraday_accounts (未配置时沿用各账户的日报 Query)
+        self.intraday_interval = float(self._setting('INTRADAY_INTERVAL', '0'))
+        self.intraday_accounts = self._intraday_accounts(flex_accounts)
+        # 相对基准的净资产变动超过金额或百分比阈值之一时提醒，设为0表示不使用该阈值
+        self.intraday_alert_abs = float(self._setting('INTRADAY_ALERT_ABS', '1000'))
+        self.intraday_alert_pct = float(self._setting('INTRADAY_ALERT_PCT', '1')) / 100
+        self.statement_cache = FlexStatementCache(
+            self._setting('FLEX_CACHE_DIR', str(Path(__file__).resolve().parent / 'flex_cache')),
+            max_bytes=int(float(self._setting('FLEX_CACHE_MAX_MB', '200')) * 1024 * 1024),
+            max_age_days=float(self._setting('FLEX_CACHE_MAX_AGE_DAYS', '30')),
+            clock=self.clock.time,
+        )
+        self.nav_store = nav_store or NavStore(
+            self._setting('NAV_DB_PATH', str(Path(__file__).resolve().parent / 'nav_history.sqlite3')))
+        # 报告货币: 各账户的 NAV/盈亏按报告日的汇率换算后再合并；未配置时使用第一个账户的基础货币
+        self.report_currency = (self._setting('REPORT_CURRENCY') or '').strip().upper() or None
+        self.fx_rates = fx_rates or FxRateTable(self.nav_store)
+        self._seed_nav_store_from_legacy_state()
+        self.dispatcher = dispatcher or NotificationDispatcher(
+            bark_url=self._setting('BARK_URL'),
+            telegram_bot_token=self._setting('TELEGRAM_BOT_TOKEN'),
+            telegram_chat_ids=(self._setting('TELEGRAM_CHAT_IDS') or '').split(','),
+            telegram_api_base=self._setting('TELEGRAM_API_BASE'),
+        )
+        self.outbox = NotificationOutbox(
+            self._setting('NOTIFY_OUTBOX_PATH', str(Path(__file__).resolve().parent / 'notification_outbox.jsonl')), self.dispatcher,
+            clock=self.clock.time)
+
+        # 指标: METRICS_PORT=0 关闭 HTTP 接口，METRICS_DUMP_INTERVAL=0 关闭 JSON Lines 快照
+        metrics_port = int(self._setting('METRICS_PORT', '9108'))
+        self.metrics_server = MetricsServer(self._setting('METRICS_HOST', '127.0.0.1'), metrics_port) if metrics_port else None
+        dump_interval = float(self._setting('METRICS_DUMP_INTERVAL', '300'))
+        self.metrics_dumper = MetricsDumper(
+            self._setting('METRICS_JSONL_PATH', str(Path(__file__).resolve().parent / 'metrics.jsonl')), interval=dump_interval,
+        ) if dump_interval > 0 else None
+
+    def _setting(self, name, default=None):
+        """读取配置项: 优先使用构造时传入的 config，其次是环境变量"""
+        if self.config.get(name) is not None:
+            return self.config[name]
+        return os.getenv(name, default)
+
     def load_state(self):
-        """从 JSON 文件加载状态，并兼容旧结构"""
+        """
+        从快照 (tracker_state.json) 加载状态并重放其后的日志，并兼容旧结构。
+        快照损坏或无法读取时记录错误并抛出异常停止运行，不会以空状态继续 (否则下次压缩会覆盖掉原有状态)。
+        """
+        if self.state_file_path.exists():
+            logging.info("成功加载 tracker_state.json 文件。")
+        else:
+            logging.info("tracker_state.json 文件不存在，将使用初始状态启动。")
         try:
-            if self.state_file_path.exists():
-                with open(self.state_file_path, 'r', encoding='utf-8') as f:
-                    self.state = json.load(f)
-                    logging.info("成功加载 tracker_state.json 文件。")
-            else:
-                logging.info("tracker_state.json 文件不存在，将使用初始状态启动。")
-                self.state = {}
-            
-            # 兼容性检查：确保新结构的关键字段存在
-            if 'last_report_details' not in self.state:
-                self.state['last_report_details'] = None
-            if 'weekly_start_nav' not in self.state:
-                self.state['weekly_start_nav'] = 0.0
-            if 'monthly_start_nav' not in self.state:
-                 self.state['monthly_start_nav'] = 0.0
-            
-        except (json.JSONDecodeError, IOError) as e:
-            logging.error(f"加载 state 文件失败: {e}，将使用空的 state 继续。")
-            self.state = {}
+            self.state = self.state_store.load()
+        except (StateCorruptedError, OSError) as e:
+            logging.critical(f"加载 state 文件失败，停止运行: {e}")
+            raise
+
+        # 兼容性检查：确保新结构的关键字段存在
+        if 'last_report_details' not in self.state:
+            self.state['last_report_details'] = None
     
+    def _seed_nav_store_from_legacy_state(self):
+        """
+        旧版把本周/本月的基准保存在 tracker_state.json 的 weekly_*/monthly_* 字段中。NAV 历史库还是空的时，
+        用这些字段和最后一份日报合成本周/本月首个交易日的记录写入历史库，升级后的第一次周/月总结与旧版口径一致；
+        之后删除这些字段。
+        """
+        legacy_keys = [key for key in LEGACY_BASELINE_KEYS if key in self.state]
+        if not legacy_keys:
+            return
+        last = self.state.get('last_report_details')
+        if last and self.nav_store.currency(CONSOLIDATED_ACCOUNT) is None:
+            rows = self._legacy_baseline_rows(last)
+            self.nav_store.upsert_many(CONSOLIDATED_ACCOUNT, rows)
+            logging.info(f"NAV 历史库为空，已根据旧版状态中的周/月基准写入 {len(rows)} 条记录 (截至 {last['reportDate']})。")
+        for key in legacy_keys:
+            self.state.pop(key)
+        self.save_state()
+
+    def _legacy_baseline_rows(self, last):
+        """
+        由旧版的周/月基准 (期初净资产与截至最后一份日报的累计出入金) 合成 NAV 记录:
+        本周/本月首个交易日各一条 (跨度到下一条记录之前)，最后一份日报一条。区间盈亏与旧版公式
+        期末净资产 - 期初净资产 - 期间出入金 完全相同。
+        """
+        last_date = datetime.strptime(last['reportDate'], '%Y-%m-%d').date()
+        anchors = {}
+        for period_start, nav_key, deposits_key in ((last_date - timedelta(days=last_date.weekday()), 'weekly_start_nav', 'weekly_deposits'),
+                                                    (last_date.replace(day=1), 'monthly_start_nav', 'monthly_deposits')):
+            first_day = next(iter(self.calendar.trading_days(period_start, last_date)), None)
+            if first_day is None or first_day >= last_date or not self.state.get(nav_key):
+                continue
+            anchors[first_day] = (float(self.state[nav_key]), float(self.state.get(deposits_key) or 0.0))
+
+        rows = []
+        points = sorted(anchors.items()) + [(last_date, (last['startingValue'], last['depositsWithdrawals']))]
+        for (day, (starting, deposits)), (_, (next_starting, next_deposits)) in zip(points, points[1:]):
+            period_deposits = deposits - next_deposits
+            rows.append((day.isoformat(), starting, next_starting, next_starting - starting - period_deposits, period_deposits))
+        rows.append((last['reportDate'], last['startingValue'], last['endingValue'], last['mtm'], last['depositsWithdrawals']))
+        return rows
+
     def save_state(self):
-        """将当前状态保存到 JSON 文件"""
+        """只把发生变化的字段追加写入状态日志 (fsync)，日志累积到一定条数后原子地压缩为新快照"""
         try:
-            with open(self.state_file_path, 'w', encoding='utf-8') as f:
-                json.dump(self.state, f, indent=4, default=str) # 使用default=str处理date对象
+            self.state_store.save(self.state)
         except IOError as e:
             logging.error(f"保存 state 文件失败: {e}")
 
     def get_current_et_time(self):
         """获取当前美东时间"""
-        return datetime.now(self.et_timezone)
+        return self.clock.now(self.et_timezone)
         
-    def get_account_summary(self):
-        """获取账户摘要信息。"""
+    def _load_flex_accounts(self):
+        """
+        读取 Flex token/query 配置，返回 [(token, query_id, 盘中 query_id 或 None)]。
+        IB_FLEX_ACCOUNTS 格式为 token1:query1[:intraday_query1],token2:query2[:intraday_query2]，未配置时回退到单账户变量
+        """
+        accounts_str = self._setting('IB_FLEX_ACCOUNTS')
+        if not accounts_str:
+            return [(self._setting('IB_FLEX_TOKEN'), self._setting('IB_QUERY_ID'), None)]
+        accounts = []
+        for item in accounts_str.split(','):
+            item = item.strip()
+            if not item:
+                continue
+            token, _, rest = item.partition(':')
+            query_id, _, intraday_query_id = rest.partition(':')
+            accounts.append((token.strip(), query_id.strip(), intraday_query_id.strip() or None))
+        return accounts
+
+    def _intraday_accounts(self, flex_accounts):
+        """
+        盘中检查使用的 [(token, query_id)]: 优先使用 IB_FLEX_ACCOUNTS 中为该账户配置的盘中 Query，
+        其次是 INTRADAY_QUERY_ID，都没有时沿用日报 Query。
+        Flex Query 属于各自的 token，INTRADAY_QUERY_ID 只在单账户时生效，多账户时忽略并警告。
+        """
+        global_query_id = self._setting('INTRADAY_QUERY_ID')
+        if global_query_id and len(flex_accounts) > 1:
+            logging.warning("配置了多个 Flex 账户，INTRADAY_QUERY_ID 不会被使用；"
+                            "请在 IB_FLEX_ACCOUNTS 中按 token:query:intraday_query 为每个账户指定盘中 Query。")
+            global_query_id = None
+        return [(token, intraday_query_id or global_query_id or query_id)
+                for token, query_id, intraday_query_id in flex_accounts]
+
+    def _log_flex_exception(self, e):
+        """统一记录请求 IBKR 时的异常"""
+        if isinstance(e, requests.exceptions.Timeout):
+            logging.error("请求IBKR API超时。")
+        elif isinstance(e, requests.exceptions.HTTPError):
+            error_text = e.response.text[:200] if hasattr(e.response, 'text') else "无响应体" 
+            status_code_info = e.response.status_code if hasattr(e.response, 'status_code') else "无状态码"
+            logging.error(f"HTTP 错误: {status_code_info} - {error_text}")
+        else:
+            logging.error(f"获取账户信息时发生未知错误: {str(e)}", exc_info=True)
+
+    def _send_account_request(self, token, query_id):
+        """为单个账户发出 SendRequest，返回 ReferenceCode"""
         try:
-            params_send = {'t': self.flex_token, 'q': self.query_id, 'v': '3'}
-            response_send = requests.get(self.send_request_url, params=params_send, timeout=30)
-            response_send.raise_for_status()
-            
-            root_send = ET.fromstring(response_send.text)
-            status_send = root_send.findtext('Status') 
-            if status_send != 'Success':
-                error_message = root_send.findtext('ErrorMessage', "发送请求返回状态非Success，但无ErrorMessage")
-                logging.error(f"发送请求失败: {status_send} - {error_message}")
-                return None
-            
-            reference_code = root_send.findtext('ReferenceCode')
-            if not reference_code:
-                logging.error("发送请求成功，但响应中未找到有效的 ReferenceCode。")
+            return send_flex_request(self.send_request_url, token, query_id, limiter=self.flex_limiter)
+        except Exception as e:
+            self._log_flex_exception(e)
+            return None
+
+    def _read_cached_statements(self, sha256, sections=None):
+        """从缓存中的原始报告流式解析出全部 FlexStatement，解析失败返回 None"""
+        with self.statement_cache.open(sha256) as f:
+            return self._read_statements(f, sections)
+
+    def _read_statements(self, f, sections=None):
+        """从可 seek 的文件对象流式解析出全部 FlexStatement，ConversionRates 章节的汇率顺带存入汇率表；解析失败返回 None"""
+        rates = []
+        sections = dict(sections or {}, ConversionRates=lambda row: rates.append(conversion_rate(row)))
+        with PIPELINE_STAGE_SECONDS.time(stage='parse'):
+            try:
+                statements = parse_flex_statements(f, sections)
+            except ET.ParseError as e_parse:
+                f.seek(0)
+                problem_xml_text = f.read(500).decode('utf-8', errors='replace')
+                logging.error(f"XML 解析错误: {str(e_parse)}. 问题XML文本: {problem_xml_text}")
                 return None
+        self.fx_rates.add(rate for rate in rates if rate is not None)
+        return statements
+
+    def _statement_to_details(self, parsed_statement):
+        """把单个 FlexStatement 的解析结果转换为 account_details 字典"""
+        statement = parsed_statement['attrs']
             
-            time.sleep(30) 
+        raw_from_date_str = statement.get('fromDate') 
+        report_date_display = self.get_current_et_time().strftime("%Y-%m-%d")
+        if raw_from_date_str:
+            report_date_display = f"{raw_from_date_str[:4]}-{raw_from_date_str[4:6]}-{raw_from_date_str[6:]}"
 
-            params_get = {'t': self.flex_token, 'q': reference_code, 'v': '3'}
-            response_get = requests.get(self.get_statement_url, params=params_get, timeout=30)
-            response_get.raise_for_status()
+        change_in_nav = parsed_statement['ChangeInNAV']
+        if change_in_nav is None:
+            logging.error("未找到 ChangeInNAV 数据。")
+            return None 
             
-            xml_content = response_get.content
+        return {
+            'accountId': statement.get('accountId', ''),
+            'startingValue': float(change_in_nav.get('startingValue', 0)),
+            'endingValue': float(change_in_nav.get('endingValue', 0)),
+            'mtm': float(change_in_nav.get('mtm', 0)),
+            'depositsWithdrawals': float(change_in_nav.get('depositsWithdrawals', 0)),
+            # ChangeInNAV 以账户的基础货币计价
+            'currency': change_in_nav.get('currency') or LEGACY_CURRENCY,
+            'reportDate': report_date_display, 
+            'raw_from_date': raw_from_date_str,
+            'raw_to_date': statement.get('toDate') or raw_from_date_str,
+        }
+
+    def _parse_cached_statement(self, sha256):
+        """
+        从缓存中的原始报告流式解析出单个账户的 ChangeInNAV，开启归因时在同一遍解析中把持仓/成交/MTM 章节收集为列；
+        同一内容 (SHA-256 相同) 只解析一次；每个账户只在内存中保留最新一份解析结果。
+        """
+        parsed = self._parsed_details.get(sha256)
+        if parsed is not None:
+            return dict(parsed[0])
+        columns = StatementColumns() if self.attribution_top_n > 0 else None
+        statements = self._read_cached_statements(sha256, columns.sections() if columns is not None else None)
+        if statements is None:
+            return None
+        if not statements:
+            logging.error("响应XML中未找到 FlexStatement 节点。")
+            return None
+        details = self._statement_to_details(statements[0])
+        if details is None:
+            return None
+        details['sha256'] = sha256
+        for cached_sha256, (cached_details, _) in list(self._parsed_details.items()):
+            if cached_details['accountId'] == details['accountId']:
+                del self._parsed_details[cached_sha256]
+        self._parsed_details[sha256] = (details, columns.attribution() if columns is not None else None)
+        return dict(details)
+
+    def _parse_spooled_statement(self, statement):
+        """解析暂存在临时文件中的盘中报告，只取第一个 FlexStatement 的 ChangeInNAV (不收集归因，也不缓存解析结果)"""
+        statements = self._read_statements(statement.file)
+        if statements is None:
+            return None
+        if not statements:
+            logging.error("响应XML中未找到 FlexStatement 节点。")
+            return None
+        return self._statement_to_details(statements[0])
+
+    def _statement_attribution(self, sha256):
+        """某份报告按标的汇总的归因，已解析过的直接取内存中的结果；报告已不在缓存中时返回 None"""
+        if sha256 not in self._parsed_details:
             try:
-                root_get = ET.fromstring(xml_content) 
-            except ET.ParseError as e_parse:
-                problem_xml_text = xml_content.decode('utf-8', errors='replace')[:500]
-                logging.error(f"XML 解析错误: {str(e_parse)}. 问题XML文本: {problem_xml_text}")
+                if self._parse_cached_statement(sha256) is None:
+                    return None
+            except (OSError, EOFError) as e:
+                logging.warning(f"读取缓存报告失败: {e}，跳过持仓归因。")
                 return None
+        return self._parsed_details[sha256][1]
+
+    def _report_attribution(self, details):
+        """合并各账户报告的持仓归因并按日期写入 NAV 历史库；未开启归因或报告中没有相关章节时返回 None"""
+        if self.attribution_top_n <= 0:
+            return None
+        attributions = []
+        for account in details.get('accounts', []):
+            attribution = self._statement_attribution(account['sha256']) if account.get('sha256') else None
+            if attribution is not None:
+                # MTMPerformanceSummaryInBase 与持仓市值以账户基础货币计价，先换算为报告货币再合并
+                attributions.append(attribution.scaled(account.get('fxRate', 1.0)))
+        attribution = Attribution.merge(attributions)
+        if not len(attribution):
+            return None
+        self.nav_store.record_attribution(details['reportDate'], attribution.symbols, attribution.pnl, attribution.value)
+        return attribution
 
-            error_code = root_get.findtext('ErrorCode')
-            if error_code:
-                error_message_get = root_get.findtext('ErrorMessage', "报告获取返回错误码，但无ErrorMessage")
-                logging.error(f"获取报告时遇到问题: ErrorCode {error_code} - {error_message_get}")
-                if error_code in ['1018', '1019', '1020']: 
-                     logging.info("报告尚未准备好 (错误码 %s)，将由主循环重试。", error_code)
+    def _format_attribution(self, attribution, currency):
+        """归因区块: 贡献/拖累最大的前 N 个标的，以及持仓集中度"""
+        gainers, losers = attribution.top(self.attribution_top_n)
+        lines = []
+        if gainers:
+            lines.append("贡献最大: " + " | ".join(f"{symbol} +{format_money(pnl, currency)}" for symbol, pnl in gainers))
+        if losers:
+            lines.append("拖累最大: " + " | ".join(f"{symbol} -{format_money(abs(pnl), currency)}" for symbol, pnl in losers))
+        concentration = attribution.concentration(self.attribution_top_n)
+        if concentration is not None:
+            lines.append(f"持仓集中度: 前{concentration['top_n']}大占 {concentration['top_share']:.1%} | HHI {concentration['hhi']:.3f}")
+        return ''.join(f"\n{line}" for line in lines)
+
+    def _new_poll(self, token, reference_code):
+        """defer_polls 时为一个 ReferenceCode 建立轮询状态，参数与 _download_statement 相同"""
+        return FlexPoll(
+            self.get_statement_url, token, reference_code,
+            deadline_seconds=self.poll_deadline_seconds,
+            initial_delay=self.readiness_stats.suggested_initial_delay(default=self.poll_initial_delay),
+            stats=self.readiness_stats,
+            stream=True,
+            limiter=self.flex_limiter,
+        )
+
+    def _download_statement(self, token, reference_code):
+        """轮询 GetStatement 并把原始报告流式写入缓存，返回其 SHA-256；截止时间内未就绪返回 None"""
+        reader = self._poll_statement(token, reference_code)
+        return None if reader is None else self._store_statement(reader)
+
+    def _poll_statement(self, token, reference_code):
+        """在调用线程中轮询 GetStatement，返回就绪报告的响应流 (StreamReader)；截止时间内未就绪返回 None"""
+        return poll_flex_statement(
+            self.get_statement_url, token, reference_code,
+            deadline_seconds=self.poll_deadline_seconds,
+            initial_delay=self.readiness_stats.suggested_initial_delay(default=self.poll_initial_delay),
+            stats=self.readiness_stats,
+            stream=True,
+            limiter=self.flex_limiter,
+        )
+
+    def _store_statement(self, reader):
+        """把就绪报告的响应流写入缓存并返回 SHA-256"""
+        with reader, PIPELINE_STAGE_SECONDS.time(stage='download'):
+            return self.statement_cache.store(reader)
+
+    def _spool_statement(self, reader):
+        """盘中报告不写入缓存: 读入临时文件 (较小时只在内存中) 并计算去掉 whenGenerated 之后的指纹"""
+        with reader, PIPELINE_STAGE_SECONDS.time(stage='download'):
+            return SpooledStatement(reader)
+
+    @staticmethod
+    def _discard_downloads(results):
+        """放弃一轮中已经下载的报告，盘中报告的临时文件随即删除"""
+        for result in results:
+            if isinstance(result, SpooledStatement):
+                result.close()
+
+    def _map(self, fn, items):
+        """
+        在 self.executor 中并发执行 fn 并按顺序返回结果。轮到时仍未开始的任务由调用线程自己执行，
+        因此在守护进程的共享线程池内调用时，即使线程池已被占满也不会因等待子任务而死锁。
+        """
+        items = list(items)
+        futures = [self.executor.submit(fn, item) for item in items[1:]]
+        results = [fn(item) for item in items[:1]]
+        results.extend(fn(item) if future.cancel() else future.result() for future, item in zip(futures, items[1:]))
+        return results
+
+    def _download_statements(self, kind, accounts, consume=None):
+        """
+        为各账户并发发出 SendRequest、收取 GetStatement 并把报告写入缓存，返回各账户报告的 SHA-256；任一账户失败返回 None。
+        给出 consume 时改为用 consume(响应流) 处理就绪的报告并返回其结果 (盘中查询用 _spool_statement，不写入缓存)。
+        defer_polls 时每次调用只为已到期的 ReferenceCode 请求一次 GetStatement，仍有报告未就绪时返回 None 并保留本轮状态，
+        _pending_poll_delay(kind) 给出应在多少秒后再次调用。
+        """
+        def download(args):
+            try:
+                if consume is None:
+                    return self._download_statement(*args)
+                reader = self._poll_statement(*args)
+                return None if reader is None else consume(reader)
+            except Exception as e:
+                self._log_flex_exception(e)
                 return None
 
-            statement = root_get.find('.//FlexStatements/FlexStatement')
-            if statement is None:
-                logging.error("响应XML中未找到 FlexStatement 节点。")
+        if not self.defer_polls:
+            reference_codes = self._map(lambda account: self._send_account_request(*account), accounts)
+            if any(code is None for code in reference_codes):
                 return None
-                
-            raw_from_date_str = statement.get('fromDate') 
-            report_date_display = self.get_current_et_time().strftime("%Y-%m-%d")
-            if raw_from_date_str:
-                report_date_display = f"{raw_from_date_str[:4]}-{raw_from_date_str[4:6]}-{raw_from_date_str[6:]}"
-
-            change_in_nav = statement.find('ChangeInNAV')
-            if change_in_nav is None:
-                logging.error("未找到 ChangeInNAV 数据。")
-                return None 
-                
-            account_details = {
-                'startingValue': float(change_in_nav.get('startingValue', 0)),
-                'endingValue': float(change_in_nav.get('endingValue', 0)),
-                'mtm': float(change_in_nav.get('mtm', 0)),
-                'depositsWithdrawals': float(change_in_nav.get('depositsWithdrawals', 0)),
-                'reportDate': report_date_display, 
-                'raw_from_date': raw_from_date_str 
-            }
-            logging.info(f"成功获取并解析账户数据，报告日期: {report_date_display}")
+            results = self._map(download, [(token, code) for (token, _), code in zip(accounts, reference_codes)])
+            if any(result is None for result in results):
+                self._discard_downloads(results)
+                return None
+            return results
+
+        consume = consume or self._store_statement
+        poll_round = self._poll_rounds.get(kind)
+        if poll_round is not None and any(poll.is_stale() for poll in poll_round['polls'].values()):
+            logging.info("上一轮报告轮询已被放弃，重新发出请求。")
+            self._discard_downloads(self._poll_rounds.pop(kind)['hashes'].values())
+            poll_round = None
+        if poll_round is None:
+            poll_round = self._poll_rounds[kind] = {'polls': {}, 'hashes': {}}
+        polls, hashes = poll_round['polls'], poll_round['hashes']
+
+        new_accounts = [account for account in accounts if account not in polls and account not in hashes]
+        reference_codes = self._map(lambda account: self._send_account_request(*account), new_accounts)
+        if any(code is None for code in reference_codes):
+            self._discard_downloads(self._poll_rounds.pop(kind)['hashes'].values())
+            return None
+        polls.update((account, self._new_poll(account[0], code)) for account, code in zip(new_accounts, reference_codes))
+
+        def attempt(account):
+            poll = polls[account]
+            try:
+                if not poll.attempt():
+                    return False, None
+                return True, None if poll.result is None else consume(poll.result)
+            except Exception as e:
+                self._log_flex_exception(e)
+                return True, None
+
+        due = [account for account, poll in polls.items() if poll.remaining_delay() <= 0]
+        attempts = self._map(attempt, due)
+        if any(finished and result is None for finished, result in attempts):
+            self._discard_downloads([result for _, result in attempts])
+            self._discard_downloads(self._poll_rounds.pop(kind)['hashes'].values())
+            return None
+        for account, (finished, result) in zip(due, attempts):
+            if finished:
+                del polls[account]
+                hashes[account] = result
+        if polls:
+            return None
+        del self._poll_rounds[kind]
+        return [hashes[account] for account in accounts]
+
+    def _pending_poll_delay(self, kind):
+        """defer_polls 时本轮仍有报告未就绪则返回距下一次应继续轮询的秒数，否则返回 None"""
+        poll_round = self._poll_rounds.get(kind)
+        if poll_round is None or not poll_round['polls']:
+            return None
+        return min(poll.remaining_delay() for poll in poll_round['polls'].values())
+
+    def _load_account_details(self, token, query_id, sha256):
+        """从缓存流式解析单个账户的 ChangeInNAV，并把报告登记到缓存索引"""
+        try:
+            account_details = self._parse_cached_statement(sha256)
+            if account_details is None:
+                return None
+
+            self.statement_cache.record(
+                FlexStatementCache.make_key(token, query_id), sha256,
+                account_details['raw_from_date'], account_details['raw_to_date'], account_details['accountId'],
+            )
+            logging.info(f"成功获取并解析账户 {account_details['accountId']} 数据，报告日期: {account_details['reportDate']}")
             return account_details
             
-        except requests.exceptions.Timeout:
-            logging.error("请求IBKR API超时。")
+        except Exception as e:
+            self._log_flex_exception(e)
             return None
-        except requests.exceptions.HTTPError as e:
-            error_text = e.response.text[:200] if hasattr(e.response, 'text') else "无响应体" 
-            status_code_info = e.response.status_code if hasattr(e.response, 'status_code') else "无状态码"
-            logging.error(f"HTTP 错误: {status_code_info} - {error_text}")
+
+    def _hunt_start_time(self, day):
+        """某个交易日开始获取数据的时间 (收盘前1分钟，ET)；非交易日返回 None"""
+        close_dt = self.calendar.close_datetime(day)
+        if close_dt is None:
             return None
-        except Exception as e:
-            logging.error(f"获取账户信息时发生未知错误: {str(e)}", exc_info=True)
+        return close_dt - timedelta(minutes=1)
+
+    def _expected_statement_date(self):
+        """当前时刻 IBKR 能提供的最新完整报告日期 (YYYYMMDD): 交易日收盘前1分钟之后为当天，否则为上一个交易日"""
+        now_et = self.get_current_et_time()
+        today = now_et.date()
+        hunt_start = self._hunt_start_time(today)
+        if hunt_start is not None and now_et >= hunt_start:
+            return today.strftime('%Y%m%d')
+        return self.calendar.previous_trading_day(today).strftime('%Y%m%d')
+
+    def _cached_account_details(self, token, query_id, expected_date):
+        """如果缓存中已有覆盖到 expected_date 的完整报告，直接从缓存解析，避免请求 IBKR"""
+        entry = self.statement_cache.lookup(FlexStatementCache.make_key(token, query_id), expected_date)
+        CACHE_LOOKUPS.inc(result='miss' if entry is None else 'hit')
+        if entry is None:
+            return None
+        try:
+            account_details = self._parse_cached_statement(entry['sha256'])
+        except (OSError, EOFError) as e:
+            logging.warning(f"读取缓存报告失败: {e}，改为重新请求 IBKR。")
+            return None
+        if account_details is not None:
+            logging.info(f"账户 {account_details['accountId']} 报告 ({entry['toDate']}) 命中本地缓存，跳过 IBKR 请求。")
+        return account_details
+
+    def _consolidate_accounts(self, accounts_details):
+        """把各账户的 ChangeInNAV 合并为一份汇总，并在 'accounts' 中保留分账户明细"""
+        from_dates = {d['raw_from_date'] for d in accounts_details}
+        if len(from_dates) > 1:
+            logging.warning(f"各账户报告日期不一致 ({', '.join(sorted(str(d) for d in from_dates))})，等待下次重试。")
+            return None
+        first = accounts_details[0]
+        currency = self.report_currency or first['currency']
+        accounts_details = [dict(d, fxRate=self._report_fx_rate(d, currency)) for d in accounts_details]
+        if any(d['fxRate'] is None for d in accounts_details):
+            return None
+        consolidated = {
+            key: sum(d[key] * d['fxRate'] for d in accounts_details)
+            for key in ('startingValue', 'endingValue', 'mtm', 'depositsWithdrawals')
+        }
+        consolidated['currency'] = currency
+        consolidated['reportDate'] = first['reportDate']
+        consolidated['raw_from_date'] = first['raw_from_date']
+        # 分账户明细保留基础货币的原始数值 (写入 NAV 历史库)，fxRate 为换算到报告货币的汇率
+        consolidated['accounts'] = accounts_details
+        return consolidated
+
+    def _report_fx_rate(self, account_details, currency):
+        """账户基础货币在报告日换算为报告货币的汇率；汇率表中查不到时记录错误并返回 None (本轮不生成报告，按 1:1 合并会得到错误的合计)"""
+        rate = self.fx_rates.rate(account_details['currency'], currency, account_details['reportDate'])
+        if rate is None:
+            logging.error(f"汇率表中没有 {account_details['reportDate']} 及之前的 {account_details['currency']}→{currency} 汇率 "
+                          f"(请在 Flex Query 中勾选 Conversion Rates)，账户 {account_details['accountId']} 无法换算，本轮跳过。")
+        return rate
+
+    def _record_report(self, details):
+        """写入 NAV 历史库；报告货币与库中合并记录的货币不同时，先把历史合并记录批量换算为新的报告货币"""
+        stored_currency = self.nav_store.currency(CONSOLIDATED_ACCOUNT)
+        if stored_currency is not None and stored_currency != details['currency']:
+            logging.info(f"报告货币由 {stored_currency} 改为 {details['currency']}，重新换算 NAV 历史。")
+            self.convert_history(details['currency'])
+        self.nav_store.record_report(details)
+
+    def convert_history(self, currency):
+        """
+        把 NAV 历史库中的合并记录 (TOTAL) 整体换算为 currency，汇率查询对整段历史一次完成，返回换算后的天数:
+        有分账户记录的日期按各分账户的基础货币与当天汇率换算后求和重建；只有合并记录的日期 (例如由旧版状态迁移的记录)
+        按原合并货币与当天汇率换算。查不到汇率的日期不能与其他货币的记录混在一起统计，移到归档账户下保留。
+        """
+        stored_currency = self.nav_store.currency(CONSOLIDATED_ACCOUNT) or currency
+        series = [(self.nav_store.currency(account), self.nav_store.series(account)) for account in self.nav_store.accounts()]
+        records, missing = self.fx_rates.consolidate(series, currency)
+        covered = {record[0] for record in records}.union(missing)
+        total_only = [row for row in self.nav_store.series() if row[0] not in covered]
+        converted, total_only_missing = self.fx_rates.consolidate([(stored_currency, total_only)], currency)
+        records = sorted(records + converted)
+        missing = sorted(set(missing).union(total_only_missing))
+
+        if missing:
+            archived = self.nav_store.archive(CONSOLIDATED_ACCOUNT, missing, stored_currency)
+            logging.error(f"NAV 历史中有 {len(missing)} 天 ({missing[0]} ~ {missing[-1]}) 查不到换算为 {currency} 的汇率，"
+                          f"已把其中 {archived} 条合并记录移到归档账户 (原货币 {stored_currency})，这些天不再计入周/月总结与历史表现。")
+        if records:
+            self.nav_store.upsert_many(CONSOLIDATED_ACCOUNT, records)
+        if records or missing:
+            self.nav_store.set_currency(CONSOLIDATED_ACCOUNT, currency)
+        logging.info(f"已把 {len(series)} 个账户与 {len(converted)} 天仅有合并记录的 NAV 历史换算为 {currency}，共 {len(records)} 天。")
+        return len(records)
+
+    def get_account_summary(self, cache_only=False):
+        """
+        获取账户摘要信息。已完整缓存的账户直接读缓存；其余账户先并发发出所有 SendRequest，再并发收取各自的 GetStatement。
+        defer_polls 时报告尚未全部就绪也返回 None，可用 _pending_poll_delay('daily') 区分。
+        cache_only=True 时不请求 IBKR，有账户未缓存就返回 None。
+        """
+        accounts = self.flex_accounts
+        expected_date = self._expected_statement_date()
+        accounts_details = [self._cached_account_details(token, query_id, expected_date) for token, query_id in accounts]
+        missing = [i for i, details in enumerate(accounts_details) if details is None]
+
+        if missing and cache_only:
+            logging.info(f"{len(missing)} 个账户在缓存中没有 {expected_date} 的报告，本次不请求 IBKR。")
             return None
+        if missing:
+            with PIPELINE_STAGE_SECONDS.time(stage='fetch_all_accounts'):
+                hashes = self._download_statements('daily', [accounts[i] for i in missing])
+            if hashes is None:
+                return None
+            for i, sha256 in zip(missing, hashes):
+                accounts_details[i] = self._load_account_details(*accounts[i], sha256)
 
-    def _send_summary_notification(self, period_type, pl_value, date_obj):
-        """负责发送格式化的总结通知"""
+            self.state['flex_readiness_samples'] = self.readiness_stats.samples
+            logging.info(f"报告就绪耗时统计: {self.readiness_stats.summary()}")
+
+        if any(d is None for d in accounts_details):
+            return None
+        return self._consolidate_accounts(accounts_details)
+
+    def _send_summary_notification(self, period_type, date_obj):
+        """基于 NAV 时间序列库计算周/月盈亏，并发送格式化的总结通知"""
+        end_date = date_obj.isoformat()
+        if period_type == "week":
+            start_date = (date_obj - timedelta(days=date_obj.weekday())).isoformat()
+        elif period_type == "month":
+            start_date = date_obj.replace(day=1).isoformat()
+        else:
+            return
+
+        summary = self.nav_store.period(start_date, end_date)
+        if summary is None:
+            logging.warning(f"NAV 历史中没有 {start_date} ~ {end_date} 的数据，跳过{period_type}总结。")
+            return
+        pl_value = summary['pl']
         verb = "上涨" if pl_value >= 0 else "下跌"
+        currency = self.nav_store.currency(CONSOLIDATED_ACCOUNT) or LEGACY_CURRENCY
         
+        period_metrics = compute_metrics(self.nav_store.series(start_date=start_date, end_date=end_date))
         if period_type == "week":
             title = "📈 本周总结"
-            body = f"本周{verb}: ${pl_value:,.2f}"
-        elif period_type == "month":
-            title = f"🗓️ {date_obj.month}月总结"
-            body = f"{date_obj.month}月{verb}: ${pl_value:,.2f}"
+            body = f"本周{verb}: {format_money(pl_value, currency)} ({period_metrics['twr']:+.2%})"
         else:
-            return
+            title = f"🗓️ {date_obj.month}月总结"
+            body = f"{date_obj.month}月{verb}: {format_money(pl_value, currency)} ({period_metrics['twr']:+.2%})"
+            ytd_start = date_obj.replace(month=1, day=1).isoformat()
+            ytd = self.nav_store.period(ytd_start, end_date)
+            ytd_verb = "上涨" if ytd['pl'] >= 0 else "下跌"
+            ytd_metrics = compute_metrics(self.nav_store.series(start_date=ytd_start, end_date=end_date))
+            body += f"\n今年以来{ytd_verb}: {format_money(ytd['pl'], currency)} ({ytd_metrics['twr']:+.2%})"
+            body += f"\n最大回撤: {ytd_metrics['max_drawdown']:.2%} | 年化波动: {ytd_metrics['volatility']:.2%}"
+            if ytd_metrics['sharpe'] is not None:
+                body += f" | 夏普: {ytd_metrics['sharpe']:.2f}"
+
+        if summary['deposits'] != 0:
+            deposit_verb = "净入金" if summary['deposits'] > 0 else "净出金"
+            body += f"\n期间{deposit_verb}: {format_money(abs(summary['deposits']), currency)}"
+
+        if period_type == "week" and self.attribution_top_n > 0:
+            rows = self.nav_store.attribution(start_date, end_date)
+            if rows:
+                body += self._format_attribution(Attribution(*zip(*rows)), currency)
 
-        logging.info(f"准备发送总结通知: {title} | {body}")
+        logging.info(f"准备发送总结通知: {title} | {body.replace(chr(10), ' ')}")
         try:
-            send_bark_notification(title, body)
-            send_telegram_notification(title, body)
+            self.outbox.enqueue(f"{period_type}:{date_obj.isoformat()}", title, body, event_time=self._close_timestamp(date_obj))
         except Exception as e:
-            logging.error(f"发送总结通知失败: {e}", exc_info=True)
+            logging.error(f"总结通知写入发件箱失败: {e}", exc_info=True)
 
-    def send_daily_report(self):
-        """发送包含每日涨跌的日报，并独立判断是否需要发送即时的周/月总结报告"""
-        details = self.get_account_summary()
+    def _close_timestamp(self, day):
+        """某交易日收盘时间的 epoch 秒，用于统计收盘到推送的延迟；非交易日返回 None"""
+        close_dt = self.calendar.close_datetime(day)
+        return close_dt.timestamp() if close_dt is not None else None
+
+    def send_daily_report(self, cache_only=False):
+        """执行一轮获取/推送并记录结果计数"""
+        with PIPELINE_STAGE_SECONDS.time(stage='cycle'):
+            result = self._send_daily_report(cache_only)
+        TRACKER_CYCLES.inc(status=result['status'])
+        return result
+
+    def _send_daily_report(self, cache_only=False):
+        """发送包含每日涨跌的日报，并独立判断是否需要发送即时的周/月总结报告；cache_only 时只使用缓存中的报告"""
+        details = self.get_account_summary(cache_only)
+        if details is None and cache_only:
+            return {'status': 'skipped_non_trading_day'}
         if details is None:
+            retry_after = self._pending_poll_delay('daily')
+            if retry_after is not None:
+                return {'status': 'awaiting_statement', 'retry_after': retry_after}
             return {'status': 'error_fetching'}
             
         if abs(details.get('mtm', 0)) < 0.01:
@@ -219,23 +766,10 @@ class IBKRTracker:
             return {'status': 'no_notification_needed_duplicate'}
 
         if notify:
-            # --- 1. 更新状态（必须在所有计算之前） ---
+            # --- 1. 写入 NAV 历史（必须在所有计算之前；同一天重复写入会覆盖，不会重复累计） ---
             current_date = datetime.strptime(details['reportDate'], '%Y-%m-%d').date()
-            last_report = self.state.get('last_report_details')
-            last_date = datetime.strptime(last_report['reportDate'], '%Y-%m-%d').date() if last_report else None
-            
-            is_new_week = (last_date is None or current_date.isocalendar()[1] != last_date.isocalendar()[1] or current_date.year != last_date.year)
-            if is_new_week:
-                self.state['weekly_start_nav'] = details['startingValue']
-                self.state['weekly_deposits'] = 0.0
-            
-            is_new_month = (last_date is None or current_date.month != last_date.month or current_date.year != last_date.year)
-            if is_new_month:
-                self.state['monthly_start_nav'] = details['startingValue']
-                self.state['monthly_deposits'] = 0.0
-
-            self.state['weekly_deposits'] = self.state.get('weekly_deposits', 0) + details['depositsWithdrawals']
-            self.state['monthly_deposits'] = self.state.get('monthly_deposits', 0) + details['depositsWithdrawals']
+            self._record_report(details)
+            attribution = self._report_attribution(details)
 
             # --- 2. 发送常规日报 ---
             self.last_notified_raw_fromdate = current_raw_fromdate
@@ -250,29 +784,38 @@ class IBKRTracker:
             
             title = f"{change_text} IB {details['reportDate']} 日报"
             
-            message = f"{change_display}: ${net_change:,.2f}\n净资产: ${details['endingValue']:,.2f}"
+            currency = details['currency']
+            message = f"{change_display}: {format_money(net_change, currency)}\n净资产: {format_money(details['endingValue'], currency)}"
             
             if details['depositsWithdrawals'] != 0:
                 verb = "入金" if details['depositsWithdrawals'] > 0 else "出金"
-                message += f"\n{verb}: ${abs(details['depositsWithdrawals']):,.2f}"
+                message += f"\n{verb}: {format_money(abs(details['depositsWithdrawals']), currency)}"
+
+            if len(details.get('accounts', [])) > 1:
+                for account in details['accounts']:
+                    account_display = "涨" if account['mtm'] >= 0 else "跌"
+                    message += (f"\n{account['accountId']}: {account_display} {format_money(account['mtm'] * account['fxRate'], currency)}"
+                                f" | 净资产 {format_money(account['endingValue'] * account['fxRate'], currency)}")
+                    if account['currency'] != currency:
+                        message += f" ({format_money(account['endingValue'], account['currency'])})"
+            elif details['accounts'][0]['currency'] != currency:
+                message += f"\n({format_money(details['accounts'][0]['endingValue'], details['accounts'][0]['currency'])})"
+
+            if attribution is not None:
+                message += self._format_attribution(attribution, currency)
 
             logging.info(f"准备发送常规日报: {title} | {message.replace(chr(10), ' ')}")
             try:
-                send_bark_notification(title, message)
-                send_telegram_notification(title, message)
+                self.outbox.enqueue(f"daily:{current_raw_fromdate}", title, message, event_time=self._close_timestamp(current_date))
             except Exception as e:
-                logging.error(f"发送常规日报失败: {e}", exc_info=True)
+                logging.error(f"常规日报写入发件箱失败: {e}", exc_info=True)
 
-            # --- 3. 判断是否为最后交易日，并独立发送总结报告 ---
-            next_day = current_date + timedelta(days=1)
-            
-            if next_day.weekday() == 5: # 如果明天是周六 (weekday 5)，说明今天是周五
-                weekly_pl = details['endingValue'] - self.state['weekly_start_nav'] - self.state['weekly_deposits']
-                self._send_summary_notification("week", weekly_pl, current_date)
+            # --- 3. 根据交易日历判断是否为本周/本月最后一个交易日，并独立发送总结报告 ---
+            if self.calendar.is_last_trading_day_of_week(current_date):
+                self._send_summary_notification("week", current_date)
 
-            if next_day.month != current_date.month: # 如果明天是新的月份
-                monthly_pl = details['endingValue'] - self.state['monthly_start_nav'] - self.state['monthly_deposits']
-                self._send_summary_notification("month", monthly_pl, current_date)
+            if self.calendar.is_last_trading_day_of_month(current_date):
+                self._send_summary_notification("month", current_date)
 
             # --- 4. 最后，更新状态并保存 ---
             self.state['last_report_details'] = details
@@ -282,63 +825,264 @@ class IBKRTracker:
         
         return {'status': 'no_notification_needed', 'data_date': details['reportDate']}
 
+    def check_intraday(self):
+        """
+        盘中检查一次净资产。盘中报告不写入报告缓存，只暂存在临时文件中；报告内容去掉每次生成都会变化的 whenGenerated 后
+        的指纹与上次相同时直接返回，不解析 XML 也不写状态；
+        内容变化时才解析 ChangeInNAV，净资产相对基准 (当天首次为昨收，之后为上次提醒时的净资产，剔除期间出入金)
+        的变动超过 INTRADAY_ALERT_ABS 或 INTRADAY_ALERT_PCT 时发送提醒，并把基准移到当前净资产。
+        """
+        statements = self._download_statements('intraday', self.intraday_accounts, consume=self._spool_statement)
+        if statements is None:
+            retry_after = self._pending_poll_delay('intraday')
+            if retry_after is not None:
+                return {'status': 'awaiting_statement', 'retry_after': retry_after}
+            INTRADAY_CHECKS.inc(result='error')
+            return {'status': 'error_fetching'}
+
+        intraday = dict(self.state.get('intraday') or {})
+        hashes = [statement.fingerprint for statement in statements]
+        try:
+            if hashes == intraday.get('hashes'):
+                INTRADAY_CHECKS.inc(result='unchanged')
+                return {'status': 'unchanged'}
+            accounts_details = [self._parse_spooled_statement(statement) for statement in statements]
+        finally:
+            self._discard_downloads(statements)
+        details = None if any(d is None for d in accounts_details) else self._consolidate_accounts(accounts_details)
+        if details is None:
+            INTRADAY_CHECKS.inc(result='error')
+            return {'status': 'error_parsing'}
+        intraday['hashes'] = hashes
+
+        current_raw_fromdate = details['raw_from_date']
+        if not current_raw_fromdate or (self.last_notified_raw_fromdate and current_raw_fromdate <= self.last_notified_raw_fromdate):
+            # 与日报相同的日期去重: 盘中查询返回的仍是已推送过日报的日期，说明当天的数据尚未生成
+            logging.info(f"盘中报告日期 ({current_raw_fromdate}) 不晚于已推送的日报，跳过。")
+            self.state['intraday'] = intraday
+            self.save_state()
+            INTRADAY_CHECKS.inc(result='stale')
+            return {'status': 'stale'}
+
+        if intraday.get('date') != current_raw_fromdate:
+            intraday.update(date=current_raw_fromdate, baseline=details['startingValue'], baseline_deposits=0.0, baseline_label="昨收")
+
+        nav = details['endingValue']
+        change = nav - intraday['baseline'] - (details['depositsWithdrawals'] - intraday['baseline_deposits'])
+        change_pct = change / intraday['baseline'] if intraday['baseline'] else 0.0
+        exceeded = ((self.intraday_alert_abs > 0 and abs(change) >= self.intraday_alert_abs)
+                    or (self.intraday_alert_pct > 0 and abs(change_pct) >= self.intraday_alert_pct))
+
+        result = {'status': 'below_threshold', 'change': change}
+        if exceeded:
+            verb = "上涨" if change >= 0 else "下跌"
+            title = f"{'🚀' if change >= 0 else '⚠️'} IB 盘中{verb}提醒"
+            message = (f"较{intraday['baseline_label']}{verb}: {format_money(abs(change), details['currency'])} ({change_pct:+.2%})"
+                       f"\n净资产: {format_money(nav, details['currency'])}")
+            logging.info(f"准备发送盘中提醒: {title} | {message.replace(chr(10), ' ')}")
+            try:
+                self.outbox.enqueue(f"intraday:{current_raw_fromdate}:{'-'.join(h[:8] for h in hashes)}", title, message)
+            except Exception as e:
+                logging.error(f"盘中提醒写入发件箱失败: {e}", exc_info=True)
+            intraday.update(baseline=nav, baseline_deposits=details['depositsWithdrawals'],
+                            baseline_label=f"{self.get_current_et_time().strftime('%H:%M')} 提醒时")
+            result['status'] = 'alert_sent'
+        else:
+            logging.info(f"盘中净资产 {format_money(nav, details['currency'])}，较{intraday['baseline_label']}变动 "
+                         f"{format_money(change, details['currency'])} ({change_pct:+.2%})，未超过阈值。")
+
+        self.state['intraday'] = intraday
+        self.save_state()
+        INTRADAY_CHECKS.inc(result='alert' if exceeded else 'changed')
+        return result
+
+    def backfill(self, start_date, end_date, chunk_days=365):
+        """
+        按区间分段请求多日 Flex 报告 (需要 Flex Query 按日拆分输出 FlexStatement)，批量写入 NAV 历史库。
+        start_date/end_date 为 date 对象；每段不超过 chunk_days 天 (IBKR 单次上限365天)。返回写入的合并日记录数。
+        """
+        per_account = {}
+        chunk_start = start_date
+        while chunk_start <= end_date:
+            chunk_end = min(end_date, chunk_start + timedelta(days=chunk_days - 1))
+            logging.info(f"回填 {chunk_start} ~ {chunk_end} ...")
+            for token, query_id in self.flex_accounts:
+                statements = self._fetch_statements_for_range(token, query_id, chunk_start, chunk_end)
+                if statements is None:
+                    raise RuntimeError(f"回填 {chunk_start} ~ {chunk_end} 失败，请查看日志后重试。")
+                for parsed_statement in statements:
+                    details = self._statement_to_details(parsed_statement)
+                    if details is None:
+                        continue
+                    if details['raw_from_date'] != details['raw_to_date']:
+                        logging.warning(f"FlexStatement {details['raw_from_date']}~{details['raw_to_date']} 跨越多日，"
+                                        f"将整体记在 {details['raw_to_date']}；请把 Flex Query 设置为按日拆分。")
+                        to_date = details['raw_to_date']
+                        details['reportDate'] = f"{to_date[:4]}-{to_date[4:6]}-{to_date[6:]}"
+                    per_account.setdefault(details['accountId'], {})[details['reportDate']] = details
+            chunk_start = chunk_end + timedelta(days=1)
+
+        # 与日报相同，按日期判断非交易日: 只有当天所有账户都没有市值变动和出入金时才整天跳过；
+        # 否则保留每个账户当天的记录 (包括没有变动的账户)，合并记录的净资产才不会因缺少某个账户而跳变
+        active_dates = {
+            report_date for days in per_account.values() for report_date, d in days.items()
+            if abs(d['mtm']) >= 0.01 or d['depositsWithdrawals'] != 0
+        }
+        per_account = {account_id: {report_date: d for report_date, d in days.items() if report_date in active_dates}
+                       for account_id, days in per_account.items()}
+        per_account = {account_id: days for account_id, days in per_account.items() if days}
+
+        report_dates = set()
+        currency = self.report_currency
+        for account_id, days in per_account.items():
+            # 分账户记录保存基础货币的原始数值，合并记录在全部写入后按报告货币整体重建
+            self.nav_store.upsert_many(account_id, [
+                (d['reportDate'], d['startingValue'], d['endingValue'], d['mtm'], d['depositsWithdrawals'])
+                for d in days.values()
+            ])
+            self.nav_store.set_currency(account_id, next(iter(days.values()))['currency'])
+            currency = currency or next(iter(days.values()))['currency']
+            report_dates.update(days)
+        if currency is not None:
+            self.convert_history(currency)
+        logging.info(f"回填完成: {len(per_account)} 个账户，共 {len(report_dates)} 个交易日。")
+        return len(report_dates)
+
+    def _fetch_statements_for_range(self, token, query_id, from_date, to_date):
+        """请求指定区间的 Flex 报告并返回全部 FlexStatement 的解析结果"""
+        try:
+            reference_code = send_flex_request(self.send_request_url, token, query_id,
+                                               from_date=from_date.strftime('%Y%m%d'), to_date=to_date.strftime('%Y%m%d'),
+                                               limiter=self.flex_limiter)
+            if not reference_code:
+                return None
+            reader = poll_flex_statement(
+                self.get_statement_url, token, reference_code,
+                deadline_seconds=self.poll_deadline_seconds,
+                initial_delay=self.readiness_stats.suggested_initial_delay(default=self.poll_initial_delay),
+                stream=True,
+                limiter=self.flex_limiter,
+            )
+            if reader is None:
+                return None
+            with reader:
+                sha256 = self.statement_cache.store(reader)
+            return self._read_cached_statements(sha256)
+        except Exception as e:
+            self._log_flex_exception(e)
+            return None
+
     def run(self):
         """运行主循环"""
-        logging.info(f"启动 IBKR 资产追踪器。当前本地时间: {datetime.now()}, 当前ET时间: {self.get_current_et_time().strftime('%Y-%m-%d %H:%M:%S %Z%z')}")
+        logging.info(f"启动 IBKR 资产追踪器。当前本地时间: {self.clock.now()}, 当前ET时间: {self.get_current_et_time().strftime('%Y-%m-%d %H:%M:%S %Z%z')}")
+        # 后台投递线程会先补发上次进程退出前未投递成功的通知
+        self.outbox.start()
+        if self.metrics_server is not None:
+            try:
+                self.metrics_server.start()
+            except OSError as e:
+                logging.error(f"指标服务启动失败 (端口 {self.metrics_server.port}): {e}，继续运行但不提供 HTTP 指标。")
+        if self.metrics_dumper is not None:
+            self.metrics_dumper.start()
         
         if self.initial_run_for_notification:
-            logging.info("脚本进程启动，立即尝试执行一次数据获取和首次通知...")
-            initial_report_result = self.send_daily_report()
-            logging.info(f"脚本进程启动时的首次尝试完成。状态: {initial_report_result.get('status', '未知')}")
+            self.run_initial()
 
         while True:
             try:
-                current_et_time = self.get_current_et_time()
-                is_workday = 0 <= current_et_time.weekday() <= 4 
-                is_time_to_start_hunt = (is_workday and (current_et_time.hour > 15 or (current_et_time.hour == 15 and current_et_time.minute >= 59)))
-
-                if not self.hunt_active_for_current_cycle and is_time_to_start_hunt:
-                    logging.info(f"工作日到达15:59 ET或之后。开始新的数据获取/推送轮询周期。")
-                    self.hunt_active_for_current_cycle = True
-                
-                if self.hunt_active_for_current_cycle:
-                    report_result = self.send_daily_report()
-                    if report_result['status'] == 'notification_sent':
-                        self.hunt_active_for_current_cycle = False 
-                        fetched_date_info = report_result.get('data_date', '未知')
-                        logging.info(f"成功发送通知 (报告实际日期: {fetched_date_info})。当前轮询周期结束。计算等待下一计划启动点。")
-                        
-                        sleep_duration = self._calculate_sleep_to_next_cycle(self.get_current_et_time())
-                        next_wakeup_time = datetime.now() + timedelta(seconds=sleep_duration)
-                        logging.info(f"将休眠约 {sleep_duration/3600:.2f} 小时，直到 {next_wakeup_time.strftime('%Y-%m-%d %H:%M:%S')}")
-                        time.sleep(sleep_duration)
-                    else: 
-                        logging.warning(f"数据获取尝试未发送通知 (状态: {report_result['status']})。将在10分钟后重试。")
-                        time.sleep(600)
-                else:
-                    sleep_duration = self._calculate_sleep_to_next_cycle(self.get_current_et_time())
-                    next_wakeup_time = datetime.now() + timedelta(seconds=sleep_duration)
-                    logging.info(f"轮询未激活。将休眠约 {sleep_duration/3600:.2f} 小时，直到 {next_wakeup_time.strftime('%Y-%m-%d %H:%M:%S')}")
-                    time.sleep(max(60, sleep_duration))
+                self.clock.sleep(self.run_once())
             except Exception as e:
                 logging.error(f"主循环发生意外错误: {str(e)}", exc_info=True)
                 logging.info("发生错误，休眠10分钟后重试主逻辑。")
-                time.sleep(600)
+                self.clock.sleep(600)
+
+    def run_initial(self):
+        """进程启动后立即尝试执行一次数据获取和首次通知；非交易日只使用缓存中的报告，不请求 IBKR"""
+        logging.info("脚本进程启动，立即尝试执行一次数据获取和首次通知...")
+        cache_only = not self.calendar.is_trading_day(self.get_current_et_time().date())
+        if cache_only:
+            logging.info("今天不是交易日，首次尝试只读取已缓存的报告。")
+        initial_report_result = self.send_daily_report(cache_only=cache_only)
+        logging.info(f"脚本进程启动时的首次尝试完成。状态: {initial_report_result.get('status', '未知')}")
+        return initial_report_result
+
+    def run_once(self):
+        """执行一次调度判断 (到点则获取数据并推送)，返回距下一次调用应等待的秒数；由 run() 或多租户守护进程调用"""
+        current_et_time = self.get_current_et_time()
+        hunt_start = self._hunt_start_time(current_et_time.date())
+        is_time_to_start_hunt = hunt_start is not None and current_et_time >= hunt_start
+
+        if self.hunt_active_for_current_cycle and hunt_start is None:
+            # 重试跨入周末或休市日时放弃本轮，非交易日不请求 IBKR
+            logging.warning("本轮数据获取直到非交易日仍未成功，停止重试，等待下一个交易日。")
+            self.hunt_active_for_current_cycle = False
+
+        if not self.hunt_active_for_current_cycle and is_time_to_start_hunt:
+            logging.info(f"交易日到达收盘前1分钟 ({hunt_start.strftime('%H:%M')} ET) 或之后。开始新的数据获取/推送轮询周期。")
+            self.hunt_active_for_current_cycle = True
+
+        if self.hunt_active_for_current_cycle:
+            report_result = self.send_daily_report()
+            if report_result['status'] == 'awaiting_statement':
+                return report_result['retry_after']
+            if report_result['status'] != 'notification_sent':
+                logging.warning(f"数据获取尝试未发送通知 (状态: {report_result['status']})。将在10分钟后重试。")
+                return 600
+            self.hunt_active_for_current_cycle = False
+            fetched_date_info = report_result.get('data_date', '未知')
+            logging.info(f"成功发送通知 (报告实际日期: {fetched_date_info})。当前轮询周期结束。计算等待下一计划启动点。")
+            sleep_duration = self._calculate_sleep_to_next_cycle(self.get_current_et_time())
+            next_wakeup_time = self.clock.now() + timedelta(seconds=sleep_duration)
+            logging.info(f"将休眠约 {sleep_duration/3600:.2f} 小时，直到 {next_wakeup_time.strftime('%Y-%m-%d %H:%M:%S')}")
+            return sleep_duration
+
+        open_dt = self.calendar.open_datetime(current_et_time.date())
+        if self.intraday_interval > 0 and open_dt is not None and open_dt <= current_et_time < hunt_start:
+            intraday_result = self.check_intraday()
+            if intraday_result['status'] == 'awaiting_statement':
+                return intraday_result['retry_after']
+            logging.info(f"盘中检查完成 (状态: {intraday_result['status']})。")
+            return max(1.0, min(self.intraday_interval, (hunt_start - self.get_current_et_time()).total_seconds()))
+
+        sleep_duration = max(60, self._calculate_sleep_to_next_cycle(self.get_current_et_time()))
+        next_wakeup_time = self.clock.now() + timedelta(seconds=sleep_duration)
+        logging.info(f"轮询未激活。将休眠约 {sleep_duration/3600:.2f} 小时，直到 {next_wakeup_time.strftime('%Y-%m-%d %H:%M:%S')}")
+        return sleep_duration
 
     def _calculate_sleep_to_next_cycle(self, current_et_time):
-        """计算到下一个有效工作日15:59 ET的休眠秒数。"""
+        """
+        根据交易日历计算到下一个交易日收盘前1分钟 (通常为15:59 ET，提前收盘日为12:59 ET) 的休眠秒数，节假日直接跳过；
+        开启盘中监控时，如果下一次开盘 (9:30 ET) 更早，则休眠到开盘。
+        """
         now_et = current_et_time
-        next_run_candidate = now_et.replace(hour=15, minute=59, second=0, microsecond=0)
-        if now_et >= next_run_candidate:
-            next_run_candidate = next_run_candidate + timedelta(days=1)
-        while next_run_candidate.weekday() >= 5: # 5 for Saturday, 6 for Sunday
-            next_run_candidate = next_run_candidate + timedelta(days=1)
+        next_run_candidate = self._hunt_start_time(now_et.date())
+        if next_run_candidate is None or now_et >= next_run_candidate:
+            next_run_candidate = self._hunt_start_time(self.calendar.next_trading_day(now_et.date()))
+        if self.intraday_interval > 0:
+            next_open = self.calendar.open_datetime(now_et.date())
+            if next_open is None or now_et >= next_open:
+                next_open = self.calendar.open_datetime(self.calendar.next_trading_day(now_et.date()))
+            next_run_candidate = min(next_run_candidate, next_open)
         sleep_seconds = (next_run_candidate - now_et).total_seconds()
         if sleep_seconds <= 0:
             return 60.0
         return sleep_seconds
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="IBKR 资产追踪器")
+    parser.add_argument('--backfill', nargs=2, metavar=('START', 'END'),
+                        help="回填 START ~ END (YYYY-MM-DD) 的每日 NAV 历史后退出")
+    args = parser.parse_args()
+
     logging.info("IBKRTracker 脚本准备启动...") 
     tracker = IBKRTracker()
-    tracker.run()
\ No newline at end of file
+    if args.backfill:
+        start, end = (datetime.strptime(value, '%Y-%m-%d').date() for value in args.backfill)
+        tracker.backfill(start, end)
+        history_metrics = compute_metrics(tracker.nav_store.series())
+        if history_metrics:
+            logging.info(f"历史表现: {json.dumps(history_metrics, ensure_ascii=False)}")
+        if tracker.metrics_dumper is not None:
+            tracker.metrics_dumper.dump_once()
+    else:
+        tracker.run()
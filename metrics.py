@@ -0,0 +1,286 @@
+# metrics.py
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from state_store import append_json_lines
+
+logger = logging.getLogger(__name__)
+
+# 默认的耗时分桶 (秒)，覆盖从几十毫秒的 HTTP 请求到十分钟级的报告轮询
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"指标 {self.name} 需要标签 {self.labelnames}，实际为 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _items(self):
+        with self._lock:
+            return [(dict(zip(self.labelnames, key)), value) for key, value in sorted(self._values.items())]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        return [(self.name, labels, value) for labels, value in self._items()]
+
+    def snapshot(self):
+        return [{'labels': labels, 'value': value} for labels, value in self._items()]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+            state['counts'][index] += 1
+            state['sum'] += value
+            state['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """记录 with 代码块的耗时 (代码块抛出异常时同样记录)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _cumulative(self, state):
+        total = 0
+        cumulative = []
+        for count in state['counts']:
+            total += count
+            cumulative.append(total)
+        return cumulative
+
+    def quantile(self, state, q):
+        """按分桶线性插值估算分位数；落在最后一个桶 (+Inf) 时返回最大有限边界"""
+        if not state['count']:
+            return None
+        rank = q * state['count']
+        lower, previous = 0.0, 0
+        for bound, cumulative in zip(self.buckets, self._cumulative(state)):
+            if cumulative >= rank:
+                in_bucket = cumulative - previous
+                return lower + (bound - lower) * ((rank - previous) / in_bucket if in_bucket else 0)
+            lower, previous = bound, cumulative
+        return self.buckets[-1]
+
+    def samples(self):
+        result = []
+        for labels, state in self._items():
+            bounds = [str(b) for b in self.buckets] + ['+Inf']
+            for bound, cumulative in zip(bounds, self._cumulative(state)):
+                result.append((f"{self.name}_bucket", dict(labels, le=bound), cumulative))
+            result.append((f"{self.name}_sum", labels, state['sum']))
+            result.append((f"{self.name}_count", labels, state['count']))
+        return result
+
+    def snapshot(self):
+        return [{
+            'labels': labels,
+            'count': state['count'],
+            'sum': round(state['sum'], 6),
+            'p50': self.quantile(state, 0.5),
+            'p90': self.quantile(state, 0.9),
+            'p99': self.quantile(state, 0.99),
+        } for labels, state in self._items()]
+
+
+class MetricsRegistry:
+    """进程内指标注册表，可渲染为 Prometheus 文本格式或 JSON 快照"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric_class, name, *args, **kwargs):
+        with self._lock:
+            existing = self._metrics.get(name)
+            if existing is not None:
+                if not isinstance(existing, metric_class):
+                    raise ValueError(f"指标 {name} 已注册为 {existing.kind}")
+                return existing
+            metric = self._metrics[name] = metric_class(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, documentation, labelnames, buckets)
+
+    def render_prometheus(self):
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(list(labels.items()))} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        snapshot = {}
+        for metric in metrics:
+            samples = metric.snapshot()
+            if samples:
+                snapshot[metric.name] = {'type': metric.kind, 'samples': samples}
+        return {'ts': time.time(), 'metrics': snapshot}
+
+
+# 各模块在导入时把自己的指标注册到这个默认注册表
+REGISTRY = MetricsRegistry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+
+
+class MetricsServer:
+    """在后台线程中提供 /metrics (Prometheus 文本格式) 与 /metrics.json (JSON 快照)"""
+
+    def __init__(self, host='127.0.0.1', port=9108, registry=REGISTRY):
+        self.host = host
+        self.port = port
+        self.registry = registry
+        self._server = None
+        self._thread = None
+
+    def _handler(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?', 1)[0]
+                if path in ('/', '/metrics'):
+                    body = registry.render_prometheus().encode('utf-8')
+                    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+                elif path == '/metrics.json':
+                    body = json.dumps(registry.snapshot(), ensure_ascii=False).encode('utf-8')
+                    content_type = 'application/json; charset=utf-8'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(f"metrics 请求: {format % args}")
+
+        return Handler
+
+    def start(self):
+        if self._server is not None:
+            return
+        self._server = ThreadingHTTPServer((self.host, self.port), self._handler())
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name='metrics-http', daemon=True)
+        self._thread.start()
+        logger.info(f"指标服务已启动: http://{self.host}:{self.port}/metrics")
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+class MetricsDumper:
+    """定期把指标快照追加写入 JSON Lines 文件，文件超过 max_bytes 时轮转为 <path>.1"""
+
+    def __init__(self, path, interval=300.0, max_bytes=10 * 1024 * 1024, registry=REGISTRY):
+        self.path = str(path)
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.registry = registry
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def dump_once(self):
+        try:
+            if os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+                os.replace(self.path, f"{self.path}.1")
+            append_json_lines(self.path, [self.registry.snapshot()])
+        except OSError as e:
+            logger.error(f"写入指标快照失败: {e}")
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            self.dump_once()
+        self.dump_once()
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='metrics-dump', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
@@ -0,0 +1,68 @@
+# nav_analytics.py
+import numpy as np
+
+TRADING_DAYS_PER_YEAR = 252
+
+
+def daily_returns(starting, ending, deposits):
+    """
+    按日计算剔除出入金影响的收益率 (假设出入金发生在当日开盘前):
+    r = (期末 - 期初 - 出入金) / (期初 + 出入金)
+    """
+    starting = np.asarray(starting, dtype=float)
+    ending = np.asarray(ending, dtype=float)
+    deposits = np.asarray(deposits, dtype=float)
+    base = starting + deposits
+    returns = np.zeros_like(base)
+    np.divide(ending - starting - deposits, base, out=returns, where=base > 0)
+    return returns
+
+
+def compute_metrics(series, risk_free_rate=0.0, rolling_window=21):
+    """
+    对整段日序列做向量化计算，series 为 NavStore.series() 返回的
+    (report_date, starting_value, ending_value, mtm, deposits) 列表。
+    返回时间加权收益、年化收益、最大回撤、年化波动率 (全区间与最近 rolling_window 日)、夏普比率。
+    """
+    if not series:
+        return None
+    dates = [row[0] for row in series]
+    values = np.array([row[1:] for row in series], dtype=float)
+    returns = daily_returns(values[:, 0], values[:, 1], values[:, 3])
+    days = len(returns)
+
+    growth = np.cumprod(1.0 + returns)
+    twr = growth[-1] - 1.0
+    annualized_return = growth[-1] ** (TRADING_DAYS_PER_YEAR / days) - 1.0 if growth[-1] > 0 else -1.0
+
+    # 回撤以区间起点 (净值1.0) 为初始高点
+    peaks = np.maximum.accumulate(np.concatenate(([1.0], growth)))[1:]
+    drawdowns = growth / peaks - 1.0
+    trough = int(np.argmin(drawdowns))
+    peak_index = int(np.argmax(growth[:trough + 1]))
+    if growth[peak_index] < 1.0:
+        peak_index = 0
+
+    volatility = float(returns.std(ddof=1) * np.sqrt(TRADING_DAYS_PER_YEAR)) if days > 1 else 0.0
+    rolling_volatility = None
+    if days >= rolling_window > 1:
+        windows = np.lib.stride_tricks.sliding_window_view(returns, rolling_window)
+        rolling_volatility = windows.std(axis=1, ddof=1) * np.sqrt(TRADING_DAYS_PER_YEAR)
+
+    excess = returns - risk_free_rate / TRADING_DAYS_PER_YEAR
+    excess_std = excess.std(ddof=1) if days > 1 else 0.0
+    sharpe = float(excess.mean() / excess_std * np.sqrt(TRADING_DAYS_PER_YEAR)) if excess_std > 0 else None
+
+    return {
+        'start_date': dates[0],
+        'end_date': dates[-1],
+        'days': days,
+        'twr': float(twr),
+        'annualized_return': float(annualized_return),
+        'max_drawdown': float(drawdowns[trough]),
+        'max_drawdown_peak_date': dates[peak_index],
+        'max_drawdown_trough_date': dates[trough],
+        'volatility': volatility,
+        'rolling_volatility': float(rolling_volatility[-1]) if rolling_volatility is not None else None,
+        'sharpe': sharpe,
+    }
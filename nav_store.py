@@ -0,0 +1,304 @@
+# nav_store.py
+import copy
+import logging
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+# 合并所有账户后的汇总数据使用的账户名
+CONSOLIDATED_ACCOUNT = 'TOTAL'
+# 未记录货币的历史数据 (旧版只支持美元) 按此货币处理
+LEGACY_CURRENCY = 'USD'
+# 无法换算为报告货币而移出统计的记录保存在以此开头的账户下，例如 "ARCHIVED:TOTAL:USD"
+ARCHIVED_PREFIX = 'ARCHIVED:'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS nav_daily (
+    account         TEXT NOT NULL,
+    report_date     TEXT NOT NULL,          -- YYYY-MM-DD
+    starting_value  REAL NOT NULL,
+    ending_value    REAL NOT NULL,
+    mtm             REAL NOT NULL,
+    deposits        REAL NOT NULL,
+    seq             INTEGER NOT NULL,       -- 该账户的第几条记录 (从1开始)
+    cum_mtm         REAL NOT NULL,          -- 截至当天 (含) 的 mtm 累计
+    cum_deposits    REAL NOT NULL,          -- 截至当天 (含) 的出入金累计
+    PRIMARY KEY (account, report_date)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS nav_daily_seq ON nav_daily (account, seq);
+CREATE TABLE IF NOT EXISTS symbol_daily (
+    account         TEXT NOT NULL,
+    report_date     TEXT NOT NULL,          -- YYYY-MM-DD
+    symbol          TEXT NOT NULL,
+    pnl             REAL NOT NULL,          -- 该标的当日盈亏贡献
+    value           REAL NOT NULL,          -- 当日收盘持仓市值
+    PRIMARY KEY (account, report_date, symbol)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS account_currency (
+    account         TEXT NOT NULL PRIMARY KEY,
+    currency        TEXT NOT NULL           -- 该账户 nav_daily 记录使用的货币 (分账户为基础货币，TOTAL 为报告货币)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS fx_rates (
+    from_currency   TEXT NOT NULL,
+    to_currency     TEXT NOT NULL,
+    report_date     TEXT NOT NULL,          -- YYYY-MM-DD
+    rate            REAL NOT NULL,          -- 1 单位 from_currency 折合的 to_currency
+    PRIMARY KEY (from_currency, to_currency, report_date)
+) WITHOUT ROWID;
+"""
+
+
+class NavStore:
+    """
+    按日保存 ChangeInNAV 记录的时间序列库 (SQLite)，每行同时保存 mtm 与出入金的前缀和，
+    任意区间的盈亏只需按主键取区间首尾两行即可算出，与区间长度无关。
+    """
+
+    def __init__(self, db_path):
+        self.db_path = str(db_path)
+        self.namespace = ''
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(_SCHEMA)
+
+    def scoped(self, namespace):
+        """
+        返回共用同一连接的视图，所有账户名都带上 "namespace/" 前缀，
+        多租户守护进程中各租户的数据 (包括各自的 TOTAL) 互不干扰。关闭任一视图都会关闭共享连接。
+        """
+        view = copy.copy(self)
+        view.namespace = f"{namespace}/"
+        return view
+
+    def _account_key(self, account):
+        return f"{self.namespace}{account}"
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _last_row(self, account, before=None):
+        if before is None:
+            sql = "SELECT * FROM nav_daily WHERE account = ? ORDER BY report_date DESC LIMIT 1"
+            return self._conn.execute(sql, (account,)).fetchone()
+        sql = "SELECT * FROM nav_daily WHERE account = ? AND report_date < ? ORDER BY report_date DESC LIMIT 1"
+        return self._conn.execute(sql, (account, before)).fetchone()
+
+    def _rebuild_prefix_sums(self, account, from_date):
+        """从 from_date 起重新计算前缀和 (仅在补录或修改历史数据时发生)"""
+        prev = self._last_row(account, before=from_date)
+        seq = prev['seq'] if prev else 0
+        cum_mtm = prev['cum_mtm'] if prev else 0.0
+        cum_deposits = prev['cum_deposits'] if prev else 0.0
+        rows = self._conn.execute(
+            "SELECT report_date, mtm, deposits FROM nav_daily WHERE account = ? AND report_date >= ? ORDER BY report_date",
+            (account, from_date),
+        ).fetchall()
+        updates = []
+        for row in rows:
+            seq += 1
+            cum_mtm += row['mtm']
+            cum_deposits += row['deposits']
+            updates.append((seq, cum_mtm, cum_deposits, account, row['report_date']))
+        self._conn.executemany(
+            "UPDATE nav_daily SET seq = ?, cum_mtm = ?, cum_deposits = ? WHERE account = ? AND report_date = ?",
+            updates,
+        )
+
+    def upsert_many(self, account, records):
+        """
+        写入一批日记录 (可乱序、可覆盖已有日期)。records 为可迭代的
+        (report_date, starting_value, ending_value, mtm, deposits)，report_date 格式为 YYYY-MM-DD。
+        追加在末尾的新日期是 O(1)；涉及历史日期时从最早的改动日起批量重算前缀和。
+        """
+        records = sorted(records)
+        if not records:
+            return
+        account = self._account_key(account)
+        with self._lock, self._conn:
+            last = self._last_row(account)
+            if last is None or records[0][0] > last['report_date']:
+                seq = last['seq'] if last else 0
+                cum_mtm = last['cum_mtm'] if last else 0.0
+                cum_deposits = last['cum_deposits'] if last else 0.0
+                rows = []
+                for report_date, starting_value, ending_value, mtm, deposits in records:
+                    seq += 1
+                    cum_mtm += mtm
+                    cum_deposits += deposits
+                    rows.append((account, report_date, starting_value, ending_value, mtm, deposits,
+                                 seq, cum_mtm, cum_deposits))
+                self._conn.executemany("INSERT INTO nav_daily VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                return
+
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO nav_daily VALUES (?, ?, ?, ?, ?, ?, 0, 0, 0)",
+                [(account, *record) for record in records],
+            )
+            self._rebuild_prefix_sums(account, records[0][0])
+
+    def record_report(self, details):
+        """保存一份 account_details：汇总数据记在 CONSOLIDATED_ACCOUNT 下，分账户明细记在各自的账户下"""
+        def as_record(d):
+            return (d['reportDate'], d['startingValue'], d['endingValue'], d['mtm'], d['depositsWithdrawals'])
+
+        self.upsert_many(CONSOLIDATED_ACCOUNT, [as_record(details)])
+        self.set_currency(CONSOLIDATED_ACCOUNT, details.get('currency', LEGACY_CURRENCY))
+        for account in details.get('accounts', []):
+            if account.get('accountId'):
+                self.upsert_many(account['accountId'], [as_record(account)])
+                self.set_currency(account['accountId'], account.get('currency', LEGACY_CURRENCY))
+
+    def set_currency(self, account, currency):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO account_currency VALUES (?, ?)", (self._account_key(account), currency))
+
+    def currency(self, account=CONSOLIDATED_ACCOUNT):
+        """该账户记录所用的货币；没有记录过货币但已有数据时为 LEGACY_CURRENCY，没有任何数据时返回 None"""
+        key = self._account_key(account)
+        with self._lock:
+            row = self._conn.execute("SELECT currency FROM account_currency WHERE account = ?", (key,)).fetchone()
+            if row is not None:
+                return row['currency']
+            exists = self._conn.execute("SELECT 1 FROM nav_daily WHERE account = ? LIMIT 1", (key,)).fetchone()
+        return LEGACY_CURRENCY if exists else None
+
+    def accounts(self):
+        """当前命名空间下有记录的分账户 (不含 CONSOLIDATED_ACCOUNT)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT account FROM nav_daily WHERE substr(account, 1, ?) = ?",
+                (len(self.namespace), self.namespace),
+            ).fetchall()
+        accounts = [row['account'][len(self.namespace):] for row in rows]
+        return sorted(a for a in accounts if a != CONSOLIDATED_ACCOUNT and '/' not in a and not a.startswith(ARCHIVED_PREFIX))
+
+    def archive(self, account, report_dates, currency):
+        """
+        把 account 在 report_dates 上的记录移到 "ARCHIVED:<account>:<currency>" 下保留，不再参与该账户的区间统计；
+        返回移动的条数。
+        """
+        report_dates = sorted(set(report_dates))
+        if not report_dates:
+            return 0
+        key = self._account_key(account)
+        with self._lock, self._conn:
+            rows = [tuple(row) for row in self._conn.execute(
+                f"SELECT report_date, starting_value, ending_value, mtm, deposits FROM nav_daily "
+                f"WHERE account = ? AND report_date IN ({','.join('?' * len(report_dates))}) ORDER BY report_date",
+                (key, *report_dates),
+            )]
+            if not rows:
+                return 0
+            self._conn.executemany("DELETE FROM nav_daily WHERE account = ? AND report_date = ?",
+                                   [(key, row[0]) for row in rows])
+            self._rebuild_prefix_sums(key, rows[0][0])
+        archive_account = f"{ARCHIVED_PREFIX}{account}:{currency}"
+        self.upsert_many(archive_account, rows)
+        self.set_currency(archive_account, currency)
+        return len(rows)
+
+    def period(self, start_date, end_date, account=CONSOLIDATED_ACCOUNT):
+        """
+        返回 [start_date, end_date] (含，YYYY-MM-DD) 区间的汇总；区间内没有数据时返回 None。
+        盈亏口径与旧版一致: 期末净资产 - 期初净资产 - 期间出入金。
+        """
+        account = self._account_key(account)
+        with self._lock:
+            first = self._conn.execute(
+                "SELECT * FROM nav_daily WHERE account = ? AND report_date >= ? AND report_date <= ? "
+                "ORDER BY report_date LIMIT 1",
+                (account, start_date, end_date),
+            ).fetchone()
+            if first is None:
+                return None
+            last = self._conn.execute(
+                "SELECT * FROM nav_daily WHERE account = ? AND report_date <= ? ORDER BY report_date DESC LIMIT 1",
+                (account, end_date),
+            ).fetchone()
+
+        deposits = last['cum_deposits'] - first['cum_deposits'] + first['deposits']
+        return {
+            'start_date': first['report_date'],
+            'end_date': last['report_date'],
+            'days': last['seq'] - first['seq'] + 1,
+            'start_nav': first['starting_value'],
+            'end_nav': last['ending_value'],
+            'mtm': last['cum_mtm'] - first['cum_mtm'] + first['mtm'],
+            'deposits': deposits,
+            'pl': last['ending_value'] - first['starting_value'] - deposits,
+        }
+
+    def last_n_days(self, n, end_date, account=CONSOLIDATED_ACCOUNT):
+        """最近 n 个有记录的交易日 (截至 end_date) 的汇总"""
+        key = self._account_key(account)
+        with self._lock:
+            last = self._conn.execute(
+                "SELECT seq FROM nav_daily WHERE account = ? AND report_date <= ? ORDER BY report_date DESC LIMIT 1",
+                (key, end_date),
+            ).fetchone()
+            if last is None:
+                return None
+            start = self._conn.execute(
+                "SELECT report_date FROM nav_daily WHERE account = ? AND seq = ?",
+                (key, max(1, last['seq'] - n + 1)),
+            ).fetchone()
+        return self.period(start['report_date'], end_date, account)
+
+    def since_inception(self, end_date, account=CONSOLIDATED_ACCOUNT):
+        return self.period('0000-00-00', end_date, account)
+
+    def record_attribution(self, report_date, symbols, pnl, value, account=CONSOLIDATED_ACCOUNT):
+        """保存某天按标的汇总的盈亏与市值 (覆盖当天已有的记录)，盈亏与市值都为0的标的不保存"""
+        account = self._account_key(account)
+        rows = [(account, report_date, symbol, float(p), float(v))
+                for symbol, p, v in zip(symbols, pnl, value) if p or v]
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM symbol_daily WHERE account = ? AND report_date = ?", (account, report_date))
+            self._conn.executemany("INSERT INTO symbol_daily VALUES (?, ?, ?, ?, ?)", rows)
+
+    def attribution(self, start_date, end_date, account=CONSOLIDATED_ACCOUNT):
+        """
+        [start_date, end_date] 区间内各标的的盈亏合计，以及区间内最后一个有记录的交易日的持仓市值。
+        返回 [(symbol, pnl, value)]；区间内没有记录时返回空列表。
+        """
+        account = self._account_key(account)
+        with self._lock:
+            last = self._conn.execute(
+                "SELECT MAX(report_date) AS report_date FROM symbol_daily WHERE account = ? AND report_date >= ? AND report_date <= ?",
+                (account, start_date, end_date),
+            ).fetchone()
+            if last['report_date'] is None:
+                return []
+            return [tuple(row) for row in self._conn.execute(
+                "SELECT symbol, SUM(pnl), SUM(CASE WHEN report_date = ? THEN value ELSE 0 END) FROM symbol_daily "
+                "WHERE account = ? AND report_date >= ? AND report_date <= ? GROUP BY symbol",
+                (last['report_date'], account, start_date, end_date),
+            )]
+
+    def record_fx_rates(self, rows):
+        """保存一批汇率 (report_date, from_currency, to_currency, rate)；汇率是公共数据，不区分租户命名空间"""
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO fx_rates VALUES (?, ?, ?, ?)",
+                                   [(from_currency, to_currency, report_date, rate)
+                                    for report_date, from_currency, to_currency, rate in rows])
+
+    def fx_rates(self):
+        """全部汇率，按货币对与日期排序，每行为 (report_date, from_currency, to_currency, rate)"""
+        with self._lock:
+            return [tuple(row) for row in self._conn.execute(
+                "SELECT report_date, from_currency, to_currency, rate FROM fx_rates ORDER BY from_currency, to_currency, report_date")]
+
+    def series(self, account=CONSOLIDATED_ACCOUNT, start_date='0000-00-00', end_date='9999-99-99'):
+        """按日期顺序返回区间内的全部记录，每行为 (report_date, starting_value, ending_value, mtm, deposits)"""
+        account = self._account_key(account)
+        with self._lock:
+            return [tuple(row) for row in self._conn.execute(
+                "SELECT report_date, starting_value, ending_value, mtm, deposits FROM nav_daily "
+                "WHERE account = ? AND report_date >= ? AND report_date <= ? ORDER BY report_date",
+                (account, start_date, end_date),
+            )]
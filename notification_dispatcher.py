@@ -0,0 +1,144 @@
+# notification_dispatcher.py
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+import metrics
+from rate_limit import RateLimiter
+from push import BARK_TIMEOUT, deliver_bark
+from telegram_notifier import DEFAULT_TELEGRAM_API_BASE, TELEGRAM_TIMEOUT, TelegramRateLimited, deliver_telegram
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Telegram Bot 限制: 全局约 30 条/秒，同一个 chat 约 1 条/秒
+TELEGRAM_GLOBAL_RATE = 30.0
+TELEGRAM_PER_CHAT_INTERVAL = 1.0
+
+# 只按渠道打标签: chat ID 不进入指标，既不会随接收方数量无限增长，也不会在指标接口上暴露
+NOTIFY_SECONDS = metrics.histogram('notification_delivery_seconds', '单个接收方的投递耗时 (含限流等待)', ['channel'])
+NOTIFY_RESULTS = metrics.counter('notification_deliveries_total', '单个接收方的投递次数', ['channel', 'result'])
+NOTIFY_RATE_LIMITED = metrics.counter('notification_rate_limited_total', 'Telegram 返回 429 的次数')
+
+
+def pooled_session(pool_size):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class NotificationDispatcher:
+    """
+    把一条消息并发推送到 Bark 和所有 Telegram chat，复用长连接，并返回每个接收方的投递结果与耗时。
+    多个 dispatcher 可以通过 executor / bark_session / telegram_session / telegram_limiter 共享线程池、
+    连接池和同一个 Bot 的限流令牌桶 (多租户守护进程中使用)。
+    """
+
+    def __init__(self, bark_url=None, telegram_bot_token=None, telegram_chat_ids=None,
+                 bark_timeout=BARK_TIMEOUT, telegram_timeout=TELEGRAM_TIMEOUT, max_workers=None,
+                 telegram_api_base=None, executor=None, bark_session=None, telegram_session=None,
+                 telegram_limiter=None):
+        self.bark_url = bark_url if bark_url is not None else os.getenv('BARK_URL')
+        self.telegram_bot_token = telegram_bot_token if telegram_bot_token is not None else os.getenv('TELEGRAM_BOT_TOKEN')
+        if telegram_chat_ids is None:
+            telegram_chat_ids = (os.getenv('TELEGRAM_CHAT_IDS') or '').split(',')
+        self.telegram_chat_ids = [chat_id.strip() for chat_id in telegram_chat_ids if chat_id.strip()]
+        self.bark_timeout = bark_timeout
+        self.telegram_timeout = telegram_timeout
+        self.telegram_api_base = (telegram_api_base or os.getenv('TELEGRAM_API_BASE') or DEFAULT_TELEGRAM_API_BASE).rstrip('/')
+
+        self.max_workers = max_workers or int(os.getenv('NOTIFY_MAX_WORKERS', '64'))
+        self.bark_session = bark_session or pooled_session(2)
+        self.telegram_session = telegram_session or pooled_session(self.max_workers)
+        self.telegram_limiter = telegram_limiter or RateLimiter(TELEGRAM_GLOBAL_RATE)
+        self._chat_next_allowed = {}
+        self._chat_lock = threading.Lock()
+        self._executor = executor or ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='notify')
+
+    def recipients(self):
+        """返回当前配置下的全部 (渠道, 接收方) 组合"""
+        targets = []
+        if self.bark_url:
+            targets.append(('bark', 'default'))
+        if self.telegram_bot_token:
+            targets.extend(('telegram', chat_id) for chat_id in self.telegram_chat_ids)
+        return targets
+
+    def _wait_for_chat_slot(self, chat_id):
+        """同一个 chat 两条消息之间至少间隔 TELEGRAM_PER_CHAT_INTERVAL 秒"""
+        with self._chat_lock:
+            now = time.monotonic()
+            slot = max(now, self._chat_next_allowed.get(chat_id, now))
+            self._chat_next_allowed[chat_id] = slot + TELEGRAM_PER_CHAT_INTERVAL
+        if slot > now:
+            time.sleep(slot - now)
+
+    def send_one(self, channel, recipient, title, message):
+        """向单个接收方发送，成功时返回 None，失败时抛出异常"""
+        if channel == 'bark':
+            deliver_bark(self.bark_session, self.bark_url, title, message, timeout=self.bark_timeout)
+            return
+        if channel != 'telegram':
+            raise ValueError(f"未知的通知渠道: {channel}")
+
+        self._wait_for_chat_slot(recipient)
+        self.telegram_limiter.acquire()
+        text = f"{title}\n{message}"
+        try:
+            response_json = deliver_telegram(self.telegram_session, self.telegram_bot_token, recipient, text,
+                                             timeout=self.telegram_timeout, api_base=self.telegram_api_base)
+        except TelegramRateLimited as e:
+            NOTIFY_RATE_LIMITED.inc()
+            if e.retry_after > self.telegram_timeout:
+                raise
+            logger.warning(f"Telegram Chat ID: {recipient} 被限流，{e.retry_after}s 后重试一次。")
+            time.sleep(e.retry_after)
+            response_json = deliver_telegram(self.telegram_session, self.telegram_bot_token, recipient, text,
+                                             timeout=self.telegram_timeout, api_base=self.telegram_api_base)
+        if not response_json.get('ok'):
+            raise RuntimeError(f"Telegram API 返回 'ok: false'。响应: {response_json.get('description', '无描述')}")
+
+    def deliver(self, channel, recipient, title, message):
+        """向单个接收方发送并记录耗时，返回投递结果字典，不抛出异常"""
+        started = time.monotonic()
+        error = None
+        try:
+            self.send_one(channel, recipient, title, message)
+        except Exception as e:
+            error = str(e)
+        latency = time.monotonic() - started
+        NOTIFY_SECONDS.observe(latency, channel=channel)
+        NOTIFY_RESULTS.inc(channel=channel, result='ok' if error is None else 'error')
+        if error is None:
+            logger.info(f"{channel} 通知已发送到 {recipient}，耗时 {latency:.2f}s。标题: {title}")
+        else:
+            logger.error(f"{channel} 通知发送到 {recipient} 失败 (耗时 {latency:.2f}s): {error}")
+        return {'channel': channel, 'recipient': recipient, 'ok': error is None, 'latency': latency, 'error': error}
+
+    def deliver_many(self, deliveries):
+        """并发执行多条 (渠道, 接收方, 标题, 内容) 投递，按输入顺序返回结果"""
+        futures = [self._executor.submit(self.deliver, *delivery) for delivery in deliveries]
+        return [future.result() for future in futures]
+
+    def dispatch(self, title, message):
+        """并发发送到所有渠道与接收方，返回每个接收方的投递结果列表"""
+        targets = self.recipients()
+        if not targets:
+            logger.error("未配置任何通知渠道 (BARK_URL / TELEGRAM_BOT_TOKEN + TELEGRAM_CHAT_IDS)，无法发送通知。")
+            return []
+        results = self.deliver_many([(channel, recipient, title, message) for channel, recipient in targets])
+        failures = sum(1 for r in results if not r['ok'])
+        total_latency = max(r['latency'] for r in results)
+        if failures:
+            logger.warning(f"通知发送完成，成功: {len(results) - failures}，失败: {failures}，总耗时约 {total_latency:.2f}s。")
+        else:
+            logger.info(f"所有通知 ({len(results)}个) 均已成功发送，总耗时约 {total_latency:.2f}s。")
+        return results
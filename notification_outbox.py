@@ -0,0 +1,207 @@
+# notification_outbox.py
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+
+import metrics
+from state_store import append_json_lines, atomic_write_text, read_json_lines, repair_json_lines
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_PENDING = metrics.gauge('notification_outbox_pending', '发件箱中尚未投递成功的消息数')
+OUTBOX_RETRIES = metrics.counter('notification_retries_total', '投递失败后安排重试的次数', ['channel'])
+OUTBOX_EXPIRED = metrics.counter('notification_expired_total', '超过最长保留时间仍未投递成功而放弃的消息数', ['channel'])
+OUTBOX_QUEUE_SECONDS = metrics.histogram('notification_queue_seconds', '从入队到投递成功的耗时', ['kind', 'channel'])
+# 收盘到推送可能长达数小时 (报告迟迟未就绪、补发等)
+MARKET_CLOSE_TO_NOTIFY_SECONDS = metrics.histogram(
+    'market_close_to_notify_seconds', '从报告对应交易日收盘 (event_time) 到投递成功的耗时', ['kind', 'channel'],
+    buckets=(60, 120, 300, 600, 900, 1800, 3600, 7200, 14400, 43200, 86400))
+
+
+class NotificationOutbox:
+    """
+    持久化的通知发件箱：渲染好的消息按 (渠道, 接收方) 逐条追加写入 JSON Lines 文件并 fsync，
+    后台线程按退避策略投递，投递成功后记录 done。进程重启后从文件恢复未投递的消息，无需重新请求 IBKR。
+
+    文件中的记录:
+        {"op": "enqueue", "id": ..., "channel": ..., "recipient": ..., "title": ..., "message": ..., "created": ...,
+         "event_time": ... (可选，消息对应事件的时间，例如收盘时间)}
+        {"op": "attempt", "id": ..., "attempts": ..., "next_at": ..., "error": ...}
+        {"op": "done", "id": ..., "at": ...}
+    """
+
+    def __init__(self, path, dispatcher, base_backoff=5.0, max_backoff=1800.0, max_age_seconds=3 * 86400,
+                 done_retention_seconds=14 * 86400, compact_every=500, clock=time.time):
+        self.path = path
+        self.dispatcher = dispatcher
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.max_age_seconds = max_age_seconds
+        self.done_retention_seconds = done_retention_seconds
+        self.compact_every = compact_every
+        self.clock = clock
+
+        self.pending = {}   # id -> 消息及重试状态
+        self.done = {}      # id -> 完成时间，用于幂等去重
+        self._records_since_compaction = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._worker = None
+        self._load()
+
+    @staticmethod
+    def make_id(key, channel, recipient):
+        """幂等键: 同一业务 key 发往同一接收方只会入队一次"""
+        return hashlib.sha1(f"{key}|{channel}|{recipient}".encode('utf-8')).hexdigest()[:20]
+
+    def _load(self):
+        repair_json_lines(self.path)
+        for record in read_json_lines(self.path):
+            self._apply(record)
+            self._records_since_compaction += 1
+        if self.pending:
+            logger.info(f"从发件箱恢复了 {len(self.pending)} 条未投递的通知。")
+
+    def _apply(self, record):
+        op, entry_id = record.get('op'), record.get('id')
+        if op == 'enqueue':
+            if entry_id not in self.done:
+                self.pending[entry_id] = dict(record, attempts=record.get('attempts', 0), next_at=record.get('next_at', 0))
+        elif op == 'attempt' and entry_id in self.pending:
+            self.pending[entry_id].update(attempts=record['attempts'], next_at=record['next_at'])
+        elif op == 'done':
+            self.pending.pop(entry_id, None)
+            self.done[entry_id] = record.get('at', 0)
+
+    def _append(self, records):
+        append_json_lines(self.path, records)
+        self._records_since_compaction += len(records)
+
+    def enqueue(self, key, title, message, event_time=None):
+        """
+        为当前配置的每个接收方入队一条消息，返回新入队的条数 (已入队或已投递过的会被跳过)。
+        event_time (epoch 秒) 为消息对应事件发生的时间，投递成功时据此统计端到端延迟。
+        """
+        now = self.clock()
+        targets = self.dispatcher.recipients()
+        if not targets:
+            logger.error(f"未配置任何通知渠道 (BARK_URL / TELEGRAM_BOT_TOKEN + TELEGRAM_CHAT_IDS)，通知 {key} 未写入发件箱。")
+            return 0
+        records = []
+        with self._lock:
+            for channel, recipient in targets:
+                entry_id = self.make_id(key, channel, recipient)
+                if entry_id in self.pending or entry_id in self.done:
+                    continue
+                record = {'op': 'enqueue', 'id': entry_id, 'key': key, 'channel': channel,
+                          'recipient': recipient, 'title': title, 'message': message, 'created': now}
+                if event_time is not None:
+                    record['event_time'] = event_time
+                records.append(record)
+            if records:
+                self._append(records)
+                for record in records:
+                    self._apply(record)
+                OUTBOX_PENDING.set(len(self.pending))
+        if records:
+            logger.info(f"通知 {key} 已写入发件箱 ({len(records)} 个接收方)。")
+            self._wakeup.set()
+        else:
+            logger.info(f"通知 {key} 已在发件箱中或已投递，跳过重复入队。")
+        return len(records)
+
+    def pending_count(self):
+        with self._lock:
+            return len(self.pending)
+
+    def _backoff(self, attempts):
+        delay = min(self.max_backoff, self.base_backoff * (2 ** (attempts - 1)))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def drain_once(self):
+        """投递所有已到期的消息，返回距下一条到期消息的秒数 (没有待投递消息时返回 None)"""
+        now = self.clock()
+        with self._lock:
+            expired = [entry for entry in self.pending.values() if now - entry['created'] > self.max_age_seconds]
+            if expired:
+                for entry in expired:
+                    logger.error(f"通知 {entry['key']} -> {entry['channel']}:{entry['recipient']} 超过 "
+                                 f"{self.max_age_seconds / 3600:.0f} 小时仍未投递成功 (已尝试 {entry['attempts']} 次)，放弃。")
+                    OUTBOX_EXPIRED.inc(channel=entry['channel'])
+                records = [{'op': 'done', 'id': entry['id'], 'at': now, 'expired': True} for entry in expired]
+                self._append(records)
+                for record in records:
+                    self._apply(record)
+            due = [dict(entry) for entry in self.pending.values() if entry['next_at'] <= now]
+        if due:
+            results = self.dispatcher.deliver_many(
+                [(entry['channel'], entry['recipient'], entry['title'], entry['message']) for entry in due])
+            records = []
+            finished_at = self.clock()
+            for entry, result in zip(due, results):
+                if result['ok']:
+                    records.append({'op': 'done', 'id': entry['id'], 'at': finished_at})
+                    self._observe_delivered(entry, finished_at)
+                else:
+                    OUTBOX_RETRIES.inc(channel=entry['channel'])
+                    attempts = entry['attempts'] + 1
+                    next_at = finished_at + self._backoff(attempts)
+                    records.append({'op': 'attempt', 'id': entry['id'], 'attempts': attempts,
+                                    'next_at': next_at, 'error': result['error']})
+                    logger.warning(f"通知 {entry['key']} -> {entry['channel']}:{entry['recipient']} 第 {attempts} 次投递失败，"
+                                   f"{next_at - finished_at:.1f}s 后重试。")
+            with self._lock:
+                self._append(records)
+                for record in records:
+                    self._apply(record)
+                if self._records_since_compaction >= self.compact_every:
+                    self._compact()
+
+        with self._lock:
+            OUTBOX_PENDING.set(len(self.pending))
+            if not self.pending:
+                return None
+            return max(0.0, min(entry['next_at'] for entry in self.pending.values()) - self.clock())
+
+    @staticmethod
+    def _observe_delivered(entry, finished_at):
+        kind = entry['key'].split(':', 1)[0]
+        OUTBOX_QUEUE_SECONDS.observe(finished_at - entry['created'], kind=kind, channel=entry['channel'])
+        if entry.get('event_time') is not None:
+            MARKET_CLOSE_TO_NOTIFY_SECONDS.observe(finished_at - entry['event_time'], kind=kind, channel=entry['channel'])
+
+    def _compact(self):
+        """重写发件箱文件，只保留未投递的消息和保留期内的 done 记录；先写临时文件再原子替换"""
+        cutoff = self.clock() - self.done_retention_seconds
+        self.done = {entry_id: at for entry_id, at in self.done.items() if at >= cutoff}
+        lines = [json.dumps({'op': 'done', 'id': entry_id, 'at': at}) for entry_id, at in self.done.items()]
+        lines += [json.dumps(dict(entry, op='enqueue'), ensure_ascii=False) for entry in self.pending.values()]
+        atomic_write_text(self.path, ''.join(line + '\n' for line in lines))
+        self._records_since_compaction = len(self.done) + len(self.pending)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.clear()
+            try:
+                wait = self.drain_once()
+            except Exception as e:
+                logger.error(f"发件箱投递线程发生意外错误: {e}", exc_info=True)
+                wait = self.base_backoff
+            self._wakeup.wait(timeout=wait)
+
+    def start(self):
+        """启动后台投递线程 (重复调用无副作用)"""
+        if self._worker is None or not self._worker.is_alive():
+            self._stopping.clear()
+            self._worker = threading.Thread(target=self._run, name='notification-outbox', daemon=True)
+            self._worker.start()
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self._wakeup.set()
+        if self._worker is not None:
+            self._worker.join(timeout)
@@ -0,0 +1,154 @@
+# position_attribution.py
+from array import array
+
+import numpy as np
+
+# 按标的统计 mtm 的 Flex 章节 (行为 MTMPerformanceSummaryUnderlying)
+MTM_SECTION = 'MTMPerformanceSummaryInBase'
+
+
+def _float(row, key):
+    try:
+        return float(row.get(key) or 0)
+    except ValueError:
+        return 0.0
+
+
+def _fx_rate_to_base(row):
+    """持仓/成交行的金额以标的的计价货币表示，乘以 fxRateToBase 换算为账户基础货币；缺失时按 1 计"""
+    return _float(row, 'fxRateToBase') or 1.0
+
+
+class StatementColumns:
+    """
+    供 parse_flex_statements 的 sections 回调使用: 把 OpenPositions / Trades / MTM 章节逐行追加到 array.array 列中。
+    标的名按出现顺序编码为整数只保存一次，每行只占几个定长数值，不保留属性字典。
+    持仓市值与成交 mtmPnl 按 fxRateToBase 换算为账户基础货币；一个文件包含多个 FlexStatement 时只收集第一个
+    (与日报使用的 ChangeInNAV 对应)。
+    """
+
+    def __init__(self):
+        self.symbol_codes = {}
+        self.symbols = []
+        self.position_symbol = array('q')
+        self.position_quantity = array('d')
+        self.position_price = array('d')
+        self.position_value = array('d')
+        self.trade_symbol = array('q')
+        self.trade_quantity = array('d')
+        self.trade_price = array('d')
+        self.trade_mtm = array('d')
+        self.mtm_symbol = array('q')
+        self.mtm_total = array('d')
+        self.statements = 0
+
+    def sections(self):
+        return {'FlexStatements': self.start_statement, 'OpenPositions': self.add_position, 'Trades': self.add_trade,
+                MTM_SECTION: self.add_mtm}
+
+    def start_statement(self, attrs):
+        self.statements += 1
+
+    def _skipping(self):
+        return self.statements > 1
+
+    def _code(self, symbol):
+        code = self.symbol_codes.get(symbol)
+        if code is None:
+            code = self.symbol_codes[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        return code
+
+    def add_position(self, row):
+        # Flex Query 同时输出 SUMMARY 与 LOT 两级明细时只取 SUMMARY
+        if self._skipping() or not row.get('symbol') or row.get('levelOfDetail', 'SUMMARY') != 'SUMMARY':
+            return
+        self.position_symbol.append(self._code(row['symbol']))
+        self.position_quantity.append(_float(row, 'position'))
+        self.position_price.append(_float(row, 'markPrice'))
+        self.position_value.append(_float(row, 'positionValue') * _fx_rate_to_base(row))
+
+    def add_trade(self, row):
+        # 只取逐笔成交，跳过 ORDER / SYMBOL_SUMMARY 等汇总行
+        if self._skipping() or not row.get('symbol') or row.get('levelOfDetail', 'EXECUTION') != 'EXECUTION':
+            return
+        self.trade_symbol.append(self._code(row['symbol']))
+        self.trade_quantity.append(_float(row, 'quantity'))
+        self.trade_price.append(_float(row, 'tradePrice'))
+        self.trade_mtm.append(_float(row, 'mtmPnl') * _fx_rate_to_base(row))
+
+    def add_mtm(self, row):
+        # 没有 symbol 的是按资产类别的小计行；MTMPerformanceSummaryInBase 的 total 已是基础货币
+        if self._skipping() or not row.get('symbol'):
+            return
+        self.mtm_symbol.append(self._code(row['symbol']))
+        self.mtm_total.append(_float(row, 'total'))
+
+    def attribution(self):
+        """
+        用 bincount 按标的汇总为 Attribution: 报告包含 MTM 章节时以其 total 作为各标的当日盈亏，
+        否则只能用逐笔成交的 mtmPnl (不含隔夜持仓的涨跌)；市值取自 OpenPositions。
+        """
+        n = len(self.symbols)
+        if len(self.mtm_symbol):
+            pnl = np.bincount(np.asarray(self.mtm_symbol), weights=np.asarray(self.mtm_total), minlength=n)
+        else:
+            pnl = np.bincount(np.asarray(self.trade_symbol), weights=np.asarray(self.trade_mtm), minlength=n)
+        value = np.bincount(np.asarray(self.position_symbol), weights=np.asarray(self.position_value), minlength=n)
+        return Attribution(self.symbols, pnl, value)
+
+
+class Attribution:
+    """按标的汇总的盈亏贡献与持仓市值，symbols 与 pnl / value 数组按下标一一对应"""
+
+    def __init__(self, symbols, pnl, value):
+        self.symbols = np.asarray(symbols, dtype=str)
+        self.pnl = np.asarray(pnl, dtype=float)
+        self.value = np.asarray(value, dtype=float)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def scaled(self, factor):
+        """盈亏与市值乘以 factor (例如换算为报告货币的汇率)"""
+        return Attribution(self.symbols, self.pnl * factor, self.value * factor)
+
+    @classmethod
+    def merge(cls, attributions):
+        """合并多个账户的归因: 按标的名去重后用 bincount 求和"""
+        parts = [a for a in attributions if a is not None and len(a)]
+        if not parts:
+            return cls([], [], [])
+        symbols, inverse = np.unique(np.concatenate([a.symbols for a in parts]), return_inverse=True)
+        pnl = np.bincount(inverse, weights=np.concatenate([a.pnl for a in parts]), minlength=len(symbols))
+        value = np.bincount(inverse, weights=np.concatenate([a.value for a in parts]), minlength=len(symbols))
+        return cls(symbols, pnl, value)
+
+    def _extreme(self, order_values, n):
+        """order_values 最大的 n 个下标 (从大到小)，用 argpartition 避免整体排序"""
+        k = min(n, len(order_values))
+        if k <= 0:
+            return np.empty(0, dtype=int)
+        index = np.argpartition(-order_values, k - 1)[:k]
+        return index[np.argsort(-order_values[index], kind='stable')]
+
+    def top(self, n):
+        """返回 (盈利最多的 n 个, 亏损最多的 n 个)，各为 [(symbol, pnl)]，只包含正贡献 / 负贡献"""
+        gainers = [(str(self.symbols[i]), float(self.pnl[i])) for i in self._extreme(self.pnl, n) if self.pnl[i] > 0]
+        losers = [(str(self.symbols[i]), float(self.pnl[i])) for i in self._extreme(-self.pnl, n) if self.pnl[i] < 0]
+        return gainers, losers
+
+    def concentration(self, n):
+        """按持仓市值绝对值计算前 n 大持仓的占比与 HHI (各持仓权重的平方和)；没有持仓时返回 None"""
+        weights = np.abs(self.value)
+        total = weights.sum()
+        if total <= 0:
+            return None
+        weights = weights / total
+        top = weights[self._extreme(weights, n)]
+        return {
+            'top_n': len(top),
+            'top_share': float(top.sum()),
+            'hhi': float(np.square(weights).sum()),
+            'positions': int(np.count_nonzero(weights)),
+        }
@@ -0,0 +1,56 @@
+# rate_limit.py
+import threading
+import time
+
+
+class RateLimiter:
+    """线程安全的令牌桶，acquire() 在令牌不足时阻塞等待"""
+
+    def __init__(self, rate, burst=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = burst if burst is not None else rate
+        self.tokens = self.capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """预订一个令牌，返回需要等待的秒数"""
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            self.sleep(wait)
+        return wait
+
+
+class KeyedRateLimiter:
+    """按键 (例如 token) 各自维护一组令牌桶，每个键可以同时受多个速率限制"""
+
+    def __init__(self, limits, clock=time.monotonic, sleep=time.sleep):
+        self.limits = list(limits)      # [(rate, burst), ...]
+        self.clock = clock
+        self.sleep = sleep
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _buckets_for(self, key):
+        with self._lock:
+            buckets = self._buckets.get(key)
+            if buckets is None:
+                buckets = self._buckets[key] = [RateLimiter(rate, burst, clock=self.clock, sleep=self.sleep)
+                                                for rate, burst in self.limits]
+            return buckets
+
+    def acquire(self, key):
+        """依次获取该键的全部令牌桶，返回累计等待的秒数"""
+        return sum(bucket.acquire() for bucket in self._buckets_for(key))
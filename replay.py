@@ -0,0 +1,233 @@
+# replay.py
+import argparse
+import gzip
+import io
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from bisect import bisect_right
+from datetime import datetime, time as dt_time, timedelta
+from pathlib import Path
+
+import metrics
+from clock import SimulatedClock
+from flex_cache import FlexStatementCache
+from ibkr_net_value_tracker import IBKRTracker
+from trading_calendar import TradingCalendar
+
+REPLAY_STATEMENTS = metrics.counter('replay_statements_served_total', '回放时代替 GetStatement 返回的录制报告数')
+
+
+def _open_recording(path):
+    return gzip.open(path, 'rb') if path.name.endswith('.gz') else open(path, 'rb')
+
+
+class RecordedStatements:
+    """
+    录制的 Flex 报告目录 (*.xml / *.xml.gz)，单个文件可以包含多个 FlexStatement (例如按日拆分输出的回填报告)。
+    每个 FlexStatement 拆成一份独立的报告存入内容寻址的 FlexStatementCache，并按账户与 toDate 建立索引。
+    某天的报告在当天收盘 ready_delay 秒后才算生成，回放时按模拟时间返回那一刻能取到的最新一份。
+    """
+
+    def __init__(self, directory, cache, calendar, ready_delay=600):
+        self.cache = cache
+        self.calendar = calendar
+        self.ready_delay = ready_delay
+        self.statements = {}    # accountId -> [(可获取时间 epoch 秒, toDate, sha256)]
+        paths = sorted(p for p in Path(directory).iterdir() if p.name.endswith(('.xml', '.xml.gz')))
+        for path in paths:
+            with _open_recording(path) as f:
+                self._load(f)
+        if not self.statements:
+            raise ValueError(f"{directory} 中没有找到包含 FlexStatement 的 .xml / .xml.gz 文件")
+        for entries in self.statements.values():
+            entries.sort()
+        self._ready_times = {account: [entry[0] for entry in entries] for account, entries in self.statements.items()}
+
+    def _load(self, f):
+        for _, elem in ET.iterparse(f):
+            if elem.tag != 'FlexStatement':
+                continue
+            account_id = elem.get('accountId', '')
+            to_date = elem.get('toDate') or elem.get('fromDate')
+            if account_id and to_date:
+                payload = b''.join((b'<FlexQueryResponse><FlexStatements count="1">', ET.tostring(elem),
+                                    b'</FlexStatements></FlexQueryResponse>'))
+                sha256 = self.cache.store(io.BytesIO(payload))
+                self.statements.setdefault(account_id, []).append((self._ready_at(to_date), to_date, sha256))
+            elem.clear()
+
+    def _ready_at(self, to_date):
+        day = datetime.strptime(to_date, '%Y%m%d').date()
+        close_dt = self.calendar.close_datetime(day)
+        if close_dt is None:
+            close_dt = self.calendar.tz.localize(datetime.combine(day + timedelta(days=1), dt_time(0, 0)))
+        return close_dt.timestamp() + self.ready_delay
+
+    def accounts(self):
+        return sorted(self.statements)
+
+    def date_range(self):
+        dates = [entry[1] for entries in self.statements.values() for entry in entries]
+        return (datetime.strptime(min(dates), '%Y%m%d').date(), datetime.strptime(max(dates), '%Y%m%d').date())
+
+    def latest(self, account_id, now):
+        """now (epoch 秒) 时该账户能取到的最新一份报告的 SHA-256，此前还没有任何报告时返回 None"""
+        index = bisect_right(self._ready_times.get(account_id, []), now)
+        return self.statements[account_id][index - 1][2] if index else None
+
+
+class CapturingDispatcher:
+    """代替 NotificationDispatcher: 不发出任何请求，只按模拟时间记录本应推送的消息"""
+
+    def __init__(self, clock, tz):
+        self.clock = clock
+        self.tz = tz
+        self.messages = []
+
+    def recipients(self):
+        return [('replay', 'capture')]
+
+    def deliver_many(self, deliveries):
+        results = []
+        for channel, recipient, title, message in deliveries:
+            self.messages.append({'at': self.clock.now(self.tz).isoformat(), 'title': title, 'message': message})
+            results.append({'channel': channel, 'recipient': recipient, 'ok': True, 'latency': 0.0, 'error': None})
+        return results
+
+
+class ReplayTracker(IBKRTracker):
+    """用录制的报告代替 SendRequest / GetStatement，其余的解析、去重、入库、周/月总结与发件箱逻辑与线上完全相同"""
+
+    def __init__(self, recordings, config, **kwargs):
+        self.recordings = recordings
+        super().__init__(config, **kwargs)
+
+    def _send_account_request(self, token, query_id):
+        return f"replay:{token}"
+
+    def _download_statement(self, token, reference_code):
+        sha256 = self.recordings.latest(token, self.clock.time())
+        if sha256 is None:
+            logging.warning(f"账户 {token} 在 {self.get_current_et_time():%Y-%m-%d %H:%M} 还没有可用的录制报告。")
+            return None
+        target = self.statement_cache.blob_path(sha256)
+        if not target.exists():
+            shutil.copyfile(self.recordings.cache.blob_path(sha256), target)
+        REPLAY_STATEMENTS.inc()
+        return sha256
+
+
+def replay(directory, start=None, end=None, ready_delay=600, config=None, workdir=None):
+    """
+    在模拟时钟上把录制的报告按天喂给追踪器的真实调度逻辑 (run_initial / run_once)，不做任何等待。
+    start / end 为 date，默认为录制报告覆盖的日期范围。返回 (按时间顺序捕获的消息列表, 统计信息)。
+    """
+    calendar = TradingCalendar()
+    # 回放不需要持久化，临时目录优先放在内存文件系统上，避免 fsync 拖慢回放
+    workdir = Path(workdir or tempfile.mkdtemp(prefix='ibkr_replay_', dir='/dev/shm' if os.path.isdir('/dev/shm') else None))
+    workdir.mkdir(parents=True, exist_ok=True)
+    recordings = RecordedStatements(directory, FlexStatementCache(workdir / 'recordings'), calendar, ready_delay)
+    first, last = recordings.date_range()
+    start, end = start or first, end or last
+
+    clock = SimulatedClock(calendar.tz.localize(datetime.combine(start, dt_time(0, 0))))
+    stop_at = calendar.tz.localize(datetime.combine(end + timedelta(days=1), dt_time(0, 0))).timestamp() + max(0, ready_delay)
+    dispatcher = CapturingDispatcher(clock, calendar.tz)
+    tracker_config = {
+        'IB_FLEX_ACCOUNTS': ','.join(f"{account}:replay" for account in recordings.accounts()),
+        'TRACKER_STATE_PATH': str(workdir / 'tracker_state.json'),
+        'NOTIFY_OUTBOX_PATH': str(workdir / 'notification_outbox.jsonl'),
+        'NAV_DB_PATH': str(workdir / 'nav_history.sqlite3'),
+        'FLEX_CACHE_DIR': str(workdir / 'flex_cache'),
+        'INTRADAY_INTERVAL': '0',
+        'METRICS_PORT': '0',
+        'METRICS_DUMP_INTERVAL': '0',
+    }
+    tracker_config.update(config or {})
+    tracker = ReplayTracker(recordings, tracker_config, calendar=calendar, dispatcher=dispatcher, clock=clock)
+
+    started = time.perf_counter()
+    cycles = 0
+    tracker.run_initial()
+    tracker.outbox.drain_once()
+    while clock.time() < stop_at:
+        # 先投递本轮产生的消息再睡眠，否则消息会带着下次唤醒的时间戳，跨长假时还会超过发件箱的过期时间
+        delay = tracker.run_once()
+        tracker.outbox.drain_once()
+        clock.sleep(delay)
+        cycles += 1
+    elapsed = time.perf_counter() - started
+    tracker.nav_store.close()
+
+    trading_days = sum(1 for _ in calendar.trading_days(start, end))
+    stats = {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'trading_days': trading_days,
+        'statements': sum(len(entries) for entries in recordings.statements.values()),
+        'cycles': cycles,
+        'notifications': len(dispatcher.messages),
+        'seconds': elapsed,
+        'trading_days_per_second': trading_days / elapsed if elapsed else float('inf'),
+        'workdir': str(workdir),
+    }
+    return dispatcher.messages, stats
+
+
+def _parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+
+
+def compare_messages(expected, actual, limit=10):
+    """逐条比较两次回放捕获的消息，返回差异描述列表 (最多 limit 条)"""
+    differences = []
+    for index in range(max(len(expected), len(actual))):
+        old = expected[index] if index < len(expected) else None
+        new = actual[index] if index < len(actual) else None
+        if old != new:
+            differences.append(f"#{index}: {json.dumps(old, ensure_ascii=False)}\n    -> {json.dumps(new, ensure_ascii=False)}")
+            if len(differences) >= limit:
+                break
+    return differences
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="用模拟时钟快速回放录制的 Flex 报告，捕获本应推送的通知")
+    parser.add_argument('recordings', help="录制报告目录 (*.xml / *.xml.gz，可包含多日 FlexStatement)")
+    parser.add_argument('--start', help="回放起始日期 YYYY-MM-DD (默认为最早的报告日期)")
+    parser.add_argument('--end', help="回放结束日期 YYYY-MM-DD (默认为最晚的报告日期)")
+    parser.add_argument('--ready-delay', type=float, default=600, help="报告在收盘后多少秒可以获取 (默认600)")
+    parser.add_argument('--output', help="把捕获的通知写入 JSON Lines 文件")
+    parser.add_argument('--compare', help="与之前保存的 JSON Lines 逐条比较，有差异时以状态码1退出")
+    parser.add_argument('--workdir', help="状态/NAV/缓存/发件箱的存放目录 (默认为临时目录，结束后删除)")
+    parser.add_argument('--verbose', action='store_true', help="输出追踪器的 INFO 日志")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    messages, stats = replay(args.recordings, _parse_date(args.start), _parse_date(args.end),
+                             ready_delay=args.ready_delay, workdir=args.workdir)
+    if not args.workdir:
+        shutil.rmtree(stats['workdir'], ignore_errors=True)
+
+    print(f"回放 {stats['start']} ~ {stats['end']}: {stats['trading_days']} 个交易日，{stats['statements']} 份报告，"
+          f"{stats['cycles']} 次调度，捕获 {stats['notifications']} 条通知，耗时 {stats['seconds']:.2f}s "
+          f"({stats['trading_days_per_second']:.0f} 交易日/秒)")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.writelines(json.dumps(message, ensure_ascii=False) + '\n' for message in messages)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            expected = [json.loads(line) for line in f if line.strip()]
+        differences = compare_messages(expected, messages)
+        if differences:
+            print(f"与 {args.compare} 不一致:")
+            print('\n'.join(differences))
+            sys.exit(1)
+        print(f"与 {args.compare} 完全一致 ({len(messages)} 条)。")
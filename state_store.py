@@ -0,0 +1,203 @@
+# state_store.py
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _fsync_dir(path):
+    """fsync 所在目录，确保 rename 本身也已落盘"""
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def atomic_write_text(path, text):
+    """先写同目录下的临时文件并 fsync，再原子替换目标文件，崩溃时目标文件要么是旧内容要么是新内容"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _fsync_dir(path)
+
+
+def atomic_write_json(path, obj, **dump_kwargs):
+    atomic_write_text(path, json.dumps(obj, ensure_ascii=False, default=str, **dump_kwargs))
+
+
+def append_json_lines(path, records):
+    """把若干条记录追加为 JSON Lines 并 fsync"""
+    data = ''.join(json.dumps(record, ensure_ascii=False, default=str) + '\n' for record in records)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def repair_json_lines(path):
+    """截掉文件末尾没有换行符的残缺记录，避免之后追加的记录与其拼接成一行而丢失"""
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if size == 0:
+            return
+        f.seek(size - 1)
+        if f.read(1) == b'\n':
+            return
+        # 从末尾向前找最后一个换行符
+        position = size
+        while position > 0:
+            step = min(4096, position)
+            position -= step
+            f.seek(position)
+            newline = f.read(step).rfind(b'\n')
+            if newline != -1:
+                position += newline + 1
+                break
+        logger.warning(f"{os.path.basename(path)} 末尾有 {size - position} 字节的残缺记录，已截除。")
+        f.truncate(position)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def read_json_lines(path):
+    """逐条读取 JSON Lines；崩溃时可能留下写了一半的行，跳过即可"""
+    if not os.path.exists(path):
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"{os.path.basename(path)} 第 {line_no} 行无法解析 (可能是崩溃时未写完)，已忽略。")
+
+
+class TrackedDict(dict):
+    """记录被赋值或删除过的顶层键，保存时只需写出这些键"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.dirty = set()
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.dirty.add(key)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.dirty.add(key)
+
+    def pop(self, key, *default):
+        self.dirty.add(key)
+        return super().pop(key, *default)
+
+    def update(self, *args, **kwargs):
+        changes = dict(*args, **kwargs)
+        super().update(changes)
+        self.dirty.update(changes)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+
+class StateCorruptedError(RuntimeError):
+    """状态快照无法解析；损坏的快照已移到一旁保留，不会被空状态覆盖"""
+
+
+class JournaledState:
+    """
+    快照 + 预写日志的状态持久化:
+    每次保存只把被修改过的顶层键追加到日志并 fsync (与状态总大小无关)，日志累积到一定条数后
+    把完整状态原子地写成新快照并清空日志；启动时读取快照再重放日志尾部。
+    注意: 只能感知顶层键的赋值/删除，修改嵌套对象后需要对顶层键重新赋值。
+    """
+
+    def __init__(self, snapshot_path, journal_path=None, compact_every=200):
+        self.snapshot_path = str(snapshot_path)
+        self.journal_path = str(journal_path) if journal_path else f"{self.snapshot_path}.journal"
+        self.compact_every = compact_every
+        self._journal_entries = 0
+        self._lock = threading.Lock()
+
+    def load(self):
+        """
+        返回恢复后的状态 (TrackedDict)。快照损坏时把它改名为 <快照>.corrupt-<时间戳> 保留下来并抛出 StateCorruptedError，
+        由调用方停止运行；日志保持不动，之后再启动时从空快照加上日志中的字段继续。
+        """
+        state = {}
+        if os.path.exists(self.snapshot_path):
+            try:
+                with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+                if not isinstance(state, dict):
+                    raise ValueError(f"顶层是 {type(state).__name__} 而不是对象")
+            except ValueError as e:
+                # json.JSONDecodeError 与 UnicodeDecodeError 都是 ValueError 的子类
+                corrupt_path = f"{self.snapshot_path}.corrupt-{time.strftime('%Y%m%d%H%M%S')}"
+                os.replace(self.snapshot_path, corrupt_path)
+                _fsync_dir(self.snapshot_path)
+                raise StateCorruptedError(
+                    f"状态快照 {self.snapshot_path} 无法解析 ({e})，已移到 {corrupt_path}。"
+                    f"日志 {self.journal_path} 未改动，只包含上次压缩后修改过的字段。"
+                    f"请检查后把可用的快照放回原处再启动；直接重新启动将只用日志中的字段继续运行。") from e
+        self._journal_entries = 0
+        repair_json_lines(self.journal_path)
+        for entry in read_json_lines(self.journal_path):
+            state.update(entry.get('set', {}))
+            for key in entry.get('del', []):
+                state.pop(key, None)
+            self._journal_entries += 1
+        return TrackedDict(state)
+
+    def save(self, state):
+        """把被修改过的键追加到日志，必要时压缩为新快照；传入普通 dict 时视为全部键都已修改"""
+        with self._lock:
+            if isinstance(state, TrackedDict):
+                dirty, state.dirty = state.dirty, set()
+            else:
+                dirty = set(state)
+            if not dirty:
+                return
+            entry = {}
+            changed = {key: state[key] for key in dirty if key in state}
+            deleted = [key for key in dirty if key not in state]
+            if changed:
+                entry['set'] = changed
+            if deleted:
+                entry['del'] = deleted
+            append_json_lines(self.journal_path, [entry])
+            self._journal_entries += 1
+            if self._journal_entries >= self.compact_every:
+                self._compact(state)
+
+    def compact(self, state):
+        with self._lock:
+            self._compact(state)
+
+    def _compact(self, state):
+        atomic_write_json(self.snapshot_path, state, indent=4)
+        if isinstance(state, TrackedDict):
+            state.dirty = set()
+        # 快照已经包含日志中的全部内容，此时截断日志是安全的；截断前崩溃只会导致重放已包含的条目
+        with open(self.journal_path, 'w', encoding='utf-8') as f:
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_entries = 0
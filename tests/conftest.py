@@ -0,0 +1,50 @@
+# tests/conftest.py
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'benchmarks'))
+
+
+class CapturingDispatcher:
+    """不发出请求，只记录投递的消息"""
+
+    def __init__(self):
+        self.messages = []
+
+    def recipients(self):
+        return [('test', 'capture')]
+
+    def deliver_many(self, deliveries):
+        self.messages.extend({'title': title, 'message': message} for _, _, title, message in deliveries)
+        return [{'channel': c, 'recipient': r, 'ok': True, 'latency': 0.0, 'error': None} for c, r, _, _ in deliveries]
+
+
+@pytest.fixture
+def make_tracker(tmp_path):
+    """在临时目录中构建 IBKRTracker (或其子类)，关闭指标端口与快照"""
+    trackers = []
+
+    def make(config=None, cls=None, **kwargs):
+        from ibkr_net_value_tracker import IBKRTracker
+        settings = {
+            'IB_FLEX_ACCOUNTS': 'token_a:query_a',
+            'TRACKER_STATE_PATH': str(tmp_path / 'tracker_state.json'),
+            'NOTIFY_OUTBOX_PATH': str(tmp_path / 'notification_outbox.jsonl'),
+            'NAV_DB_PATH': str(tmp_path / 'nav_history.sqlite3'),
+            'FLEX_CACHE_DIR': str(tmp_path / 'flex_cache'),
+            'METRICS_PORT': '0',
+            'METRICS_DUMP_INTERVAL': '0',
+        }
+        settings.update(config or {})
+        kwargs.setdefault('dispatcher', CapturingDispatcher())
+        tracker = (cls or IBKRTracker)(settings, **kwargs)
+        trackers.append(tracker)
+        return tracker
+
+    yield make
+    for tracker in trackers:
+        tracker.nav_store.close()
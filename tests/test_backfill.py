@@ -0,0 +1,43 @@
+# tests/test_backfill.py
+from datetime import date
+
+import pytest
+
+from ibkr_net_value_tracker import IBKRTracker
+
+# (日期, 账户 A 的 mtm, 账户 B 的 mtm)；账户 B 的净资产固定为 500，只有 01-06 有变动
+DAYS = [('20250102', 10.0, 0.0), ('20250103', -4.0, 0.0), ('20250104', 0.0, 0.0), ('20250106', 6.0, 5.0)]
+
+
+def _statements(account_id, starting, column):
+    statements, value = [], starting
+    for day, *mtms in DAYS:
+        mtm = mtms[column]
+        statements.append({
+            'attrs': {'accountId': account_id, 'fromDate': day, 'toDate': day},
+            'ChangeInNAV': {'currency': 'USD', 'startingValue': value, 'endingValue': value + mtm,
+                            'mtm': mtm, 'depositsWithdrawals': 0},
+        })
+        value += mtm
+    return statements
+
+
+class RecordedBackfillTracker(IBKRTracker):
+    def _fetch_statements_for_range(self, token, query_id, from_date, to_date):
+        return {'token_a': _statements('UA', 1000.0, 0), 'token_b': _statements('UB', 500.0, 1)}[token]
+
+
+def test_backfill_keeps_idle_account_on_trading_days(make_tracker):
+    tracker = make_tracker({'IB_FLEX_ACCOUNTS': 'token_a:q,token_b:q'}, cls=RecordedBackfillTracker)
+    assert tracker.backfill(date(2025, 1, 2), date(2025, 1, 6)) == 3
+
+    # 两个账户都没有变动的 01-04 整天跳过，账户 B 没有变动的 01-02/01-03 仍然计入
+    total = tracker.nav_store.series()
+    assert [row[0] for row in total] == ['2025-01-02', '2025-01-03', '2025-01-06']
+    assert [row[1] for row in total] == [1500.0, 1510.0, 1506.0]
+    assert [row[2] for row in total] == [1510.0, 1506.0, 1517.0]
+    assert [row[0] for row in tracker.nav_store.series('UB')] == ['2025-01-02', '2025-01-03', '2025-01-06']
+
+    period = tracker.nav_store.period('2025-01-01', '2025-01-31')
+    assert period['pl'] == pytest.approx(10.0 - 4.0 + 6.0 + 5.0)
+    assert period['mtm'] == pytest.approx(period['pl'])
@@ -0,0 +1,56 @@
+# tests/test_consolidation.py
+import pytest
+
+from stub_server import StubServer, account_id_for_token
+
+
+class NoWaitLimiter:
+    """不限流: 同一 token 每秒1次的限制会让每次获取多等1秒"""
+
+    def acquire(self, token):
+        return 0.0
+
+
+def _account(account_id, currency, starting, ending, mtm, deposits=0.0, raw_from_date='20250110'):
+    return {'accountId': account_id, 'currency': currency, 'reportDate': '2025-01-10', 'raw_from_date': raw_from_date,
+            'startingValue': starting, 'endingValue': ending, 'mtm': mtm, 'depositsWithdrawals': deposits}
+
+
+def test_accounts_are_fetched_concurrently_and_summed(make_tracker):
+    server = StubServer().start()
+    try:
+        tracker = make_tracker({'FLEX_BASE_URL': server.flex_base_url, 'FLEX_POLL_INITIAL_DELAY': '0',
+                                'IB_FLEX_ACCOUNTS': 'token_a:query_a,token_b:query_b'}, flex_limiter=NoWaitLimiter())
+        details = tracker.get_account_summary()
+    finally:
+        server.stop()
+
+    assert server.stats['send_request'] == 2
+    assert [d['accountId'] for d in details['accounts']] == [account_id_for_token('token_a'), account_id_for_token('token_b')]
+    for key in ('startingValue', 'endingValue', 'mtm', 'depositsWithdrawals'):
+        assert details[key] == pytest.approx(sum(d[key] for d in details['accounts']))
+
+
+def test_accounts_in_other_currencies_are_converted_to_report_currency(make_tracker):
+    tracker = make_tracker({'REPORT_CURRENCY': 'USD'})
+    # HKD 账户的 ConversionRates 以 HKD 报价: 1 USD = 7.8 HKD
+    tracker.fx_rates.add([('2025-01-10', 'USD', 'HKD', 7.8)])
+
+    details = tracker._consolidate_accounts([
+        _account('U1', 'USD', 1000.0, 1010.0, 10.0),
+        _account('U2', 'HKD', 7800.0, 7878.0, 78.0),
+    ])
+
+    assert details['currency'] == 'USD'
+    assert details['endingValue'] == pytest.approx(1010.0 + 7878.0 / 7.8)
+    assert details['mtm'] == pytest.approx(10.0 + 10.0)
+    # 分账户明细保留基础货币的原始数值，并带上换算汇率
+    assert [(d['endingValue'], d['fxRate']) for d in details['accounts']] == pytest.approx([(1010.0, 1.0), (7878.0, 1 / 7.8)])
+
+
+def test_consolidation_waits_when_report_dates_differ(make_tracker):
+    tracker = make_tracker()
+    assert tracker._consolidate_accounts([
+        _account('U1', 'USD', 1000.0, 1010.0, 10.0),
+        _account('U2', 'USD', 1000.0, 1010.0, 10.0, raw_from_date='20250109'),
+    ]) is None
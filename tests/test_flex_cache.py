@@ -0,0 +1,52 @@
+# tests/test_flex_cache.py
+import io
+
+import pytest
+
+from flex_cache import FlexStatementCache
+from flex_samples import write_statement
+from stub_server import StubServer
+
+
+class NoWaitLimiter:
+    """不限流: 同一 token 每秒1次的限制会让每次获取多等1秒"""
+
+    def acquire(self, token):
+        return 0.0
+
+
+@pytest.fixture
+def server():
+    server = StubServer().start()
+    yield server
+    server.stop()
+
+
+def test_lookup_returns_latest_statement_covering_date(tmp_path):
+    cache = FlexStatementCache(tmp_path)
+    key = FlexStatementCache.make_key('token_a', 'query_a')
+    hashes = {}
+    for day in ('20250102', '20250103'):
+        out = io.BytesIO()
+        write_statement(out, from_date=day)
+        hashes[day] = cache.store(io.BytesIO(out.getvalue()))
+        cache.record(key, hashes[day], day, day)
+
+    assert cache.lookup(key, '20250102')['sha256'] == hashes['20250103']
+    assert cache.lookup(key, '20250106') is None
+    assert cache.lookup(FlexStatementCache.make_key('token_b', 'query_a'), '20250102') is None
+    # 相同内容只保存一份，索引在重新打开后仍然有效
+    assert cache.store(io.BytesIO(out.getvalue())) == hashes['20250103']
+    assert FlexStatementCache(tmp_path).lookup(key, '20250103')['sha256'] == hashes['20250103']
+
+
+def test_cached_statement_is_served_without_requests(server, make_tracker):
+    config = {'FLEX_BASE_URL': server.flex_base_url, 'FLEX_POLL_INITIAL_DELAY': '0'}
+    details = make_tracker(config, flex_limiter=NoWaitLimiter()).get_account_summary()
+    assert server.stats['send_request'] == 1
+
+    # 进程重启后，覆盖到最新完整交易日的报告直接从缓存读取
+    restarted = make_tracker(config, flex_limiter=NoWaitLimiter())
+    assert restarted.get_account_summary()['endingValue'] == details['endingValue']
+    assert server.stats['send_request'] == 1
+    assert server.stats['get_statement'] == 1
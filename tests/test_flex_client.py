@@ -0,0 +1,100 @@
+# tests/test_flex_client.py
+import time
+
+import pytest
+
+import flex_client
+from stub_server import StubServer
+
+
+@pytest.fixture
+def server():
+    server = StubServer(ready_delay=3.0).start()
+    yield server
+    server.stop()
+
+
+def test_deferred_poll_returns_retry_after_instead_of_sleeping(server, make_tracker):
+    tracker = make_tracker({'FLEX_BASE_URL': server.flex_base_url, 'FLEX_POLL_INITIAL_DELAY': '0'}, defer_polls=True)
+
+    results = []
+    for _ in range(10):
+        started = time.monotonic()
+        result = tracker.send_daily_report()
+        # 每次调用只有限流等待 (同一 token 每秒1次)，不会等到报告就绪
+        assert time.monotonic() - started < 2.5
+        results.append(result['status'])
+        if result['status'] != 'awaiting_statement':
+            break
+        assert 0 <= result['retry_after'] <= 15
+        time.sleep(result['retry_after'])
+
+    assert results[0] == 'awaiting_statement'
+    assert results[-1] == 'notification_sent'
+    # 整轮只发出一次 SendRequest，后续调用复用同一个 ReferenceCode
+    assert server.stats['send_request'] == 1
+    assert server.stats['get_statement'] == len(results)
+    assert tracker._pending_poll_delay('daily') is None
+
+
+@pytest.mark.parametrize('code, base, cap', [('1018', 10.0, 60.0), ('1019', 2.0, 15.0), ('1020', 5.0, 30.0)])
+def test_backoff_delay_is_jittered_and_capped(code, base, cap, monkeypatch):
+    for retry_index in range(8):
+        delay = min(cap, base * 2 ** retry_index)
+        # equal jitter: 退避时长在 [delay/2, delay] 之间
+        monkeypatch.setattr(flex_client.random, 'uniform', lambda a, b: a)
+        assert flex_client._backoff_delay(code, retry_index) == delay / 2
+        monkeypatch.setattr(flex_client.random, 'uniform', lambda a, b: b)
+        assert flex_client._backoff_delay(code, retry_index) == delay
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _poll(server, clock, deadline_seconds):
+    url = f"{server.flex_base_url}/SendRequest"
+    reference_code = flex_client.send_flex_request(url, 'token_a', 'query_a')
+    return flex_client.FlexPoll(f"{server.flex_base_url}/GetStatement", 'token_a', reference_code,
+                                deadline_seconds=deadline_seconds, initial_delay=0, clock=clock)
+
+
+def test_flex_poll_retries_throttled_reference_code_until_ready(monkeypatch):
+    monkeypatch.setattr(flex_client.random, 'uniform', lambda a, b: b)
+    server = StubServer(throttle_attempts=3).start()
+    try:
+        clock = FakeClock()
+        poll = _poll(server, clock, deadline_seconds=600)
+        delays = []
+        while not poll.attempt():
+            delays.append(poll.remaining_delay())
+            clock.now = poll.due
+    finally:
+        server.stop()
+
+    # 1018 从10秒开始翻倍退避
+    assert delays == [10.0, 20.0, 40.0]
+    assert poll.result.startswith(b'<?xml')
+    assert poll.attempts == 4
+    assert server.stats['error_1018'] == 3
+
+
+def test_flex_poll_gives_up_at_deadline():
+    server = StubServer(throttle_attempts=100).start()
+    try:
+        clock = FakeClock()
+        poll = _poll(server, clock, deadline_seconds=45)
+        while not poll.attempt():
+            # 下一次请求不会排到截止时间之后
+            assert poll.due <= poll.deadline
+            clock.now = poll.due
+    finally:
+        server.stop()
+
+    assert poll.result is None
+    assert clock.now >= poll.deadline
+    assert poll.attempts == server.stats['get_statement']
@@ -0,0 +1,73 @@
+# tests/test_flex_parser.py
+import io
+from datetime import date, datetime
+
+from flex_parser import StatementFingerprint, parse_flex_statements
+from flex_samples import restamp_when_generated, write_daily_history, write_statement
+
+
+def _statement(**kwargs):
+    out = io.BytesIO()
+    write_statement(out, **kwargs)
+    return out.getvalue()
+
+
+def test_section_callbacks_receive_each_row():
+    content = _statement(positions=5, trades=3, cash_transactions=2)
+    rows = {'OpenPositions': [], 'Trades': [], 'CashTransactions': []}
+
+    statements = parse_flex_statements(content, {tag: rows[tag].append for tag in rows})
+
+    assert [len(rows[tag]) for tag in ('OpenPositions', 'Trades', 'CashTransactions')] == [5, 3, 2]
+    assert all(row['accountId'] == 'U1234567' for tag_rows in rows.values() for row in tag_rows)
+    assert len(statements) == 1
+    assert statements[0]['attrs']['fromDate'] == '20250102'
+    assert statements[0]['ChangeInNAV']['currency'] == 'USD'
+
+
+def test_multiple_flex_statements_are_returned_in_order():
+    days = [date(2025, 1, 2), date(2025, 1, 3), date(2025, 1, 6)]
+    out = io.BytesIO()
+    write_daily_history(out, days, mtm_performance=4)
+    events = []
+
+    statements = parse_flex_statements(out.getvalue(), {
+        'FlexStatements': lambda attrs: events.append(('statement', attrs['toDate'])),
+        'MTMPerformanceSummaryInBase': lambda attrs: events.append(('mtm', attrs['reportDate'])),
+    })
+
+    assert [s['attrs']['toDate'] for s in statements] == ['20250102', '20250103', '20250106']
+    # 前一天的 endingValue 即后一天的 startingValue
+    assert statements[1]['ChangeInNAV']['startingValue'] == statements[0]['ChangeInNAV']['endingValue']
+    # FlexStatements 回调在各 FlexStatement 开始时调用，之后的章节行属于该 FlexStatement
+    expected = []
+    for day in days:
+        expected += [('statement', day.strftime('%Y%m%d'))] + [('mtm', day.strftime('%Y%m%d'))] * 4
+    assert events == expected
+
+
+def test_sections_without_callback_are_skipped():
+    statements = parse_flex_statements(_statement(positions=50))
+    assert len(statements) == 1
+    assert statements[0]['ChangeInNAV'] is not None
+
+
+def test_fingerprint_is_independent_of_chunk_boundaries():
+    content = _statement(generated_at=datetime(2025, 1, 2, 10, 15))
+    regenerated = restamp_when_generated(content, datetime(2025, 1, 2, 10, 20, 37))
+    expected = StatementFingerprint()
+    expected.update(content)
+    expected = expected.hexdigest()
+
+    # 在 whenGenerated 属性前后的每个位置切成两块，以及小于/大于 CARRY 的固定块长
+    position = regenerated.index(b'whenGenerated')
+    for split in range(max(0, position - 200), position + 200):
+        fingerprint = StatementFingerprint()
+        fingerprint.update(regenerated[:split])
+        fingerprint.update(regenerated[split:])
+        assert fingerprint.hexdigest() == expected, split
+    for size in (1, 13, StatementFingerprint.CARRY, StatementFingerprint.CARRY + 1, 4096):
+        fingerprint = StatementFingerprint()
+        for i in range(0, len(regenerated), size):
+            fingerprint.update(regenerated[i:i + size])
+        assert fingerprint.hexdigest() == expected, size
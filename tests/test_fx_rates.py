@@ -0,0 +1,83 @@
+# tests/test_fx_rates.py
+import pytest
+
+from fx_rates import FxRateTable, conversion_rate
+from nav_store import NavStore
+
+
+@pytest.fixture
+def table():
+    table = FxRateTable()
+    # ConversionRates 以账户基础货币 (USD) 报价: 1 HKD = 0.128 USD，1 EUR = 1.10 USD
+    table.add([
+        ('2025-01-02', 'HKD', 'USD', 0.128),
+        ('2025-01-03', 'HKD', 'USD', 0.129),
+        ('2025-01-02', 'EUR', 'USD', 1.10),
+        ('2025-01-06', 'EUR', 'USD', 1.05),
+    ])
+    return table
+
+
+def test_direct_lookup_carries_last_quote_forward(table):
+    assert table.rate('HKD', 'USD', '2025-01-02') == pytest.approx(0.128)
+    # 周末沿用周五的汇率
+    assert table.rate('HKD', 'USD', '20250105') == pytest.approx(0.129)
+    assert table.rate('HKD', 'USD', '2025-01-01') is None
+    assert table.rate('USD', 'USD', '2025-01-01') == 1.0
+
+
+def test_inverse_lookup(table):
+    assert table.rate('USD', 'HKD', '2025-01-03') == pytest.approx(1 / 0.129)
+    assert table.rate('USD', 'EUR', '2025-01-07') == pytest.approx(1 / 1.05)
+
+
+def test_pivot_lookup_through_third_currency(table):
+    # HKD→EUR 没有直接报价，经由 USD: HKD→USD × USD→EUR
+    assert table.rate('HKD', 'EUR', '2025-01-02') == pytest.approx(0.128 / 1.10)
+    assert table.rate('EUR', 'HKD', '2025-01-06') == pytest.approx(1.05 / 0.129)
+    rates = table.rates('HKD', 'EUR', ['2025-01-01', '2025-01-03', '2025-01-06'])
+    assert rates[0] != rates[0]     # 早于最早报价为 NaN
+    assert rates[1:].tolist() == pytest.approx([0.129 / 1.10, 0.129 / 1.05])
+    assert table.rate('HKD', 'JPY', '2025-01-06') is None
+
+
+def test_rates_persist_and_later_quotes_win(tmp_path):
+    store = NavStore(tmp_path / 'nav_history.sqlite3')
+    try:
+        FxRateTable(store).add([('2025-01-02', 'HKD', 'USD', 0.128)])
+        reloaded = FxRateTable(store)
+        reloaded.add([('2025-01-02', 'HKD', 'USD', 0.127)])
+        assert reloaded.rate('HKD', 'USD', '2025-01-02') == pytest.approx(0.127)
+        assert FxRateTable(store).rate('HKD', 'USD', '2025-01-02') == pytest.approx(0.127)
+    finally:
+        store.close()
+
+
+def test_consolidate_converts_each_row_on_its_own_date(table):
+    series = [
+        ('USD', [('2025-01-02', 100.0, 110.0, 10.0, 0.0)]),
+        ('HKD', [('2025-01-02', 1000.0, 1000.0, 0.0, 0.0), ('2025-01-03', 1000.0, 1100.0, 100.0, 0.0)]),
+    ]
+    records, missing = table.consolidate(series, 'EUR')
+    assert missing == []
+    assert [r[0] for r in records] == ['2025-01-02', '2025-01-03']
+    assert records[0][2] == pytest.approx(110.0 / 1.10 + 1000.0 * 0.128 / 1.10)
+    assert records[1][3] == pytest.approx(100.0 * 0.129 / 1.10)
+
+
+def test_consolidate_leaves_out_days_without_rate(table):
+    series = [
+        ('USD', [('2025-01-01', 100.0, 100.0, 0.0, 0.0), ('2025-01-02', 100.0, 110.0, 10.0, 0.0)]),
+        ('HKD', [('2025-01-01', 1000.0, 1000.0, 0.0, 0.0), ('2025-01-02', 1000.0, 1000.0, 0.0, 0.0)]),
+    ]
+    # 01-01 早于最早的汇率，不能按 1:1 把 HKD 与 USD 相加
+    records, missing = table.consolidate(series, 'USD')
+    assert missing == ['2025-01-01']
+    assert records == [('2025-01-02', pytest.approx(228.0), pytest.approx(238.0), pytest.approx(10.0), 0.0)]
+
+
+def test_conversion_rate_rows():
+    assert conversion_rate({'reportDate': '20250102', 'fromCurrency': 'hkd', 'toCurrency': 'USD', 'rate': '0.128'}) \
+        == ('2025-01-02', 'HKD', 'USD', 0.128)
+    # IBKR 对取不到的汇率给出 -1
+    assert conversion_rate({'reportDate': '20250102', 'fromCurrency': 'XYZ', 'toCurrency': 'USD', 'rate': '-1'}) is None
@@ -0,0 +1,71 @@
+# tests/test_intraday.py
+from datetime import datetime
+
+import pytest
+
+from flex_parser import StatementFingerprint
+from flex_samples import restamp_when_generated, write_statement
+from stub_server import StubServer
+
+
+class NoWaitLimiter:
+    """不限流: 同一 token 每秒1次的限制会让每次检查多等1秒"""
+
+    def acquire(self, token):
+        return 0.0
+
+
+@pytest.fixture
+def server():
+    server = StubServer().start()
+    yield server
+    server.stop()
+
+
+def _fingerprint(content, chunk_size):
+    fingerprint = StatementFingerprint()
+    for i in range(0, len(content), chunk_size):
+        fingerprint.update(content[i:i + chunk_size])
+    return fingerprint.hexdigest()
+
+
+def test_fingerprint_ignores_when_generated(tmp_path):
+    with open(tmp_path / 'statement.xml', 'wb') as f:
+        write_statement(f, positions=50, generated_at=datetime(2025, 1, 2, 10, 15))
+    content = (tmp_path / 'statement.xml').read_bytes()
+    regenerated = restamp_when_generated(content, datetime(2025, 1, 2, 10, 20, 37))
+    assert regenerated != content
+    # 属性跨块边界时结果也相同
+    assert {_fingerprint(c, size) for c in (content, regenerated) for size in (1, 97, 4096)} == {_fingerprint(content, 1 << 20)}
+    assert _fingerprint(content.replace(b'mtm="', b'mtm="1'), 4096) != _fingerprint(content, 4096)
+
+
+def test_check_intraday_unchanged_when_only_when_generated_differs(server, make_tracker, tmp_path):
+    tracker = make_tracker({
+        'FLEX_BASE_URL': server.flex_base_url, 'FLEX_POLL_INITIAL_DELAY': '0',
+        'INTRADAY_INTERVAL': '60', 'INTRADAY_ALERT_ABS': '0', 'INTRADAY_ALERT_PCT': '0',
+    }, flex_limiter=NoWaitLimiter())
+
+    assert tracker.check_intraday()['status'] == 'below_threshold'
+    # 替身服务器每次重新生成报告，whenGenerated 不同，其余内容不变
+    assert tracker.check_intraday()['status'] == 'unchanged'
+    assert server.stats['get_statement'] == 2
+
+    server.config['positions'] = 5
+    server._statements.clear()
+    assert tracker.check_intraday()['status'] == 'below_threshold'
+    assert tracker.check_intraday()['status'] == 'unchanged'
+
+    # 盘中报告不写入报告缓存
+    assert list((tmp_path / 'flex_cache' / 'blobs').iterdir()) == []
+
+
+def test_intraday_query_is_configured_per_account(make_tracker):
+    tracker = make_tracker({'IB_FLEX_ACCOUNTS': 'token_a:daily_a:intraday_a,token_b:daily_b',
+                            'INTRADAY_QUERY_ID': 'intraday_global'})
+    # 多账户时全局 INTRADAY_QUERY_ID 不适用于其他 token 的 Query，未单独指定的账户沿用日报 Query
+    assert tracker.intraday_accounts == [('token_a', 'intraday_a'), ('token_b', 'daily_b')]
+    assert tracker.flex_accounts == [('token_a', 'daily_a'), ('token_b', 'daily_b')]
+
+    tracker = make_tracker({'IB_FLEX_ACCOUNTS': 'token_a:daily_a', 'INTRADAY_QUERY_ID': 'intraday_global'})
+    assert tracker.intraday_accounts == [('token_a', 'intraday_global')]
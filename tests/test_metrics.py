@@ -0,0 +1,62 @@
+# tests/test_metrics.py
+import pytest
+
+from metrics import MetricsRegistry
+
+
+@pytest.fixture
+def registry():
+    return MetricsRegistry()
+
+
+def test_render_prometheus(registry):
+    requests = registry.counter('flex_requests_total', 'Flex 请求次数', ['endpoint'])
+    requests.inc(endpoint='get_statement')
+    requests.inc(2, endpoint='send_request')
+    registry.gauge('tenants', '租户数').set(3)
+    registry.counter('unused_total', '没有样本的指标')
+    latency = registry.histogram('latency_seconds', '耗时', ['channel'], buckets=(1, 5))
+    latency.observe(0.5, channel='te"st')
+    latency.observe(7, channel='te"st')
+
+    assert registry.render_prometheus() == '\n'.join([
+        '# HELP flex_requests_total Flex 请求次数',
+        '# TYPE flex_requests_total counter',
+        'flex_requests_total{endpoint="get_statement"} 1',
+        'flex_requests_total{endpoint="send_request"} 2',
+        '# HELP latency_seconds 耗时',
+        '# TYPE latency_seconds histogram',
+        'latency_seconds_bucket{channel="te\\"st",le="1"} 1',
+        'latency_seconds_bucket{channel="te\\"st",le="5"} 1',
+        'latency_seconds_bucket{channel="te\\"st",le="+Inf"} 2',
+        'latency_seconds_sum{channel="te\\"st"} 7.5',
+        'latency_seconds_count{channel="te\\"st"} 2',
+        '# HELP tenants 租户数',
+        '# TYPE tenants gauge',
+        'tenants 3',
+        '# HELP unused_total 没有样本的指标',
+        '# TYPE unused_total counter',
+    ]) + '\n'
+
+
+def test_registering_same_name_returns_existing_metric(registry):
+    counter = registry.counter('jobs_total', '任务数')
+    assert registry.counter('jobs_total', '任务数') is counter
+    with pytest.raises(ValueError):
+        registry.histogram('jobs_total', '任务数')
+    with pytest.raises(ValueError):
+        counter.inc(kind='cycle')
+
+
+def test_histogram_quantiles_interpolate_within_buckets(registry):
+    histogram = registry.histogram('ready_seconds', '就绪耗时', buckets=(1, 2, 5))
+    for value in (0.5, 1.5, 1.5, 3, 10):
+        histogram.observe(value)
+
+    [sample] = histogram.snapshot()
+    assert (sample['count'], sample['sum']) == (5, 16.5)
+    # 中位数的排名 2.5 落在 (1, 2] 桶内 (该桶第 1.5/2 个样本)
+    assert sample['p50'] == pytest.approx(1.75)
+    # 排名落在 +Inf 桶时返回最大的有限边界
+    assert sample['p90'] == sample['p99'] == 5
+    assert registry.histogram('empty_seconds', '无样本').quantile({'count': 0}, 0.5) is None
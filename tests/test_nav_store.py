@@ -0,0 +1,126 @@
+# tests/test_nav_store.py
+import json
+
+import pytest
+
+from nav_store import CONSOLIDATED_ACCOUNT, NavStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = NavStore(tmp_path / 'nav_history.sqlite3')
+    yield store
+    store.close()
+
+
+def test_period_pl_subtracts_deposits(store):
+    store.upsert_many(CONSOLIDATED_ACCOUNT, [
+        ('2025-01-02', 1000.0, 1010.0, 10.0, 0.0),
+        ('2025-01-03', 1010.0, 1125.0, 15.0, 100.0),
+        ('2025-01-06', 1125.0, 1120.0, -5.0, 0.0),
+    ])
+    period = store.period('2025-01-01', '2025-01-31')
+    assert period['days'] == 3
+    assert period['start_nav'] == 1000.0 and period['end_nav'] == 1120.0
+    assert period['deposits'] == pytest.approx(100.0)
+    assert period['mtm'] == pytest.approx(20.0)
+    assert period['pl'] == pytest.approx(20.0)
+
+    week = store.period('2025-01-03', '2025-01-03')
+    assert week['pl'] == pytest.approx(15.0) and week['deposits'] == pytest.approx(100.0)
+    assert store.period('2025-02-01', '2025-02-28') is None
+
+
+def test_out_of_order_insert_rebuilds_prefix_sums(store):
+    store.upsert_many(CONSOLIDATED_ACCOUNT, [('2025-01-06', 1125.0, 1120.0, -5.0, 0.0)])
+    store.upsert_many(CONSOLIDATED_ACCOUNT, [('2025-01-02', 1000.0, 1010.0, 10.0, 0.0),
+                                             ('2025-01-03', 1010.0, 1125.0, 15.0, 100.0)])
+    # 覆盖已有日期不会重复累计
+    store.upsert_many(CONSOLIDATED_ACCOUNT, [('2025-01-03', 1010.0, 1125.0, 15.0, 100.0)])
+    period = store.period('2025-01-01', '2025-01-31')
+    assert period['days'] == 3
+    assert period['mtm'] == pytest.approx(20.0)
+    assert period['deposits'] == pytest.approx(100.0)
+    assert store.last_n_days(2, '2025-01-06')['start_date'] == '2025-01-03'
+
+
+def test_accounts_are_isolated_per_namespace(store):
+    alice, bob = store.scoped('alice'), store.scoped('bob')
+    alice.upsert_many('U1', [('2025-01-02', 1.0, 2.0, 1.0, 0.0)])
+    bob.upsert_many('U2', [('2025-01-02', 1.0, 3.0, 2.0, 0.0)])
+    assert alice.accounts() == ['U1'] and bob.accounts() == ['U2']
+    assert store.accounts() == []
+    assert alice.period('2025-01-01', '2025-01-31', 'U1')['pl'] == pytest.approx(1.0)
+
+
+def test_legacy_state_baselines_seed_empty_store(tmp_path, make_tracker):
+    # 旧版状态: 本月首个交易日 2025-01-02 期初 1000，本周 (2025-01-06 起) 期初 1100，最后一份日报为 2025-01-08
+    (tmp_path / 'tracker_state.json').write_text(json.dumps({
+        'last_report_details': {'reportDate': '2025-01-08', 'startingValue': 1150.0, 'endingValue': 1180.0,
+                                'mtm': 10.0, 'depositsWithdrawals': 20.0, 'raw_from_date': '20250108'},
+        'weekly_start_nav': 1100.0, 'weekly_deposits': 70.0,
+        'monthly_start_nav': 1000.0, 'monthly_deposits': 120.0,
+    }), encoding='utf-8')
+    tracker = make_tracker()
+
+    week = tracker.nav_store.period('2025-01-06', '2025-01-08')
+    assert week['pl'] == pytest.approx(1180.0 - 1100.0 - 70.0)
+    month = tracker.nav_store.period('2025-01-01', '2025-01-08')
+    assert month['pl'] == pytest.approx(1180.0 - 1000.0 - 120.0)
+    assert 'weekly_start_nav' not in tracker.state and 'monthly_deposits' not in tracker.state
+
+    # 字段已删除并写入状态日志，重启后不会重复写入
+    tracker.nav_store.close()
+    reloaded = make_tracker()
+    assert 'weekly_start_nav' not in reloaded.state
+    assert reloaded.nav_store.period('2025-01-01', '2025-01-08')['days'] == 3
+
+
+def _write_legacy_state(tmp_path):
+    (tmp_path / 'tracker_state.json').write_text(json.dumps({
+        'last_report_details': {'reportDate': '2025-01-08', 'startingValue': 1150.0, 'endingValue': 1180.0,
+                                'mtm': 10.0, 'depositsWithdrawals': 20.0, 'raw_from_date': '20250108'},
+        'weekly_start_nav': 1100.0, 'weekly_deposits': 70.0,
+        'monthly_start_nav': 1000.0, 'monthly_deposits': 120.0,
+    }), encoding='utf-8')
+
+
+def _hkd_report(report_date, starting, ending, mtm):
+    account = {'accountId': 'U1', 'currency': 'USD', 'reportDate': report_date, 'fxRate': 7.8,
+               'startingValue': starting, 'endingValue': ending, 'mtm': mtm, 'depositsWithdrawals': 0.0}
+    return {'currency': 'HKD', 'reportDate': report_date, 'accounts': [account],
+            **{key: account[key] * 7.8 for key in ('startingValue', 'endingValue', 'mtm', 'depositsWithdrawals')}}
+
+
+def test_legacy_history_is_converted_when_report_currency_changes(tmp_path, make_tracker):
+    _write_legacy_state(tmp_path)
+    tracker = make_tracker({'REPORT_CURRENCY': 'HKD'})
+    tracker.fx_rates.add([('2025-01-02', 'USD', 'HKD', 7.8)])
+    tracker._record_report(_hkd_report('2025-01-09', 1180.0, 1190.0, 10.0))
+
+    assert tracker.nav_store.currency() == 'HKD'
+    assert [row[2] for row in tracker.nav_store.series()] == pytest.approx([1100.0 * 7.8, 1150.0 * 7.8, 1180.0 * 7.8, 1190.0 * 7.8])
+    week = tracker.nav_store.period('2025-01-06', '2025-01-09')
+    assert week['pl'] == pytest.approx((1180.0 - 1100.0 - 70.0 + 10.0) * 7.8)
+
+
+def test_legacy_history_without_rate_is_archived(tmp_path, make_tracker):
+    _write_legacy_state(tmp_path)
+    tracker = make_tracker({'REPORT_CURRENCY': 'HKD'})
+    # 只有 01-08 起的汇率: 01-02 与 01-06 的美元记录无法换算，不能与港币记录混在一起
+    tracker.fx_rates.add([('2025-01-08', 'USD', 'HKD', 7.8)])
+    tracker._record_report(_hkd_report('2025-01-09', 1180.0, 1190.0, 10.0))
+
+    assert [row[0] for row in tracker.nav_store.series()] == ['2025-01-08', '2025-01-09']
+    assert tracker.nav_store.period('2025-01-01', '2025-01-09')['pl'] == pytest.approx((1180.0 - 1150.0 - 20.0 + 10.0) * 7.8)
+    assert [row[0] for row in tracker.nav_store.series('ARCHIVED:TOTAL:USD')] == ['2025-01-02', '2025-01-06']
+    assert tracker.nav_store.accounts() == ['U1']
+
+
+def test_missing_report_fx_rate_skips_the_cycle(make_tracker):
+    tracker = make_tracker({'REPORT_CURRENCY': 'HKD'})
+    details = {'accountId': 'U1', 'currency': 'USD', 'reportDate': '2025-01-09', 'raw_from_date': '20250109',
+               'startingValue': 1180.0, 'endingValue': 1190.0, 'mtm': 10.0, 'depositsWithdrawals': 0.0}
+    assert tracker._consolidate_accounts([details]) is None
+    tracker.fx_rates.add([('2025-01-02', 'USD', 'HKD', 7.8)])
+    assert tracker._consolidate_accounts([details])['endingValue'] == pytest.approx(1190.0 * 7.8)
@@ -0,0 +1,22 @@
+# tests/test_notification_dispatcher.py
+import pytest
+
+from stub_server import StubServer
+
+
+@pytest.fixture
+def server():
+    server = StubServer().start()
+    yield server
+    server.stop()
+
+
+def test_telegram_api_base_is_read_from_tracker_config(server, make_tracker, monkeypatch):
+    monkeypatch.setenv('TELEGRAM_API_BASE', 'http://127.0.0.1:9')
+    tracker = make_tracker({'TELEGRAM_API_BASE': server.base_url + '/', 'TELEGRAM_BOT_TOKEN': '123456:TEST',
+                            'TELEGRAM_CHAT_IDS': '111,222', 'BARK_URL': ''}, dispatcher=None)
+
+    assert tracker.dispatcher.telegram_api_base == server.base_url
+    results = tracker.dispatcher.dispatch('标题', '内容')
+    assert [r['ok'] for r in results] == [True, True]
+    assert server.stats['telegram_ok'] == 2
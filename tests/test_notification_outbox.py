@@ -0,0 +1,38 @@
+# tests/test_notification_outbox.py
+import logging
+
+from notification_outbox import NotificationOutbox
+
+
+class FakeDispatcher:
+    def __init__(self, targets):
+        self.targets = targets
+        self.delivered = []
+
+    def recipients(self):
+        return list(self.targets)
+
+    def deliver_many(self, deliveries):
+        self.delivered.extend(deliveries)
+        return [{'channel': c, 'recipient': r, 'ok': True, 'latency': 0.0, 'error': None} for c, r, _, _ in deliveries]
+
+
+def test_enqueue_is_idempotent_per_recipient(tmp_path):
+    dispatcher = FakeDispatcher([('bark', 'default'), ('telegram', '111')])
+    outbox = NotificationOutbox(str(tmp_path / 'outbox.jsonl'), dispatcher, clock=lambda: 1000.0)
+    assert outbox.enqueue('daily:20250102', 'title', 'body') == 2
+    assert outbox.enqueue('daily:20250102', 'title', 'body') == 0
+    outbox.drain_once()
+    assert len(dispatcher.delivered) == 2
+
+    reloaded = NotificationOutbox(str(tmp_path / 'outbox.jsonl'), dispatcher, clock=lambda: 1000.0)
+    assert reloaded.enqueue('daily:20250102', 'title', 'body') == 0
+    assert reloaded.pending_count() == 0
+
+
+def test_enqueue_without_recipients_logs_configuration_error(tmp_path, caplog):
+    outbox = NotificationOutbox(str(tmp_path / 'outbox.jsonl'), FakeDispatcher([]))
+    with caplog.at_level(logging.INFO):
+        assert outbox.enqueue('daily:20250102', 'title', 'body') == 0
+    assert '未配置任何通知渠道' in caplog.text
+    assert '已在发件箱中或已投递' not in caplog.text
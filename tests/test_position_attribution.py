@@ -0,0 +1,51 @@
+# tests/test_position_attribution.py
+import pytest
+
+from flex_parser import parse_flex_statements
+from position_attribution import StatementColumns
+
+# 基础货币 USD 的账户: 港股以 HKD 计价 (fxRateToBase 0.128)，美股行没有 fxRateToBase；第二个 FlexStatement 是前一天的报告
+STATEMENT = b'''<FlexQueryResponse><FlexStatements count="2">
+<FlexStatement accountId="U1" fromDate="20250103" toDate="20250103" whenGenerated="20250103;201500">
+<ChangeInNAV currency="USD" startingValue="1000" endingValue="1100" mtm="100" depositsWithdrawals="0" />
+<OpenPositions>
+<OpenPosition symbol="700" currency="HKD" position="100" markPrice="400" positionValue="40000" fxRateToBase="0.128" levelOfDetail="SUMMARY" />
+<OpenPosition symbol="AAPL" currency="USD" position="10" markPrice="200" positionValue="2000" levelOfDetail="SUMMARY" />
+</OpenPositions>
+<Trades>
+<Trade symbol="700" currency="HKD" quantity="100" tradePrice="395" mtmPnl="500" fxRateToBase="0.128" levelOfDetail="EXECUTION" />
+<Trade symbol="AAPL" currency="USD" quantity="10" tradePrice="198" mtmPnl="20" levelOfDetail="EXECUTION" />
+</Trades>
+</FlexStatement>
+<FlexStatement accountId="U1" fromDate="20250102" toDate="20250102" whenGenerated="20250103;201500">
+<OpenPositions>
+<OpenPosition symbol="MSFT" currency="USD" position="5" markPrice="400" positionValue="2000" levelOfDetail="SUMMARY" />
+</OpenPositions>
+<Trades>
+<Trade symbol="700" currency="HKD" quantity="50" tradePrice="390" mtmPnl="1000" fxRateToBase="0.128" levelOfDetail="EXECUTION" />
+</Trades>
+</FlexStatement>
+</FlexStatements></FlexQueryResponse>'''
+
+
+def _parse(content):
+    columns = StatementColumns()
+    statements = parse_flex_statements(content, columns.sections())
+    return statements, columns.attribution()
+
+
+def test_local_currency_amounts_are_converted_to_base():
+    statements, attribution = _parse(STATEMENT)
+    assert len(statements) == 2
+    values = dict(zip(attribution.symbols.tolist(), attribution.value.tolist()))
+    pnl = dict(zip(attribution.symbols.tolist(), attribution.pnl.tolist()))
+    assert values == pytest.approx({'700': 5120.0, 'AAPL': 2000.0})
+    assert pnl == pytest.approx({'700': 64.0, 'AAPL': 20.0})
+
+
+def test_only_first_statement_is_collected():
+    _, attribution = _parse(STATEMENT)
+    # 第二个 FlexStatement 的 MSFT 持仓与 700 成交不计入
+    assert 'MSFT' not in attribution.symbols.tolist()
+    assert attribution.concentration(1)['positions'] == 2
+    assert attribution.top(1)[0] == [('700', pytest.approx(64.0))]
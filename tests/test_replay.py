@@ -0,0 +1,25 @@
+# tests/test_replay.py
+from datetime import date
+
+from flex_samples import write_daily_history
+from replay import replay
+from trading_calendar import TradingCalendar
+
+
+def test_replay_sends_one_daily_per_trading_day_across_long_weekend(tmp_path):
+    calendar = TradingCalendar()
+    # 2025-01-20 (马丁·路德·金纪念日) 休市，01-17 收盘后要隔三天才有下一份日报
+    days = list(calendar.trading_days(date(2025, 1, 13), date(2025, 1, 24)))
+    assert date(2025, 1, 20) not in days
+    recordings = tmp_path / 'recordings'
+    recordings.mkdir()
+    with open(recordings / 'U1234567.xml', 'wb') as f:
+        write_daily_history(f, days, account_id='U1234567')
+
+    messages, stats = replay(recordings, workdir=tmp_path / 'work')
+
+    dailies = [m for m in messages if m['title'].endswith('日报')]
+    assert stats['trading_days'] == len(days)
+    assert [m['title'].split()[-2] for m in dailies] == [day.isoformat() for day in days]
+    # 消息在生成当天投递，而不是带着下一次唤醒 (跨周末/长假) 的时间戳
+    assert [m['at'][:10] for m in dailies] == [day.isoformat() for day in days]
@@ -0,0 +1,33 @@
+# tests/test_schedule.py
+from datetime import datetime
+
+import pytest
+import pytz
+
+from clock import SimulatedClock
+from stub_server import StubServer
+
+ET = pytz.timezone('US/Eastern')
+
+
+@pytest.fixture
+def server():
+    server = StubServer().start()
+    yield server
+    server.stop()
+
+
+def test_no_flex_requests_on_non_trading_days(server, make_tracker):
+    # 2025-01-18 为周六，之后的周一 (01-20) 为马丁·路德·金纪念日
+    clock = SimulatedClock(ET.localize(datetime(2025, 1, 18, 10, 0)))
+    tracker = make_tracker({'FLEX_BASE_URL': server.flex_base_url}, clock=clock)
+
+    # 缓存中没有上一个交易日的报告，启动时也不请求 IBKR
+    assert tracker.run_initial()['status'] == 'skipped_non_trading_day'
+
+    # 周五收盘后的重试持续到周六时结束本轮，直接休眠到周二收盘前1分钟
+    tracker.hunt_active_for_current_cycle = True
+    clock.sleep(tracker.run_once())
+    assert not tracker.hunt_active_for_current_cycle
+    assert clock.now(ET) == ET.localize(datetime(2025, 1, 21, 15, 59))
+    assert server.stats.get('send_request', 0) == 0
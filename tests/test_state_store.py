@@ -0,0 +1,78 @@
+# tests/test_state_store.py
+import json
+
+import pytest
+
+from state_store import JournaledState, StateCorruptedError, TrackedDict
+
+
+def test_journal_replays_changes_over_snapshot(tmp_path):
+    store = JournaledState(tmp_path / 'state.json', compact_every=100)
+    state = store.load()
+    state['a'] = 1
+    state['b'] = {'nested': [1, 2]}
+    store.save(state)
+    state['a'] = 2
+    del state['b']
+    store.save(state)
+
+    assert not (tmp_path / 'state.json').exists()
+    assert len((tmp_path / 'state.json.journal').read_text().splitlines()) == 2
+    assert JournaledState(tmp_path / 'state.json').load() == {'a': 2}
+
+
+def test_save_writes_only_dirty_keys(tmp_path):
+    store = JournaledState(tmp_path / 'state.json')
+    # 构造时传入的键视为已持久化 (load 的返回值也是如此)，只有之后赋值的键才会写入日志
+    state = TrackedDict(big='x' * 1000)
+    state['small'] = 1
+    store.save(state)
+    state['small'] = 2
+    store.save(state)
+    store.save(state)   # 没有修改时不写日志
+    entries = [json.loads(line) for line in (tmp_path / 'state.json.journal').read_text().splitlines()]
+    assert entries == [{'set': {'small': 1}}, {'set': {'small': 2}}]
+
+
+def test_compaction_writes_snapshot_and_truncates_journal(tmp_path):
+    store = JournaledState(tmp_path / 'state.json', compact_every=3)
+    state = store.load()
+    for i in range(3):
+        state[f"k{i}"] = i
+        store.save(state)
+    assert json.loads((tmp_path / 'state.json').read_text()) == {'k0': 0, 'k1': 1, 'k2': 2}
+    assert (tmp_path / 'state.json.journal').read_text() == ''
+
+    state['k0'] = 'changed'
+    store.save(state)
+    assert JournaledState(tmp_path / 'state.json').load() == {'k0': 'changed', 'k1': 1, 'k2': 2}
+
+
+def test_torn_journal_tail_is_dropped(tmp_path):
+    store = JournaledState(tmp_path / 'state.json')
+    state = store.load()
+    state['a'] = 1
+    store.save(state)
+    with open(tmp_path / 'state.json.journal', 'a', encoding='utf-8') as f:
+        f.write('{"set": {"a": 2')
+    assert JournaledState(tmp_path / 'state.json').load() == {'a': 1}
+
+
+def test_corrupt_snapshot_is_moved_aside_and_not_overwritten(tmp_path):
+    (tmp_path / 'state.json').write_text('{"last_report_details": {"reportDate": "2025-01', encoding='utf-8')
+    (tmp_path / 'state.json.journal').write_text('{"set": {"a": 1}}\n', encoding='utf-8')
+    store = JournaledState(tmp_path / 'state.json')
+    with pytest.raises(StateCorruptedError):
+        store.load()
+
+    corrupt = list(tmp_path.glob('state.json.corrupt-*'))
+    assert len(corrupt) == 1
+    assert corrupt[0].read_text(encoding='utf-8').startswith('{"last_report_details"')
+    assert not (tmp_path / 'state.json').exists()
+    assert (tmp_path / 'state.json.journal').read_text() == '{"set": {"a": 1}}\n'
+
+
+def test_tracker_stops_on_corrupt_state(tmp_path, make_tracker):
+    (tmp_path / 'tracker_state.json').write_text('not json', encoding='utf-8')
+    with pytest.raises(StateCorruptedError):
+        make_tracker()
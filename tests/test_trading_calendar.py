@@ -0,0 +1,61 @@
+# tests/test_trading_calendar.py
+from datetime import date, time
+
+import pytest
+
+from trading_calendar import TradingCalendar, nyse_early_closes, nyse_holidays
+
+
+@pytest.fixture(scope='module')
+def calendar():
+    return TradingCalendar()
+
+
+def test_2025_holidays_match_nyse_schedule():
+    assert sorted(nyse_holidays(2025)) == [
+        date(2025, 1, 1), date(2025, 1, 9),      # 元旦、卡特总统国葬日
+        date(2025, 1, 20), date(2025, 2, 17),    # 马丁·路德·金纪念日、总统日
+        date(2025, 4, 18), date(2025, 5, 26),    # 耶稣受难日、阵亡将士纪念日
+        date(2025, 6, 19), date(2025, 7, 4),     # 六月节、独立日
+        date(2025, 9, 1), date(2025, 11, 27),    # 劳动节、感恩节
+        date(2025, 12, 25),
+    ]
+
+
+@pytest.mark.parametrize('day, expected', [
+    (date(2022, 1, 1), False),      # 元旦在周六时不顺延到前一个周五 (2021-12-31 照常交易)
+    (date(2021, 12, 31), True),
+    (date(2021, 7, 5), False),      # 独立日在周日，周一休市
+    (date(2022, 12, 26), False),    # 圣诞节在周日，周一休市
+    (date(2021, 12, 24), False),    # 圣诞节在周六，提前到周五休市
+    (date(2012, 10, 29), False),    # 飓风桑迪
+    (date(2018, 12, 5), False),     # 老布什总统国葬日
+    (date(2020, 6, 19), True),      # 六月节 2022 年才开始休市
+    (date(2026, 4, 3), False),      # 耶稣受难日
+    (date(2025, 10, 18), False),    # 周六
+])
+def test_trading_days(calendar, day, expected):
+    assert calendar.is_trading_day(day) is expected
+
+
+def test_early_closes(calendar):
+    assert sorted(nyse_early_closes(2025)) == [date(2025, 7, 3), date(2025, 11, 28), date(2025, 12, 24)]
+    # 独立日在周六 (2026-07-03 休市)，不再有提前收盘
+    assert date(2026, 7, 2) not in nyse_early_closes(2026)
+    assert calendar.close_time(date(2025, 11, 28)) == time(13, 0)
+    assert calendar.close_time(date(2025, 11, 26)) == time(16, 0)
+    assert calendar.close_time(date(2025, 11, 27)) is None
+    assert calendar.close_datetime(date(2025, 12, 24)).isoformat() == '2025-12-24T13:00:00-05:00'
+    assert calendar.close_datetime(date(2025, 7, 3)).isoformat() == '2025-07-03T13:00:00-04:00'
+
+
+def test_last_trading_day_of_week_and_month(calendar):
+    assert calendar.is_last_trading_day_of_week(date(2025, 4, 17))      # 周五耶稣受难日休市
+    assert not calendar.is_last_trading_day_of_week(date(2025, 4, 16))
+    assert calendar.is_last_trading_day_of_week(date(2025, 10, 17))
+    assert calendar.is_last_trading_day_of_month(date(2025, 5, 30))
+    assert calendar.is_last_trading_day_of_month(date(2024, 3, 28))     # 3月29日是耶稣受难日
+    assert not calendar.is_last_trading_day_of_month(date(2024, 3, 27))
+    assert calendar.previous_trading_day(date(2025, 1, 10)) == date(2025, 1, 8)
+    assert calendar.next_trading_day(date(2025, 12, 24)) == date(2025, 12, 26)
+    assert len(list(calendar.trading_days(date(2025, 1, 1), date(2025, 12, 31)))) == 250
@@ -0,0 +1,324 @@
+# tracker_daemon.py
+import argparse
+import heapq
+import itertools
+import json
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import metrics
+from ibkr_net_value_tracker import IBKRTracker
+from flex_client import FlexRateLimiter
+from fx_rates import FxRateTable
+from metrics import MetricsDumper, MetricsServer
+from nav_store import NavStore
+from notification_dispatcher import TELEGRAM_GLOBAL_RATE, NotificationDispatcher, pooled_session
+from rate_limit import RateLimiter
+from state_store import StateCorruptedError
+from trading_calendar import TradingCalendar
+
+# 每个租户独有、不允许回退到进程环境变量的配置项
+TENANT_KEYS = ('IB_FLEX_ACCOUNTS', 'IB_FLEX_TOKEN', 'IB_QUERY_ID', 'INTRADAY_QUERY_ID', 'BARK_URL', 'TELEGRAM_BOT_TOKEN',
+               'TELEGRAM_CHAT_IDS')
+TENANT_NAME_PATTERN = re.compile(r'^[A-Za-z0-9_.-]+$')
+
+DAEMON_TENANTS = metrics.gauge('daemon_tenants', '本进程负责的租户数')
+DAEMON_JOBS = metrics.counter('daemon_jobs_total', '守护进程执行的调度任务', ['kind', 'result'])
+DAEMON_JOB_LAG_SECONDS = metrics.histogram('daemon_job_lag_seconds', '任务实际开始时间晚于计划时间的秒数', ['kind'])
+
+_tenant_context = threading.local()
+
+
+class TenantLogFilter(logging.Filter):
+    """给日志记录加上当前线程正在处理的租户名"""
+
+    def filter(self, record):
+        record.tenant = getattr(_tenant_context, 'name', '-')
+        return True
+
+
+def load_tenant_specs(path):
+    """读取租户配置: JSON 数组或 JSON Lines，每个租户是一个以 .env 变量名为键、另带 name 的对象"""
+    text = Path(path).read_text(encoding='utf-8')
+    stripped = text.lstrip()
+    if stripped.startswith('['):
+        specs = json.loads(stripped)
+    else:
+        specs = [json.loads(line) for line in text.splitlines() if line.strip() and not line.lstrip().startswith('#')]
+
+    seen = set()
+    for spec in specs:
+        name = spec.get('name', '')
+        if not TENANT_NAME_PATTERN.match(name):
+            raise ValueError(f"租户名 '{name}' 无效，只能包含字母、数字、'_'、'.'、'-'")
+        if name in seen:
+            raise ValueError(f"租户名 '{name}' 重复")
+        seen.add(name)
+        if not spec.get('IB_FLEX_ACCOUNTS') and not (spec.get('IB_FLEX_TOKEN') and spec.get('IB_QUERY_ID')):
+            raise ValueError(f"租户 '{name}' 缺少 IB_FLEX_ACCOUNTS 或 IB_FLEX_TOKEN/IB_QUERY_ID")
+    return specs
+
+
+def parse_shard(value):
+    """'i/N' -> (i, N)"""
+    index, _, count = value.partition('/')
+    index, count = int(index), int(count or 1)
+    if not 0 <= index < count:
+        raise ValueError(f"分片 {value} 无效，应为 i/N 且 0 <= i < N")
+    return index, count
+
+
+def in_shard(name, shard):
+    """按租户名的 CRC32 稳定地分配到各分片，增删租户不会影响其他租户所在的分片"""
+    index, count = shard
+    return zlib.crc32(name.encode('utf-8')) % count == index
+
+
+class TenantExecutor:
+    """把某个租户的并发请求提交到共享工作线程池，执行时带上租户名，日志中仍能看出是哪个租户"""
+
+    def __init__(self, pool, name):
+        self.pool = pool
+        self.name = name
+
+    def submit(self, fn, *args, **kwargs):
+        return self.pool.submit(self._run, fn, args, kwargs)
+
+    def _run(self, fn, args, kwargs):
+        _tenant_context.name = self.name
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _tenant_context.name = '-'
+
+
+class Tenant:
+    __slots__ = ('name', 'tracker', 'busy', 'initial_done', 'drain_at')
+
+    def __init__(self, name, tracker):
+        self.name = name
+        self.tracker = tracker
+        self.busy = False
+        self.initial_done = False
+        self.drain_at = None
+
+
+class TrackerDaemon:
+    """
+    在一个进程中为多个租户运行追踪器: 所有租户共用一个工作线程池、交易日历、NAV 库连接、
+    推送线程池与连接池，以及按 token 和全局的 Flex 请求限流。每个租户的状态、发件箱和报告缓存
+    保存在 data_dir/<name>/ 下互不影响，空闲租户只占用少量内存。
+    """
+
+    def __init__(self, tenant_specs, data_dir, workers=32, notify_workers=64, shard=(0, 1), flex_limiter=None):
+        self.data_dir = Path(data_dir)
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+        self.calendar = TradingCalendar()
+        self.nav_store = NavStore(self.data_dir / 'nav_history.sqlite3')
+        # 汇率是公共数据，全部租户共用一张汇率表
+        self.fx_rates = FxRateTable(self.nav_store)
+        self.flex_limiter = flex_limiter or FlexRateLimiter(
+            per_token_per_minute=int(os.getenv('FLEX_TOKEN_REQUESTS_PER_MINUTE', '10')),
+            global_per_second=float(os.getenv('FLEX_GLOBAL_REQUESTS_PER_SECOND', '10')),
+        )
+        self.notify_executor = ThreadPoolExecutor(max_workers=notify_workers, thread_name_prefix='notify')
+        self.bark_session = pooled_session(notify_workers)
+        self.telegram_session = pooled_session(notify_workers)
+        self._telegram_limiters = {}
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='tenant')
+
+        self._queue = []    # (计划时间, 序号, 租户, 任务类型)
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._stopping = False
+
+        self.tenants = []
+        for spec in tenant_specs:
+            if not in_shard(spec['name'], shard):
+                continue
+            try:
+                self.tenants.append(self._build_tenant(spec))
+            except (StateCorruptedError, OSError) as e:
+                # 单个租户的状态损坏只停止该租户，其余租户照常运行
+                logging.critical(f"租户 {spec['name']} 的状态无法加载，本次不调度该租户: {e}")
+        DAEMON_TENANTS.set(len(self.tenants))
+        logging.info(f"分片 {shard[0]}/{shard[1]}: 共 {len(tenant_specs)} 个租户，本进程负责 {len(self.tenants)} 个。")
+
+    def _telegram_limiter(self, bot_token):
+        """Telegram 的全局限流按 Bot 计算，多个租户使用同一个 Bot 时共用一个令牌桶"""
+        limiter = self._telegram_limiters.get(bot_token)
+        if limiter is None:
+            limiter = self._telegram_limiters[bot_token] = RateLimiter(TELEGRAM_GLOBAL_RATE)
+        return limiter
+
+    def _build_tenant(self, spec):
+        name = spec['name']
+        tenant_dir = self.data_dir / name
+        tenant_dir.mkdir(parents=True, exist_ok=True)
+        config = {key: '' for key in TENANT_KEYS}
+        config.update({
+            'TRACKER_STATE_PATH': str(tenant_dir / 'tracker_state.json'),
+            'NOTIFY_OUTBOX_PATH': str(tenant_dir / 'notification_outbox.jsonl'),
+            'FLEX_CACHE_DIR': str(tenant_dir / 'flex_cache'),
+            # 指标由守护进程统一提供
+            'METRICS_PORT': '0',
+            'METRICS_DUMP_INTERVAL': '0',
+        })
+        config.update({key: str(value) for key, value in spec.items() if key != 'name'})
+
+        telegram_bot_token = config['TELEGRAM_BOT_TOKEN']
+        dispatcher = NotificationDispatcher(
+            bark_url=config['BARK_URL'],
+            telegram_bot_token=telegram_bot_token,
+            telegram_chat_ids=config['TELEGRAM_CHAT_IDS'].split(','),
+            telegram_api_base=config.get('TELEGRAM_API_BASE'),
+            executor=self.notify_executor,
+            bark_session=self.bark_session,
+            telegram_session=self.telegram_session,
+            telegram_limiter=self._telegram_limiter(telegram_bot_token),
+        )
+        _tenant_context.name = name
+        try:
+            # 报告未就绪时不在工作线程中休眠，由调度器在 retry_after 秒后再次执行该租户的任务继续轮询
+            tracker = IBKRTracker(config, calendar=self.calendar, dispatcher=dispatcher,
+                                  nav_store=self.nav_store.scoped(name), flex_limiter=self.flex_limiter, fx_rates=self.fx_rates,
+                                  executor=TenantExecutor(self.pool, name), defer_polls=True)
+        finally:
+            _tenant_context.name = '-'
+        return Tenant(name, tracker)
+
+    def _schedule(self, tenant, kind, delay):
+        due = time.monotonic() + max(0.0, delay)
+        with self._cond:
+            if kind == 'drain':
+                # 每个租户只保留最早的一个投递任务
+                if tenant.drain_at is not None and tenant.drain_at <= due:
+                    return
+                tenant.drain_at = due
+            heapq.heappush(self._queue, (due, next(self._sequence), tenant, kind))
+            self._cond.notify()
+
+    def _run_job(self, tenant, kind, due):
+        DAEMON_JOB_LAG_SECONDS.observe(max(0.0, time.monotonic() - due), kind=kind)
+        _tenant_context.name = tenant.name
+        tracker = tenant.tracker
+        try:
+            if kind == 'cycle':
+                try:
+                    delay = None
+                    if not tenant.initial_done:
+                        tenant.initial_done = True
+                        initial = tracker.run_initial()
+                        if initial['status'] == 'awaiting_statement':
+                            # 首次获取的报告尚未就绪，到时继续首次获取
+                            tenant.initial_done = False
+                            delay = initial['retry_after']
+                    if delay is None:
+                        delay = tracker.run_once()
+                    DAEMON_JOBS.inc(kind=kind, result='ok')
+                except Exception as e:
+                    logging.error(f"租户调度发生意外错误: {e}", exc_info=True)
+                    DAEMON_JOBS.inc(kind=kind, result='error')
+                    delay = 600
+                self._schedule(tenant, 'cycle', delay)
+                if tracker.outbox.pending_count():
+                    self._schedule(tenant, 'drain', 0)
+            else:
+                try:
+                    wait = tracker.outbox.drain_once()
+                    DAEMON_JOBS.inc(kind=kind, result='ok')
+                except Exception as e:
+                    logging.error(f"发件箱投递发生意外错误: {e}", exc_info=True)
+                    DAEMON_JOBS.inc(kind=kind, result='error')
+                    wait = tracker.outbox.base_backoff
+                if wait is not None:
+                    self._schedule(tenant, 'drain', max(0.5, wait))
+        finally:
+            _tenant_context.name = '-'
+            with self._cond:
+                tenant.busy = False
+                self._cond.notify()
+
+    def start(self):
+        """为每个租户安排首次执行，有未投递通知的租户同时安排补发"""
+        for tenant in self.tenants:
+            self._schedule(tenant, 'cycle', 0)
+            if tenant.tracker.outbox.pending_count():
+                self._schedule(tenant, 'drain', 0)
+
+    def run_forever(self):
+        self.start()
+        while True:
+            with self._cond:
+                while not self._stopping:
+                    now = time.monotonic()
+                    if self._queue and self._queue[0][0] <= now:
+                        break
+                    self._cond.wait(timeout=(self._queue[0][0] - now) if self._queue else None)
+                if self._stopping:
+                    return
+                due, _, tenant, kind = heapq.heappop(self._queue)
+                if kind == 'drain':
+                    if tenant.drain_at != due:
+                        continue    # 已被更早的投递任务取代
+                    tenant.drain_at = None
+                if tenant.busy:
+                    # 同一租户的任务串行执行，稍后再试
+                    heapq.heappush(self._queue, (now + 1.0, next(self._sequence), tenant, kind))
+                    if kind == 'drain':
+                        tenant.drain_at = now + 1.0
+                    continue
+                tenant.busy = True
+            self.pool.submit(self._run_job, tenant, kind, due)
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self.pool.shutdown(wait=True)
+        self.notify_executor.shutdown(wait=True)
+        self.nav_store.close()
+
+
+def _install_tenant_logging():
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - [%(tenant)s] %(message)s')
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(TenantLogFilter())
+        handler.setFormatter(formatter)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="IBKR 资产追踪器多租户守护进程")
+    parser.add_argument('--tenants', required=True, help="租户配置文件 (JSON 数组或 JSON Lines)")
+    parser.add_argument('--data-dir', default=str(Path(__file__).resolve().parent / 'tenants_data'),
+                        help="各租户状态/发件箱/缓存以及共享 NAV 库的存放目录")
+    parser.add_argument('--shard', default='0/1', help="只运行第 i 个分片的租户，格式 i/N (默认 0/1 即全部)")
+    parser.add_argument('--workers', type=int, default=int(os.getenv('DAEMON_WORKERS', '32')),
+                        help="租户任务共用的工作线程数")
+    parser.add_argument('--notify-workers', type=int, default=int(os.getenv('NOTIFY_MAX_WORKERS', '64')),
+                        help="推送共用的线程数")
+    args = parser.parse_args()
+
+    _install_tenant_logging()
+    daemon = TrackerDaemon(load_tenant_specs(args.tenants), args.data_dir, workers=args.workers,
+                           notify_workers=args.notify_workers, shard=parse_shard(args.shard))
+
+    metrics_port = int(os.getenv('METRICS_PORT', '9108'))
+    if metrics_port:
+        # 多个分片进程在同一台机器上运行时各自使用 METRICS_PORT + i
+        MetricsServer(os.getenv('METRICS_HOST', '127.0.0.1'), metrics_port + parse_shard(args.shard)[0]).start()
+    dump_interval = float(os.getenv('METRICS_DUMP_INTERVAL', '300'))
+    if dump_interval > 0:
+        MetricsDumper(Path(args.data_dir) / f"metrics.shard{parse_shard(args.shard)[0]}.jsonl", interval=dump_interval).start()
+
+    try:
+        daemon.run_forever()
+    except KeyboardInterrupt:
+        logging.info("收到中断信号，守护进程退出。")
+        daemon.stop()
@@ -0,0 +1,144 @@
+# trading_calendar.py
+from datetime import date, datetime, time as dt_time, timedelta
+
+import pytz
+
+REGULAR_OPEN = dt_time(9, 30)
+REGULAR_CLOSE = dt_time(16, 0)
+EARLY_CLOSE = dt_time(13, 0)
+
+# 非常规休市 (国丧、飓风、9·11 等)
+SPECIAL_CLOSURES = {
+    date(2001, 9, 11), date(2001, 9, 12), date(2001, 9, 13), date(2001, 9, 14),
+    date(2004, 6, 11),
+    date(2007, 1, 2),
+    date(2012, 10, 29), date(2012, 10, 30),
+    date(2018, 12, 5),
+    date(2025, 1, 9),
+}
+
+
+def _easter(year):
+    """公历复活节日期 (Anonymous Gregorian algorithm)"""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def _nth_weekday(year, month, weekday, n):
+    """某月第 n 个星期几 (n=-1 表示最后一个)"""
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def _observed(day):
+    """周六的节日提前到周五，周日的节日顺延到周一"""
+    if day.weekday() == 5:
+        return day - timedelta(days=1)
+    if day.weekday() == 6:
+        return day + timedelta(days=1)
+    return day
+
+
+def nyse_holidays(year):
+    holidays = set()
+    new_year = date(year, 1, 1)
+    # 元旦落在周六时 NYSE 不在前一年12月31日补休
+    if new_year.weekday() != 5:
+        holidays.add(_observed(new_year))
+    if year >= 1998:
+        holidays.add(_nth_weekday(year, 1, 0, 3))    # 马丁·路德·金纪念日
+    holidays.add(_nth_weekday(year, 2, 0, 3))        # 总统日
+    holidays.add(_easter(year) - timedelta(days=2))  # 耶稣受难日
+    holidays.add(_nth_weekday(year, 5, 0, -1))       # 阵亡将士纪念日
+    if year >= 2022:
+        holidays.add(_observed(date(year, 6, 19)))   # 六月节
+    holidays.add(_observed(date(year, 7, 4)))        # 独立日
+    holidays.add(_nth_weekday(year, 9, 0, 1))        # 劳动节
+    holidays.add(_nth_weekday(year, 11, 3, 4))       # 感恩节
+    holidays.add(_observed(date(year, 12, 25)))      # 圣诞节
+    holidays.update(d for d in SPECIAL_CLOSURES if d.year == year)
+    return holidays
+
+
+def nyse_early_closes(year):
+    """13:00 提前收盘的交易日: 独立日前一天、感恩节次日、平安夜 (均需为正常交易日)"""
+    candidates = {
+        date(year, 7, 3),
+        _nth_weekday(year, 11, 3, 4) + timedelta(days=1),
+        date(year, 12, 24),
+    }
+    holidays = nyse_holidays(year)
+    return {d for d in candidates if d.weekday() < 4 or d.month == 11} - holidays
+
+
+class TradingCalendar:
+    """离线预先计算好的 NYSE 交易日历，提供交易日、收盘时间以及周/月最后交易日的判断"""
+
+    def __init__(self, first_year=1995, last_year=2100, timezone='US/Eastern'):
+        self.first_year = first_year
+        self.last_year = last_year
+        self.tz = pytz.timezone(timezone)
+        self.holidays = frozenset(d for year in range(first_year, last_year + 1) for d in nyse_holidays(year))
+        self.early_closes = frozenset(d for year in range(first_year, last_year + 1) for d in nyse_early_closes(year))
+
+    def is_trading_day(self, day):
+        return day.weekday() < 5 and day not in self.holidays
+
+    def close_time(self, day):
+        """当天收盘时间 (ET)，非交易日返回 None"""
+        if not self.is_trading_day(day):
+            return None
+        return EARLY_CLOSE if day in self.early_closes else REGULAR_CLOSE
+
+    def close_datetime(self, day):
+        close = self.close_time(day)
+        if close is None:
+            return None
+        return self.tz.localize(datetime.combine(day, close))
+
+    def open_datetime(self, day):
+        """当天开盘时间 (ET，提前收盘日同样为 9:30)，非交易日返回 None"""
+        if not self.is_trading_day(day):
+            return None
+        return self.tz.localize(datetime.combine(day, REGULAR_OPEN))
+
+    def next_trading_day(self, day):
+        """day 之后 (不含) 的第一个交易日"""
+        day += timedelta(days=1)
+        while not self.is_trading_day(day):
+            day += timedelta(days=1)
+        return day
+
+    def previous_trading_day(self, day):
+        """day 之前 (不含) 的最后一个交易日"""
+        day -= timedelta(days=1)
+        while not self.is_trading_day(day):
+            day -= timedelta(days=1)
+        return day
+
+    def is_last_trading_day_of_week(self, day):
+        return self.is_trading_day(day) and self.next_trading_day(day).isocalendar()[:2] != day.isocalendar()[:2]
+
+    def is_last_trading_day_of_month(self, day):
+        next_day = self.next_trading_day(day)
+        return self.is_trading_day(day) and (next_day.month, next_day.year) != (day.month, day.year)
+
+    def trading_days(self, start, end):
+        """[start, end] 区间内的全部交易日"""
+        day = start
+        while day <= end:
+            if self.is_trading_day(day):
+                yield day
+            day += timedelta(days=1)